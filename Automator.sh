@@ -27,12 +27,6 @@ log "Activating the virtual environment for RedditVideoMakerBot."
 source ~/RedditVideoMakerBot-master/venvDigger/bin/activate
 
 
-#Run ElevenLabsKeyRotator
-python3 ~/RedditVideoMakerBot-master/elevenLabsKeyRotator.py 2>&1 | tee -a "$LOG_FILE"
-
-sleep 60
-
-
 # Run the Python script
 log "Running main.py"
 python3 ~/RedditVideoMakerBot-master/main.py 2>&1 | tee -a "$LOG_FILE"
@@ -5,6 +5,7 @@ from pathlib import Path
 import tomlkit
 from flask import (
     Flask,
+    jsonify,
     redirect,
     render_template,
     request,
@@ -13,6 +14,7 @@ from flask import (
 )
 
 import utils.gui_utils as gui
+from utils.ffmpeg_progress import read_status
 
 # Set the hostname
 HOST = "localhost"
@@ -91,6 +93,18 @@ def videos_json():
     return send_from_directory("video_creation/data", "videos.json")
 
 
+# Make the progress of the running renders accessible, merged from every process
+@app.route("/render_status.json")
+def render_status_json():
+    return jsonify(read_status())
+
+
+# Make the timings and encode speed of the past jobs accessible
+@app.route("/metrics.jsonl")
+def metrics_jsonl():
+    return send_from_directory("results", "metrics.jsonl")
+
+
 # Make backgrounds.json accessible
 @app.route("/backgrounds.json")
 def backgrounds_json():
@@ -1,16 +1,21 @@
 import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
 
 from gtts import gTTS
 
 from utils import settings
 
+# Requests to Google Translate running at once in run_many
+WORKERS = 4
+
 
 class GTTS:
     def __init__(self):
         self.max_chars = 5000
         self.voices = []
 
-    def run(self, text, filepath):
+    def run(self, text, filepath, random_voice: bool = False):
         tts = gTTS(
             text=text,
             lang=settings.config["reddit"]["thread"]["post_lang"] or "en",
@@ -18,5 +23,12 @@ class GTTS:
         )
         tts.save(filepath)
 
+    def run_many(self, items: List[Tuple[str, str]], random_voice: bool = False):
+        """Saves each (text, filepath), several requests at a time."""
+        with ThreadPoolExecutor(min(len(items), WORKERS) or 1) as executor:
+            futures = [executor.submit(self.run, text, filepath) for text, filepath in items]
+        for future in futures:
+            future.result()  # raises the error of a failed request
+
     def randomvoice(self):
         return random.choice(self.voices)
@@ -1,14 +1,33 @@
 # documentation for tiktok api: https://github.com/oscie57/tiktok-voice/wiki
 import base64
 import random
+import threading
 import time
-from typing import Final, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Final, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from utils import settings
 
-__all__ = ["TikTok", "TikTokTTSException"]
+__all__ = ["TikTok", "TikTokTTSException", "SessionPool"]
+
+# (connect, read) timeouts of a request, in seconds
+TIMEOUT: Final[tuple] = (5, 30)
+# Retries of the HTTP adapter on connection errors and throttled or failed responses. The waits
+# grow as BACKOFF_FACTOR * 2 ** retry, up to Retry's own maximum of 120 s
+RETRIES: Final[int] = 3
+BACKOFF_FACTOR: Final[float] = 1
+RETRY_STATUSES: Final[tuple] = (429, 500, 502, 503, 504)
+# A session that failed rests for COOLDOWN_S * 2 ** (failures - 1), at most MAX_COOLDOWN_S
+COOLDOWN_S: Final[float] = 30
+MAX_COOLDOWN_S: Final[float] = 15 * 60
+# Requests running at once in run_many, one per session at most
+MAX_WORKERS: Final[int] = 8
+# Codes of the API caused by the request rather than by the session, see TikTokTTSException
+REQUEST_ERRORS: Final[tuple] = (2, 4)
 
 disney_voices: Final[tuple] = (
     "en_us_ghostface",  # Ghost Face
@@ -76,6 +95,68 @@ vocals: Final[tuple] = (
 )
 
 
+class SessionPool:
+    """The TikTok session ids of settings.tts.tiktok_sessionid, handed out round-robin.
+
+    A session whose request failed is skipped until its cooldown is over, the cooldown doubling
+    with every failure in a row. When every session is cooling down, the one that is ready first
+    is used anyway. Thread safe, so parallel requests are spread over the sessions.
+
+    Args:
+        sessionids (list[str]): The session ids
+    """
+
+    def __init__(self, sessionids: List[str]):
+        self.sessionids = sessionids
+        self.failures: Dict[str, int] = {sessionid: 0 for sessionid in sessionids}
+        self.ready_at: Dict[str, float] = {sessionid: 0.0 for sessionid in sessionids}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.sessionids)
+
+    def acquire(self) -> str:
+        with self._lock:
+            now = time.monotonic()
+            for i in range(len(self.sessionids)):
+                sessionid = self.sessionids[(self._next + i) % len(self.sessionids)]
+                if self.ready_at[sessionid] <= now:
+                    self._next = (self._next + i + 1) % len(self.sessionids)
+                    return sessionid
+            return min(self.sessionids, key=self.ready_at.__getitem__)
+
+    def succeeded(self, sessionid: str) -> None:
+        with self._lock:
+            self.failures[sessionid] = 0
+            self.ready_at[sessionid] = 0.0
+
+    def failed(self, sessionid: str) -> None:
+        with self._lock:
+            self.failures[sessionid] += 1
+            cooldown = min(COOLDOWN_S * 2 ** (self.failures[sessionid] - 1), MAX_COOLDOWN_S)
+            self.ready_at[sessionid] = time.monotonic() + cooldown
+
+    def __repr__(self) -> str:
+        healthy = sum(not failures for failures in self.failures.values())
+        return f"SessionPool({healthy}/{len(self)} healthy)"
+
+
+# Shared by every TikTok instance of the process, so the health of the sessions carries over
+_pools: Dict[str, SessionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def session_pool() -> SessionPool:
+    """The pool of the comma separated session ids in settings.tts.tiktok_sessionid."""
+    setting = settings.config["settings"]["tts"]["tiktok_sessionid"]
+    with _pools_lock:
+        if setting not in _pools:
+            sessionids = [sessionid.strip() for sessionid in setting.split(",")]
+            _pools[setting] = SessionPool([sessionid for sessionid in sessionids if sessionid])
+        return _pools[setting]
+
+
 class TikTok:
     """TikTok Text-to-Speech Wrapper"""
 
@@ -83,15 +164,29 @@ class TikTok:
         headers = {
             "User-Agent": "com.zhiliaoapp.musically/2022600030 (Linux; U; Android 7.1.2; es_ES; SM-G988N; "
             "Build/NRD90M;tt-ok/3.12.13.1)",
-            "Cookie": f"sessionid={settings.config['settings']['tts']['tiktok_sessionid']}",
         }
 
         self.URI_BASE = "https://api16-normal-c-useast1a.tiktokv.com/media/api/text/speech/invoke/"
         self.max_chars = 200
+        self.sessions = session_pool()
+        self.workers = max(1, min(len(self.sessions), MAX_WORKERS))
 
         self._session = requests.Session()
         # set the headers to the session, so we don't have to do it for every request
         self._session.headers = headers
+        # Keep the connections to the API open and retry with a growing backoff
+        retry = Retry(
+            total=RETRIES,
+            backoff_factor=BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=None,  # the API is called with POST
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=max(4, self.workers), max_retries=retry
+        )
+        self._session.mount("https://", adapter)
 
     def run(self, text: str, filepath: str, random_voice: bool = False):
         if random_voice:
@@ -122,8 +217,22 @@ class TikTok:
         with open(filepath, "wb") as out:
             out.write(decoded_voices)
 
+    def run_many(self, items: List[Tuple[str, str]], random_voice: bool = False):
+        """Saves each (text, filepath), as many at a time as there are sessions (up to
+        MAX_WORKERS), so the requests are spread over the session pool."""
+        with ThreadPoolExecutor(min(len(items), self.workers) or 1) as executor:
+            futures = [
+                executor.submit(self.run, text, filepath, random_voice) for text, filepath in items
+            ]
+        for future in futures:
+            future.result()  # raises the error of a failed chunk
+
     def get_voices(self, text: str, voice: Optional[str] = None) -> dict:
-        """If voice is not passed, the API will try to use the most fitting voice"""
+        """If voice is not passed, the API will try to use the most fitting voice.
+
+        A session whose request fails, or gets an error the text isn't the cause of, is cooled
+        down and the request is sent again with the next session, once per session.
+        """
         # sanitize text
         text = text.replace("+", "plus").replace("&", "and").replace("r/", "")
 
@@ -133,14 +242,31 @@ class TikTok:
         if voice is not None:
             params["text_speaker"] = voice
 
-        # send request
-        try:
-            response = self._session.post(self.URI_BASE, params=params)
-        except ConnectionError:
-            time.sleep(random.randrange(1, 7))
-            response = self._session.post(self.URI_BASE, params=params)
-
-        return response.json()
+        data: Optional[dict] = None
+        error: Optional[Exception] = None
+        for _ in range(len(self.sessions)):
+            sessionid = self.sessions.acquire()
+            try:
+                response = self._session.post(
+                    self.URI_BASE,
+                    params=params,
+                    cookies={"sessionid": sessionid},
+                    timeout=TIMEOUT,
+                )
+                response.raise_for_status()
+                data = response.json()
+            except (requests.RequestException, ValueError) as e:
+                # out of retries, timed out or not JSON: try the next session
+                self.sessions.failed(sessionid)
+                error = e
+                continue
+            if data.get("status_code", 0) in (0,) + REQUEST_ERRORS:
+                self.sessions.succeeded(sessionid)
+                return data
+            self.sessions.failed(sessionid)
+        if data is None:
+            raise TikTokTTSException(0, f"Every session failed ({self.sessions}): {error}")
+        return data
 
     @staticmethod
     def random_voice() -> str:
@@ -1,10 +1,18 @@
+import json
 import random
-import sys
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
 
+import ffmpeg
 from boto3 import Session
 from botocore.exceptions import BotoCoreError, ClientError, ProfileNotFound
 
 from utils import settings
+from utils.profiling import benchmark_args, record_ffmpeg
+
+__all__ = ["AWSPolly", "AWSPollyException"]
 
 voices = [
     "Brian",
@@ -25,53 +33,155 @@ voices = [
 ]
 
 
+# Polly's limits for one request: characters read, and characters of the SSML with its tags
+MAX_BILLED_CHARS = 3000
+MAX_SSML_CHARS = 6000
+# Pause between the chunks of a batch, so sentences don't blend and the cuts fall in silence
+BREAK_MS = 150
+
+
+class AWSPollyException(Exception):
+    pass
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def polly_client():
+    """The Polly client of the "polly" AWS profile, created once per process.
+
+    Setting up a session and a client takes longer than most requests, and boto3 clients are
+    thread safe.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            try:
+                _client = Session(profile_name="polly").client("polly")
+            except ProfileNotFound as e:
+                raise AWSPollyException(
+                    "You need to install the AWS CLI and configure your profile\n"
+                    "Linux: https://docs.aws.amazon.com/polly/latest/dg/setup-aws-cli.html\n"
+                    "Windows: https://docs.aws.amazon.com/polly/latest/dg/install-voice-plugin2.html"
+                ) from e
+        return _client
+
+
 class AWSPolly:
     def __init__(self):
         self.max_chars = 3000
         self.voices = voices
+        self.batch = settings.config["settings"]["tts"].get("aws_polly_batch", False)
 
     def run(self, text, filepath, random_voice: bool = False):
+        audio = self.synthesize(text, self.voice(random_voice))
+        with open(filepath, "wb") as file:
+            file.write(audio)
+
+    def run_many(self, items: List[Tuple[str, str]], random_voice: bool = False):
+        """Saves each (text, filepath).
+
+        With settings.tts.aws_polly_batch, as many chunks as fit in a request are read in one
+        SSML document, a <mark> before each chunk and a <break> after it. The audio is then cut
+        at the times Polly reports for the marks.
+        """
+        if not self.batch:
+            for text, filepath in items:
+                self.run(text, filepath, random_voice)
+            return
+        for batch in self.batches(items):
+            self.run_batch(batch, self.voice(random_voice))
+
+    def voice(self, random_voice: bool = False) -> str:
+        if random_voice:
+            return self.randomvoice()
+        if not settings.config["settings"]["tts"]["aws_polly_voice"]:
+            raise ValueError(
+                f"Please set the TOML variable AWS_VOICE to a valid voice. options are: {voices}"
+            )
+        return str(settings.config["settings"]["tts"]["aws_polly_voice"]).capitalize()
+
+    def synthesize(
+        self,
+        text: str,
+        voice: str,
+        output_format: str = "mp3",
+        text_type: str = "text",
+        speech_marks: Optional[List[str]] = None,
+    ) -> bytes:
+        """One request to Polly, returns the audio or the speech marks as JSON lines.
+
+        Raises:
+            AWSPollyException: If Polly failed or returned no audio
+        """
+        options = {"SpeechMarkTypes": speech_marks} if speech_marks else {}
         try:
-            session = Session(profile_name="polly")
-            polly = session.client("polly")
-            if random_voice:
-                voice = self.randomvoice()
-            else:
-                if not settings.config["settings"]["tts"]["aws_polly_voice"]:
-                    raise ValueError(
-                        f"Please set the TOML variable AWS_VOICE to a valid voice. options are: {voices}"
-                    )
-                voice = str(settings.config["settings"]["tts"]["aws_polly_voice"]).capitalize()
-            try:
-                # Request speech synthesis
-                response = polly.synthesize_speech(
-                    Text=text, OutputFormat="mp3", VoiceId=voice, Engine="neural"
-                )
-            except (BotoCoreError, ClientError) as error:
-                # The service returned an error, exit gracefully
-                print(error)
-                sys.exit(-1)
-
-            # Access the audio stream from the response
-            if "AudioStream" in response:
-                file = open(filepath, "wb")
-                file.write(response["AudioStream"].read())
-                file.close()
-                # print_substep(f"Saved Text {idx} to MP3 files successfully.", style="bold green")
-
-            else:
-                # The response didn't contain audio data, exit gracefully
-                print("Could not stream audio")
-                sys.exit(-1)
-        except ProfileNotFound:
-            print("You need to install the AWS CLI and configure your profile")
-            print(
-                """
-            Linux: https://docs.aws.amazon.com/polly/latest/dg/setup-aws-cli.html
-            Windows: https://docs.aws.amazon.com/polly/latest/dg/install-voice-plugin2.html
-            """
+            response = polly_client().synthesize_speech(
+                Text=text,
+                TextType=text_type,
+                OutputFormat=output_format,
+                VoiceId=voice,
+                Engine="neural",
+                **options,
             )
-            sys.exit(-1)
+        except (BotoCoreError, ClientError) as error:
+            raise AWSPollyException(f"Polly failed: {error}") from error
+        if "AudioStream" not in response:
+            raise AWSPollyException("Could not stream audio")
+        return response["AudioStream"].read()
+
+    @staticmethod
+    def ssml(text: str, mark: int) -> str:
+        return f'<mark name="{mark}"/>{escape(text)}<break time="{BREAK_MS}ms"/>'
+
+    def batches(self, items: List[Tuple[str, str]]) -> List[List[Tuple[str, str]]]:
+        """Groups consecutive chunks into as few requests as Polly's limits allow."""
+        batches: List[List[Tuple[str, str]]] = []
+        billed = length = 0
+        for text, filepath in items:
+            size = len(self.ssml(text, 999))  # a batch never has that many chunks
+            if not batches or billed + len(text) > MAX_BILLED_CHARS or (
+                length + size > MAX_SSML_CHARS - len("<speak></speak>")
+            ):
+                batches.append([])
+                billed = length = 0
+            batches[-1].append((text, filepath))
+            billed += len(text)
+            length += size
+        return batches
+
+    def run_batch(self, batch: List[Tuple[str, str]], voice: str):
+        ssml = "<speak>" + "".join(self.ssml(text, i) for i, (text, _) in enumerate(batch))
+        ssml += "</speak>"
+        # Speech marks come from a request of their own, both are read with the same timing
+        audio = self.synthesize(ssml, voice, text_type="ssml")
+        marks = [
+            json.loads(line)
+            for line in self.synthesize(ssml, voice, "json", "ssml", ["ssml"]).splitlines()
+            if line.strip()
+        ]
+        starts: Dict[int, float] = {int(mark["value"]): mark["time"] / 1000 for mark in marks}
+        if len(starts) != len(batch):
+            raise AWSPollyException(f"Polly marked {len(starts)} of {len(batch)} chunks")
+        ends = [starts.get(i + 1) for i in range(len(batch))]
+
+        source = Path(batch[0][1]).with_suffix(".batch.mp3")
+        source.write_bytes(audio)
+        branches = ffmpeg.input(str(source)).audio.asplit()
+        outputs = []
+        for i, (_, filepath) in enumerate(batch):
+            trim = {"start": starts[i]} if ends[i] is None else {"start": starts[i], "end": ends[i]}
+            clip = branches[i].filter("atrim", **trim).filter("asetpts", "PTS-STARTPTS")
+            outputs.append(clip.output(filepath))
+        _, stderr = (
+            ffmpeg.merge_outputs(*outputs)
+            .global_args(*benchmark_args())
+            .overwrite_output()
+            .run(quiet=True)
+        )
+        record_ffmpeg("polly_split", stderr)
+        source.unlink()
 
     def randomvoice(self):
         return random.choice(self.voices)
@@ -1,26 +1,155 @@
 import random
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
-from elevenlabs import save
 from elevenlabs.client import ElevenLabs
+from elevenlabs.core.api_error import ApiError
 
 from utils import settings
 
+__all__ = ["elevenlabs", "KeyPool", "QuotaExceeded"]
+
+# How long the voices of an account are kept before they are listed again
+VOICES_TTL_S = 6 * 60 * 60
+# A key that ran out of quota is tried again after this long, or once its quota resets
+EXHAUSTED_S = 60 * 60
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class KeyPool:
+    """The ElevenLabs API keys of settings.tts.elevenlabs_api_key, with the characters left on
+    each.
+
+    The characters used and the limit of a key are read from its subscription the first time it
+    is used, then counted here as texts are read. The first key with enough characters left is
+    used, and a key that gets a quota error is skipped until its quota resets.
+
+    Args:
+        keys (list[str]): The API keys, in the order they are used
+    """
+
+    def __init__(self, keys: List[str]):
+        self.keys = keys
+        self.clients: Dict[str, ElevenLabs] = {}
+        # characters used and limit of each key, None if its subscription can't be read
+        self.usage: Dict[str, Optional[Tuple[int, int]]] = {}
+        self.exhausted_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def client(self, key: str) -> ElevenLabs:
+        with self._lock:
+            if key not in self.clients:
+                self.clients[key] = ElevenLabs(api_key=key)
+            return self.clients[key]
+
+    def _usage(self, key: str) -> Optional[Tuple[int, int]]:
+        if key not in self.usage:
+            try:
+                subscription = self.client(key).user.get_subscription()
+                self.usage[key] = (subscription.character_count, subscription.character_limit)
+                if subscription.character_count >= subscription.character_limit:
+                    self.exhausted_until[key] = subscription.next_character_count_reset_unix
+            except ApiError:  # e.g. a key without the user_read permission
+                self.usage[key] = None
+        return self.usage[key]
+
+    def acquire(self, characters: int) -> str:
+        """The first key with that many characters left.
+
+        Raises:
+            QuotaExceeded: If every key is out of quota
+        """
+        for key in self.keys:
+            usage = self._usage(key)
+            if self.exhausted_until.get(key, 0) > time.time():
+                continue
+            if usage is None or usage[0] + characters <= usage[1]:
+                return key
+        raise QuotaExceeded(f"Every ElevenLabs key is out of quota ({len(self.keys)} keys)")
+
+    def used(self, key: str, characters: int) -> None:
+        with self._lock:
+            usage = self.usage.get(key)
+            if usage is not None:
+                self.usage[key] = (usage[0] + characters, usage[1])
+
+    def exhausted(self, key: str) -> None:
+        """Skips the key until its quota resets."""
+        try:
+            reset = self.client(key).user.get_subscription().next_character_count_reset_unix
+        except ApiError:
+            reset = 0
+        self.exhausted_until[key] = max(reset, time.time() + EXHAUSTED_S)
+
+
+# Shared by every instance of the process, so a key out of quota stays skipped
+_pools: Dict[str, KeyPool] = {}
+_voices: Dict[str, Tuple[float, Dict[str, str]]] = {}
+
+
+def is_quota_error(error: ApiError) -> bool:
+    # ElevenLabs answers 401 with {"detail": {"status": "quota_exceeded", ...}}
+    return "quota_exceeded" in str(error.body)
+
 
 class elevenlabs:
     def __init__(self):
         self.max_chars = 2500
-        self.client: ElevenLabs = None
+        self.keys: KeyPool = None
 
     def run(self, text, filepath, random_voice: bool = False):
-        if self.client is None:
+        if self.keys is None:
             self.initialize()
         if random_voice:
             voice = self.randomvoice()
         else:
             voice = str(settings.config["settings"]["tts"]["elevenlabs_voice_name"]).capitalize()
 
-        audio = self.client.generate(text=text, voice=voice, model="eleven_multilingual_v1")
-        save(audio=audio, filename=filepath)
+        while True:
+            key = self.keys.acquire(len(text))
+            try:
+                self.stream(key, text, voice, filepath)
+            except ApiError as error:
+                if not is_quota_error(error):
+                    raise
+                self.keys.exhausted(key)  # try again with the next key
+                continue
+            self.keys.used(key, len(text))
+            return
+
+    def stream(self, key: str, text: str, voice: str, filepath: str):
+        """Writes the audio to filepath as it arrives, instead of once it is all generated."""
+        voice_id = self.voices(key).get(voice, voice)
+        audio = self.keys.client(key).generate(
+            text=text, voice=voice_id, model="eleven_multilingual_v1", stream=True
+        )
+        # A failed stream doesn't leave half a clip behind
+        part = Path(f"{filepath}.part")
+        try:
+            with open(part, "wb") as f:
+                for chunk in audio:
+                    f.write(chunk)
+        except BaseException:
+            part.unlink(missing_ok=True)
+            raise
+        part.replace(filepath)
+
+    def voices(self, key: str) -> Dict[str, str]:
+        """The voice ids by name of the key's account, listed once every VOICES_TTL_S.
+
+        Given a name, generate would list them on every call to find its id.
+        """
+        listed_at, voices = _voices.get(key, (0.0, {}))
+        if time.time() - listed_at > VOICES_TTL_S:
+            response = self.keys.client(key).voices.get_all()
+            voices = {voice.name: voice.voice_id for voice in response.voices}
+            _voices[key] = (time.time(), voices)
+        return voices
 
     def initialize(self):
         if settings.config["settings"]["tts"]["elevenlabs_api_key"]:
@@ -30,9 +159,11 @@ class elevenlabs:
                 "You didn't set an Elevenlabs API key! Please set the config variable ELEVENLABS_API_KEY to a valid API key."
             )
 
-        self.client = ElevenLabs(api_key=api_key)
+        if api_key not in _pools:
+            _pools[api_key] = KeyPool([key.strip() for key in api_key.split(",") if key.strip()])
+        self.keys = _pools[api_key]
 
     def randomvoice(self):
-        if self.client is None:
+        if self.keys is None:
             self.initialize()
-        return random.choice(self.client.voices.get_all().voices).voice_name
+        return random.choice(list(self.voices(self.keys.keys[0])))
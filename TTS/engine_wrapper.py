@@ -1,18 +1,20 @@
+import logging
 import os
 import re
 from pathlib import Path
-from typing import Tuple
+from typing import List, Tuple
 
 import numpy as np
-import translators
 from moviepy.audio.AudioClip import AudioClip
 from moviepy.audio.fx.volumex import volumex
 from moviepy.editor import AudioFileClip
-from rich.progress import track
 
+from TTS.speech_rate import SpeechRateModel
 from utils import settings
-from utils.console import print_step, print_substep
-from utils.voice import sanitize_text
+from utils.console import print_step, print_substep, track
+from utils.voice import pack_text, sanitize_text
+
+logger = logging.getLogger(__name__)
 
 DEFAULT_MAX_LENGTH: int = (
     5  # Video length variable, edit this on your own risk. It should work, but it's not supported
@@ -48,6 +50,7 @@ class TTSEngine:
         self.max_length = max_length
         self.length = 0
         self.last_clip_length = last_clip_length
+        self.rates = SpeechRateModel(self.tts_module)
 
     def add_periods(
         self,
@@ -82,83 +85,93 @@ class TTSEngine:
                 else:
                     self.call_tts("postaudio", process_text(self.reddit_object["thread_post"]))
             elif settings.config["settings"]["storymodemethod"] == 1:
-                for idx, text in track(enumerate(self.reddit_object["thread_post"])):
-                    self.call_tts(f"postaudio-{idx}", process_text(text))
+                self.call_tts_many(
+                    [
+                        (f"postaudio-{idx}", process_text(text))
+                        for idx, text in enumerate(self.reddit_object["thread_post"])
+                    ]
+                )
+                idx = max(len(self.reddit_object["thread_post"]) - 1, 0)
 
         else:
-            for idx, comment in track(enumerate(self.reddit_object["comments"]), "Saving..."):
-                # ! Stop creating mp3 files if the length is greater than max length.
-                if self.length > self.max_length and idx > 1:
-                    self.length -= self.last_clip_length
-                    idx -= 1
+            comments = self.reddit_object["comments"]
+            planned = self.plan_comments()
+            print_substep(
+                f"{planned} comment(s) should fit in {self.max_length}s ({self.rates})",
+                style="bold blue",
+            )
+            # Comments are read in order, the first one always. The plan is checked against the
+            # real durations: a comment that turns out too long is dropped, and if there is time
+            # left the next comments are tried as long as they are estimated to fit.
+            for idx, comment in track(enumerate(comments), "Saving...", total=len(comments)):
+                if idx > 0 and self.length + self.estimate(comment) > self.max_length:
                     break
+                length_before = self.length
                 if (
                     len(comment["comment_body"]) > self.tts_module.max_chars
                 ):  # Split the comment if it is too long
                     self.split_post(comment["comment_body"], idx)  # Split the comment
                 else:  # If the comment is not too long, just call the tts engine
                     self.call_tts(f"{idx}", process_text(comment["comment_body"]))
+                if idx > 0 and self.length > self.max_length:
+                    self.length = length_before
+                    break
+            else:
+                idx = len(comments)
 
+        self.rates.save()
         print_substep("Saved Text to MP3 files successfully.", style="bold green")
         return self.length, idx
 
+    def estimate(self, comment: dict) -> float:
+        """Seconds the provider should take to read the comment, see SpeechRateModel."""
+        text = comment["comment_body"]
+        if len(text) <= self.tts_module.max_chars:
+            return self.rates.estimate(len(text))
+        chunks = self.split_text(text)
+        silence = float(settings.config["settings"]["tts"]["silence_duration"])
+        return self.rates.estimate(sum(map(len, chunks)), len(chunks)) + len(chunks) * silence
+
+    def plan_comments(self) -> int:
+        """How many comments are estimated to fit in max_length, before any of them is read."""
+        planned, length = 0, self.length
+        for comment in self.reddit_object["comments"]:
+            length += self.estimate(comment)
+            if planned > 0 and length > self.max_length:
+                break
+            planned += 1
+        return planned
+
    
+    def split_text(self, text: str) -> List[str]:
+        """Packs the text into chunks of up to the provider's max_chars, see pack_text."""
+        return pack_text(text, self.tts_module.max_chars)
+
     def split_post(self, text: str, idx):
         split_files = []
-        
-        # Split text into smaller chunks
-        split_text = []
-        current_chunk = ""
-        char_count = 0
-        
-        # Define splitting points
-        split_chars = ['.', ',', '!', '?', ':', ';', '\n']
-        max_chunk_size = 45
-
-        for char in text:
-            current_chunk += char
-            char_count += 1
-            
-            # Check for split conditions
-            if char in split_chars or char_count >= max_chunk_size:
-                # If chunk is not empty and not just whitespace
-                if current_chunk.strip():
-                    split_text.append(current_chunk.strip())
-                    print(f"Split chunk: '{current_chunk.strip()}' (length: {len(current_chunk.strip())})")
-                current_chunk = ""
-                char_count = 0
-            
-            # Force split if max size is reached without finding a split char
-            if char_count == max_chunk_size:
-                if current_chunk.strip():
-                    split_text.append(current_chunk.strip())
-                    print(f"Forced split: '{current_chunk.strip()}' (length: {len(current_chunk.strip())})")
-                current_chunk = ""
-                char_count = 0
-
-        # Add any remaining text
-        if current_chunk.strip():
-            split_text.append(current_chunk.strip())
-            print(f"Final chunk: '{current_chunk.strip()}' (length: {len(current_chunk.strip())})")
-
-        print(f"Total chunks: {len(split_text)}")
+        split_text = self.split_text(text)
+        logger.debug("Split %s into %d chunk(s)", idx, len(split_text))
 
         self.create_silence_mp3()
+        # Start from an empty list, a crashed earlier run may have left one behind
+        open(f"{self.path}/list.txt", "w").close()
 
-        idy = None
+        parts = []
         for idy, text_cut in enumerate(split_text):
             newtext = process_text(text_cut)
             
             if not newtext or newtext.isspace():
-                print(f"Chunk {idy} was blank after processing")
+                logger.debug("Chunk %d was blank after processing", idy)
                 continue
             else:
-                print(f"Processing chunk {idy}: '{newtext}' (length: {len(newtext)})")
-                self.call_tts(f"{idx}-{idy}.part", newtext)
-                with open(f"{self.path}/list.txt", "a") as f:
-                    f.write(f"file '{idx}-{idy}.part.mp3'\n")
-                    f.write("file 'silence.mp3'\n")
-                split_files.append(str(f"{self.path}/{idx}-{idy}.part.mp3"))
+                logger.debug("Processing chunk %d (%d characters): %r", idy, len(newtext), newtext)
+                parts.append((f"{idx}-{idy}.part", newtext))
+        self.call_tts_many(parts)
+        for filename, _ in parts:
+            with open(f"{self.path}/list.txt", "a") as f:
+                f.write(f"file '{filename}.mp3'\n")
+                f.write("file 'silence.mp3'\n")
+            split_files.append(str(f"{self.path}/{filename}.mp3"))
 
         # Combine all parts into a single MP3
         os.system(
@@ -173,11 +186,11 @@ class TTSEngine:
                 os.unlink(file)
             os.unlink(f"{self.path}/list.txt")
         except FileNotFoundError as e:
-            print(f"File not found: {e.filename}")
+            logger.warning("File not found: %s", e.filename)
         except OSError as e:
-            print(f"OSError: {e}")
+            logger.warning("Could not remove the chunks: %s", e)
 
-        print(f"Finished processing {len(split_files)} audio chunks")
+        logger.debug("Finished processing %d audio chunks", len(split_files))
 
 
     def call_tts(self, filename: str, text: str):
@@ -186,6 +199,25 @@ class TTSEngine:
             filepath=f"{self.path}/{filename}.mp3",
             random_voice=settings.config["settings"]["tts"]["random_voice"],
         )
+        self.measure(filename, text)
+
+    def call_tts_many(self, parts: List[Tuple[str, str]]):
+        """Saves each (filename, text), in one go if the provider has a run_many method.
+
+        run_many takes a list of (text, filepath) and the random_voice keyword, like run.
+        """
+        if not hasattr(self.tts_module, "run_many"):
+            for filename, text in parts:
+                self.call_tts(filename, text)
+            return
+        self.tts_module.run_many(
+            [(text, f"{self.path}/{filename}.mp3") for filename, text in parts],
+            random_voice=settings.config["settings"]["tts"]["random_voice"],
+        )
+        for filename, text in parts:
+            self.measure(filename, text)
+
+    def measure(self, filename: str, text: str):
         # try:
         #     self.length += MP3(f"{self.path}/{filename}.mp3").info.length
         # except (MutagenError, HeaderNotFoundError):
@@ -194,6 +226,7 @@ class TTSEngine:
             clip = AudioFileClip(f"{self.path}/{filename}.mp3")
             self.last_clip_length = clip.duration
             self.length += clip.duration
+            self.rates.observe(len(text), clip.duration)
             clip.close()
         except:
             self.length = 0
@@ -214,6 +247,8 @@ def process_text(text: str, clean: bool = True):
     new_text = sanitize_text(text) if clean else text
     if lang:
         print_substep("Translating Text...")
+        import translators  # slow to import, only needed for post_lang
+
         translated_text = translators.translate_text(text, translator="google", to_language=lang)
         new_text = sanitize_text(translated_text)
     return new_text
@@ -1,4 +1,5 @@
 import random
+from typing import List, Tuple
 
 import pyttsx3
 
@@ -16,6 +17,26 @@ class pyttsx:
         filepath: str,
         random_voice=False,
     ):
+        self.run_many([(text, filepath)], random_voice)
+
+    def run_many(self, items: List[Tuple[str, str]], random_voice=False):
+        """Saves each (text, filepath), queued on one engine loop.
+
+        Starting the loop takes longer than most utterances, so it runs once for all of them.
+        """
+        voice_id = self.voice_id()
+        engine = pyttsx3.init()
+        voices = engine.getProperty("voices")
+        for text, filepath in items:
+            if random_voice:
+                voice_id = self.randomvoice()
+            engine.setProperty(
+                "voice", voices[voice_id].id
+            )  # changing index changes voices but ony 0 and 1 are working here
+            engine.save_to_file(text, f"{filepath}")
+        engine.runAndWait()
+
+    def voice_id(self) -> int:
         voice_id = settings.config["settings"]["tts"]["python_voice"]
         voice_num = settings.config["settings"]["tts"]["py_voice_num"]
         if voice_id == "" or voice_num == "":
@@ -25,18 +46,8 @@ class pyttsx:
         else:
             voice_id = int(voice_id)
             voice_num = int(voice_num)
-        for i in range(voice_num):
-            self.voices.append(i)
-            i = +1
-        if random_voice:
-            voice_id = self.randomvoice()
-        engine = pyttsx3.init()
-        voices = engine.getProperty("voices")
-        engine.setProperty(
-            "voice", voices[voice_id].id
-        )  # changing index changes voices but ony 0 and 1 are working here
-        engine.save_to_file(text, f"{filepath}")
-        engine.runAndWait()
+        self.voices = list(range(voice_num))
+        return voice_id
 
     def randomvoice(self):
         return random.choice(self.voices)
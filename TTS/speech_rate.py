@@ -0,0 +1,119 @@
+import json
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+from utils import settings
+
+__all__ = ["SpeechRateModel"]
+
+RATES_PATH = "assets/cache/speech_rates.json"
+# Until a voice has a few clips, estimate with the speed of an average English voice
+DEFAULT_SECONDS_PER_CHAR = 1 / 15
+DEFAULT_OVERHEAD_S = 0.3
+MIN_SAMPLES = 5
+# Older clips count less once a voice has this many, so the model follows changes of the voice
+MAX_SAMPLES = 500
+
+# The setting holding the voice of each provider class, None for providers with a single voice
+VOICE_SETTINGS = {
+    "TikTok": "tiktok_voice",
+    "AWSPolly": "aws_polly_voice",
+    "StreamlabsPolly": "streamlabs_polly_voice",
+    "elevenlabs": "elevenlabs_voice_name",
+    "pyttsx": "python_voice",
+}
+
+_lock = threading.Lock()
+
+
+def _empty_sums() -> Dict[str, float]:
+    return {"n": 0, "x": 0, "y": 0, "xx": 0, "xy": 0}
+
+
+def _halve(sums: Dict[str, float]) -> None:
+    for name in sums:
+        sums[name] /= 2
+
+
+class SpeechRateModel:
+    """Predicts how long a provider's voice takes to say a text, from the clips it made before.
+
+    A least squares fit of seconds = overhead + seconds_per_char * characters, kept as running
+    sums per provider and voice in assets/cache/speech_rates.json. The clips observed since the
+    last save are kept apart too, so models of jobs running at the same time add up their
+    clips when they save instead of overwriting each other's.
+
+    Args:
+        tts_module: The TTS provider instance
+    """
+
+    def __init__(self, tts_module):
+        provider = type(tts_module).__name__
+        tts = settings.config["settings"]["tts"]
+        if tts.get("random_voice"):
+            voice = "random"
+        else:
+            voice = tts.get(VOICE_SETTINGS.get(provider, ""), "") or "default"
+        self.key = f"{provider}:{voice}"
+        self.sums = self._load().get(self.key, _empty_sums())
+        self.unsaved = _empty_sums()
+
+    @staticmethod
+    def _load() -> Dict[str, dict]:
+        try:
+            with open(RATES_PATH, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def observe(self, characters: int, seconds: float) -> None:
+        """Learns from a clip the voice made."""
+        if self.sums["n"] >= MAX_SAMPLES:
+            _halve(self.sums)
+        for sums in (self.sums, self.unsaved):
+            sums["n"] += 1
+            sums["x"] += characters
+            sums["y"] += seconds
+            sums["xx"] += characters * characters
+            sums["xy"] += characters * seconds
+
+    def coefficients(self) -> Tuple[float, float]:
+        """(overhead in seconds, seconds per character)"""
+        n, x, y, xx, xy = (self.sums[name] for name in ("n", "x", "y", "xx", "xy"))
+        if n < MIN_SAMPLES or not x:
+            return DEFAULT_OVERHEAD_S, DEFAULT_SECONDS_PER_CHAR
+        variance = n * xx - x * x
+        if variance > 0:
+            per_char = (n * xy - x * y) / variance
+            overhead = (y - per_char * x) / n
+            if per_char > 0 and overhead >= 0:
+                return overhead, per_char
+        # The clips are all about as long, or the fit makes no sense: use the average rate
+        return 0.0, y / x
+
+    def estimate(self, characters: int, clips: int = 1) -> float:
+        """Seconds the voice takes to say that many characters, in that many clips."""
+        overhead, per_char = self.coefficients()
+        return clips * overhead + characters * per_char
+
+    def save(self) -> None:
+        path = Path(RATES_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Several videos may run TTS at once, each with its own model
+        with _lock:
+            rates = self._load()
+            stored = rates.get(self.key, _empty_sums())
+            sums = {name: stored[name] + self.unsaved[name] for name in stored}
+            while sums["n"] > MAX_SAMPLES:
+                _halve(sums)
+            rates[self.key] = sums
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(rates, f, indent=4)
+            tmp_path.replace(path)
+            self.sums, self.unsaved = sums, _empty_sums()
+
+    def __repr__(self) -> str:
+        overhead, per_char = self.coefficients()
+        return f"SpeechRateModel({self.key}: {overhead:.2f}s + {1 / per_char:.1f} chars/s)"
@@ -1,10 +1,39 @@
 import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import JSONDecodeError
 
 from utils import settings
-from utils.voice import check_ratelimit
+from utils.voice import TokenBucket
+
+# (connect, read) timeouts of a request, in seconds
+TIMEOUT = (5, 30)
+# Tries of a chunk, the ones limited by Streamlabs or failed by the network included
+MAX_ATTEMPTS = 5
+# Network errors worth another try
+RETRIED_ERRORS = (requests.ConnectionError, requests.Timeout)
+# Downloads of finished clips running while the next chunks are sent
+DOWNLOADS = 4
+
+# Shared by every instance and thread of the process: the connections to Streamlabs and to the
+# storage of the clips are kept open, and all requests count against the same rate limit
+_session = requests.Session()
+_session.headers["Referer"] = "https://streamlabs.com/"
+_session.mount("https://", HTTPAdapter(pool_maxsize=DOWNLOADS + 1))
+_buckets = {}
+
+
+def rate_limiter() -> TokenBucket:
+    """The token bucket of settings.tts.streamlabs_rate and streamlabs_burst."""
+    tts = settings.config["settings"]["tts"]
+    key = (float(tts.get("streamlabs_rate", 1)), int(tts.get("streamlabs_burst", 3)))
+    if key not in _buckets:
+        _buckets[key] = TokenBucket(rate=key[0], capacity=key[1])
+    return _buckets[key]
 
 voices = [
     "Brian",
@@ -35,33 +64,74 @@ class StreamlabsPolly:
         self.voices = voices
 
     def run(self, text, filepath, random_voice: bool = False):
-        if random_voice:
-            voice = self.randomvoice()
-        else:
-            if not settings.config["settings"]["tts"]["streamlabs_polly_voice"]:
-                raise ValueError(
-                    f"Please set the config variable STREAMLABS_POLLY_VOICE to a valid voice. options are: {voices}"
-                )
-            voice = str(settings.config["settings"]["tts"]["streamlabs_polly_voice"]).capitalize()
+        speak_url = self.speak(text, self.voice(random_voice))
+        if speak_url is not None:
+            self.download(speak_url, filepath)
 
-        body = {"voice": voice, "text": text, "service": "polly"}
-        headers = {"Referer": "https://streamlabs.com/"}
-        response = requests.post(self.url, headers=headers, data=body)
+    def run_many(self, items: List[Tuple[str, str]], random_voice: bool = False):
+        """Saves each (text, filepath), downloading the finished clips while the next chunks
+        are sent to Streamlabs."""
+        with ThreadPoolExecutor(DOWNLOADS, thread_name_prefix="streamlabs") as executor:
+            downloads = []
+            for text, filepath in items:
+                speak_url = self.speak(text, self.voice(random_voice))
+                if speak_url is not None:
+                    downloads.append(executor.submit(self.download, speak_url, filepath))
+        for download in downloads:
+            download.result()  # raises the error of a failed download
 
-        if not check_ratelimit(response):
-            self.run(text, filepath, random_voice)
+    def voice(self, random_voice: bool = False) -> str:
+        if random_voice:
+            return self.randomvoice()
+        if not settings.config["settings"]["tts"]["streamlabs_polly_voice"]:
+            raise ValueError(
+                f"Please set the config variable STREAMLABS_POLLY_VOICE to a valid voice. options are: {voices}"
+            )
+        return str(settings.config["settings"]["tts"]["streamlabs_polly_voice"]).capitalize()
+
+    def speak(self, text: str, voice: str) -> Optional[str]:
+        """Sends the text to Streamlabs, waiting out its rate limit.
 
+        Returns:
+            str: The URL of the clip, None if Streamlabs failed
+        """
+        body = {"voice": voice, "text": text, "service": "polly"}
+        bucket = rate_limiter()
+        for _ in range(MAX_ATTEMPTS):
+            bucket.acquire()
+            try:
+                response = _session.post(self.url, data=body, timeout=TIMEOUT)
+            except RETRIED_ERRORS as e:
+                bucket.pause_until(time.time() + bucket.pause, f"Streamlabs Polly failed ({e})")
+                continue
+            if bucket.update(response):
+                break
         else:
+            print("Streamlabs Polly kept limiting or failing the requests")
+            return None
+
+        try:
+            return response.json()["speak_url"]
+        except (KeyError, JSONDecodeError):
             try:
-                voice_data = requests.get(response.json()["speak_url"])
-                with open(filepath, "wb") as f:
-                    f.write(voice_data.content)
+                if response.json()["error"] == "No text specified!":
+                    raise ValueError("Please specify a text to convert to speech.")
             except (KeyError, JSONDecodeError):
-                try:
-                    if response.json()["error"] == "No text specified!":
-                        raise ValueError("Please specify a text to convert to speech.")
-                except (KeyError, JSONDecodeError):
-                    print("Error occurred calling Streamlabs Polly")
+                print("Error occurred calling Streamlabs Polly")
+        return None
+
+    @staticmethod
+    def download(speak_url: str, filepath: str):
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                voice_data = _session.get(speak_url, timeout=TIMEOUT)
+                break
+            except RETRIED_ERRORS:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                time.sleep(rate_limiter().pause)
+        with open(filepath, "wb") as f:
+            f.write(voice_data.content)
 
     def randomvoice(self):
         return random.choice(self.voices)
@@ -0,0 +1,466 @@
+#!/usr/bin/env python
+"""Offline end-to-end benchmark of the video pipeline.
+
+Runs TTS (with the stub provider), the background chop, the render and, when the Vosk model is
+already downloaded, the captions on a synthetic thread, for every combination of comment count
+and resolution given, once per encoder profile. Reddit, the screenshots and the background
+downloads are replaced by fixtures: comment PNGs drawn with PIL and backgrounds generated with
+ffmpeg's testsrc, so only ffmpeg and the Python requirements are needed, no network.
+
+Everything runs in a sandbox directory, so results/ and videos.json are left alone. The timings
+are compared with a baseline JSON, recorded by the first run, and the exit code is 1 if a stage
+got slower than the tolerance allows.
+
+It also checks that importing main.py (measured with python -X importtime) stays within a
+startup budget, the heavy modules are meant to be imported by the stages that need them. The same
+check runs with the tests, in tests/test_startup.py.
+
+Usage:
+    python benchmark.py --comments 3,10 --resolutions 1080x1920,720x1280
+    python benchmark.py --comments 6 --profiles draft,shorts,archive
+    python benchmark.py --packing 200,550,2500,3000
+    python benchmark.py --startup-only
+    python benchmark.py --smoke
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import ffmpeg
+import toml
+from PIL import Image, ImageDraw, ImageFont
+
+from utils import settings
+from utils.console import print_step, print_substep
+from utils.encoding import encoder_args
+from utils.metrics import JobMetrics
+
+REPO = Path(__file__).resolve().parent
+DEFAULT_BASELINE = REPO / "video_creation/data/benchmark_baseline.json"
+DEFAULT_OUTPUT = REPO / "results/benchmark.json"
+
+# Background configs in the format of utils/background_videos.json and background_audios.json
+BACKGROUND_VIDEO = ("", "testsrc.mp4", "benchmark", "center")
+BACKGROUND_AUDIO = ("", "noise.mp3", "benchmark")
+
+COMMENT = (
+    "This is synthetic comment number {i}. It is long enough to wrap over a few lines, so the "
+    "screenshot and the audio have about the size of a real comment."
+)
+# A long comment for the TTS packing benchmark, about 1500 characters
+LONG_COMMENT = " ".join(
+    COMMENT.format(i=i) + " Some people, though, write in long clauses; others don't!"
+    for i in range(8)
+)
+# Slower stages than this are not flagged, whatever the ratio, their timings are mostly noise
+NOISE_FLOOR_S = 0.5
+STARTUP_BUDGET_S = 1.5
+# Small enough for --smoke to take seconds
+SMOKE_RESOLUTION = (360, 640)
+
+
+def synthetic_reddit_object(comments: int, reddit_id: str) -> dict:
+    """A reddit object as returned by get_subreddit_threads, with `comments` comments."""
+    return {
+        "thread_url": f"https://www.reddit.com/r/benchmark/comments/{reddit_id}/",
+        "thread_title": f"Benchmark thread with {comments} comments",
+        "thread_id": reddit_id,
+        "is_nsfw": False,
+        "thread_post": "",
+        "comments": [
+            {"comment_body": COMMENT.format(i=i), "comment_url": "", "comment_id": f"c{i}"}
+            for i in range(comments)
+        ],
+    }
+
+
+def benchmark_config(width: int, height: int, profile: str) -> dict:
+    """The defaults of the config template, set up to run offline."""
+
+    def defaults(table: dict) -> dict:
+        return {
+            key: defaults(value)
+            if all(isinstance(item, dict) for item in value.values())
+            else value.get("default", "")
+            for key, value in table.items()
+        }
+
+    config = defaults(toml.load(REPO / "utils/.config.template.toml"))
+    config["reddit"]["thread"].update(subreddit="benchmark", post_lang="", post_id="")
+    config["ai"].update(ai_cleanup_enabled=False, ai_similarity_enabled=False)
+    config["settings"].update(storymode=False, resolution_w=width, resolution_h=height)
+    config["settings"]["background"].update(
+        background_video=BACKGROUND_VIDEO[2],
+        background_audio=BACKGROUND_AUDIO[2],
+        background_thumbnail=False,
+        enable_extra_audio=False,
+    )
+    config["settings"]["tts"].update(voice_choice="stub", random_voice=False)
+    config["settings"]["encoding"]["profile"] = profile
+    return config
+
+
+def draw_comment(text: str, path: Path) -> None:
+    """Draws a comment card the size of a reddit comment screenshot."""
+    font = ImageFont.truetype(str(REPO / "fonts/Roboto-Regular.ttf"), 30)
+    lines = textwrap.wrap(text, width=40)
+    image = Image.new("RGBA", (720, 60 + 40 * len(lines)), (26, 26, 27, 255))
+    draw = ImageDraw.Draw(image)
+    draw.text((30, 20), "u/benchmark", font=font, fill=(129, 131, 132))
+    for i, line in enumerate(lines):
+        draw.text((30, 60 + 40 * i), line, font=font, fill=(215, 218, 220))
+    image.save(path)
+
+
+def prepare_sandbox(workdir: Path, max_comments: int) -> None:
+    """Creates the files the pipeline expects relative to the working directory."""
+    for directory in (
+        "assets/backgrounds/video",
+        "assets/backgrounds/audio",
+        "video_creation/data",
+        "fixtures/png",
+    ):
+        (workdir / directory).mkdir(parents=True, exist_ok=True)
+    for shared in ("fonts", "assets/title_template.png"):
+        if not (workdir / shared).exists():
+            (workdir / shared).symlink_to(REPO / shared)
+    (workdir / "video_creation/data/videos.json").write_text("[]", encoding="utf-8")
+
+    # Comments are about 9 seconds each, get_start_and_end_times wants some slack on top
+    seconds = 60 + 10 * max_comments
+    video = workdir / f"assets/backgrounds/video/{BACKGROUND_VIDEO[2]}-{BACKGROUND_VIDEO[1]}"
+    audio = workdir / f"assets/backgrounds/audio/{BACKGROUND_AUDIO[2]}-{BACKGROUND_AUDIO[1]}"
+    if not video.exists() or float(ffmpeg.probe(str(video))["format"]["duration"]) < seconds:
+        print_substep(f"Generating a {seconds}s test background video...")
+        ffmpeg.input(f"testsrc=size=1920x1080:rate=30:duration={seconds}", f="lavfi").output(
+            str(video), vcodec="libx264", preset="ultrafast", pix_fmt="yuv420p"
+        ).overwrite_output().run(quiet=True)
+    if not audio.exists() or float(ffmpeg.probe(str(audio))["format"]["duration"]) < seconds:
+        print_substep(f"Generating a {seconds}s test background audio...")
+        ffmpeg.input(f"anoisesrc=color=pink:seed=1:duration={seconds}", f="lavfi").output(
+            str(audio), **{"b:a": "128k"}
+        ).overwrite_output().run(quiet=True)
+
+    for i in range(max_comments + 1):
+        png = workdir / f"fixtures/png/comment_{i}.png"
+        if not png.exists():
+            draw_comment(COMMENT.format(i=i), png)
+
+
+def captions_available() -> bool:
+    """Whether captionGen can run without downloading its model."""
+    try:
+        import captionGen
+    except ImportError:
+        return False
+    return (REPO / captionGen.VOSK_MODEL).is_dir()
+
+
+def encoded_frames(path: str) -> int:
+    """Number of frames in the video stream, counted by ffprobe."""
+    probe = ffmpeg.probe(path, select_streams="v:0", count_packets=None)
+    return int(probe["streams"][0]["nb_read_packets"])
+
+
+def run_case(comments: int, width: int, height: int, profile: str, captions: bool) -> dict:
+    # Imported here, background.py loads its options relative to the working directory
+    from video_creation.background import chop_background
+    from video_creation.final_video import make_final_video
+    from video_creation.voices import save_text_to_mp3
+
+    settings.config = benchmark_config(width, height, profile)
+    reddit_id = f"bench{comments}x{width}x{height}"
+    reddit_object = synthetic_reddit_object(comments, reddit_id)
+    background_config = {"video": BACKGROUND_VIDEO, "audio": BACKGROUND_AUDIO}
+
+    temp = Path(f"assets/temp/{reddit_id}")
+    shutil.rmtree(temp, ignore_errors=True)
+    shutil.copytree("fixtures/png", temp / "png")
+
+    metrics = JobMetrics()
+    with metrics.stage("tts"):
+        length, number_of_comments = save_text_to_mp3(reddit_object, max_length=sys.maxsize)
+    length = math.ceil(length)
+    with metrics.stage("chop_background"):
+        chop_background(background_config, length, reddit_object)
+    with metrics.stage("render"):
+        final_path = make_final_video(number_of_comments, length, reddit_object, background_config)
+    if captions:
+        import captionGen
+
+        with metrics.stage("captions"):
+            captionGen.main(
+                final_path,
+                os.path.splitext(final_path)[0] + "_out.mp4",
+                str(REPO / "fonts/Rubik-Black.ttf"),
+            )
+    shutil.rmtree(temp, ignore_errors=True)
+
+    render_s = next(record["wall_s"] for record in metrics.stages if record["stage"] == "render")
+    return {
+        "comments": comments,
+        "resolution": f"{width}x{height}",
+        "profile": profile,
+        "video_seconds": length,
+        "output_bytes": Path(final_path).stat().st_size,
+        # The render includes the background crop, so this is a lower bound of the encoder speed
+        "encode_fps": round(encoded_frames(final_path) / render_s, 1) if render_s else None,
+        "stages": {record.pop("stage"): record for record in metrics.stages},
+    }
+
+
+def run_packing_case(max_chars: int) -> dict:
+    """Reads LONG_COMMENT with the stub provider limited to max_chars per request."""
+    from TTS.engine_wrapper import TTSEngine
+    from TTS.stub import StubTTS
+
+    settings.config = benchmark_config(1080, 1920, "shorts")
+    reddit_id = f"packing{max_chars}"
+    engine = TTSEngine(StubTTS, synthetic_reddit_object(0, reddit_id), max_length=sys.maxsize)
+    engine.tts_module.max_chars = max_chars
+    requests = []
+    synthesize = engine.tts_module.run
+
+    def counted(text: str, *args, **kwargs):
+        requests.append(len(text))
+        return synthesize(text, *args, **kwargs)
+
+    engine.tts_module.run = counted
+    Path(engine.path).mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    engine.split_post(LONG_COMMENT, 0)
+    synthesis_s = time.perf_counter() - started
+    audio_s = float(ffmpeg.probe(f"{engine.path}/0.mp3")["format"]["duration"])
+    shutil.rmtree(f"assets/temp/{reddit_id}", ignore_errors=True)
+    return {
+        "max_chars": max_chars,
+        "comment_chars": len(LONG_COMMENT),
+        "requests": len(requests),
+        "longest_request_chars": max(requests, default=0),
+        "synthesis_s": round(synthesis_s, 3),
+        "audio_s": round(audio_s, 3),
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Returns a description of every stage that is slower than the baseline allows."""
+    regressions = []
+    for case, result in results.items():
+        if case not in baseline:
+            print_substep(f"{case}: not in the baseline", style="bold blue")
+            continue
+        for stage, record in result["stages"].items():
+            before = baseline[case]["stages"].get(stage)
+            if before is None:
+                continue
+            now, then = record["wall_s"], before["wall_s"]
+            change = f"{stage} {then:.2f}s -> {now:.2f}s"
+            if now > then * (1 + tolerance) and now - then > NOISE_FLOOR_S:
+                regressions.append(f"{case}: {change}")
+                print_substep(f"{case}: {change} slower", style="bold red")
+            else:
+                print_substep(f"{case}: {change}", style="green")
+    return regressions
+
+
+def measure_startup() -> float:
+    """Seconds it takes a fresh interpreter to import main.py.
+
+    Raises:
+        RuntimeError: If main.py fails to import, with the end of its traceback.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=REPO,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        traceback = [
+            line for line in result.stderr.splitlines() if not line.startswith("import time:")
+        ]
+        raise RuntimeError(f"Importing main.py failed: {traceback[-1] if traceback else '?'}")
+    # import time: self [us] | cumulative | imported package
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == "main":
+            return int(parts[1]) / 1e6
+    raise RuntimeError("python -X importtime did not report main")
+
+
+def check_startup(budget: float) -> bool:
+    try:
+        startup = measure_startup()
+    except RuntimeError as e:
+        print_substep(str(e), "red")
+        return False
+    if startup > budget:
+        print_substep(f"Importing main.py took {startup:.2f}s, over the {budget}s budget.", "red")
+        return False
+    print_substep(f"Importing main.py took {startup:.2f}s (budget {budget}s)", style="green")
+    return True
+
+
+def environment() -> dict:
+    try:
+        ffmpeg_version = subprocess.run(
+            ["ffmpeg", "-version"], capture_output=True, text=True
+        ).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        ffmpeg_version = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "ffmpeg": ffmpeg_version,
+    }
+
+
+def parse_resolution(value: str) -> Tuple[int, int]:
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the video pipeline offline.")
+    parser.add_argument("--comments", default="3,10", help="Comma separated comment counts")
+    parser.add_argument(
+        "--resolutions", default="1080x1920", help="Comma separated WIDTHxHEIGHT values"
+    )
+    parser.add_argument(
+        "--profiles", default="shorts", help="Comma separated encoder profiles to compare"
+    )
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Baseline JSON file")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT), help="Where to save the results")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="Allowed slowdown, 0.2 is 20%%"
+    )
+    parser.add_argument(
+        "--update-baseline", action="store_true", help="Save these results as the baseline"
+    )
+    parser.add_argument("--no-captions", action="store_true", help="Skip captionGen")
+    parser.add_argument(
+        "--startup-budget",
+        type=float,
+        default=STARTUP_BUDGET_S,
+        help="Maximum seconds to import main.py",
+    )
+    parser.add_argument(
+        "--startup-only", action="store_true", help="Only check the startup budget"
+    )
+    parser.add_argument(
+        "--packing",
+        default="",
+        help="Comma separated max_chars values to benchmark the TTS text packing with",
+    )
+    parser.add_argument(
+        "--smoke",
+        action="store_true",
+        help="Render a single small video with the first profile, without timing it",
+    )
+    parser.add_argument(
+        "--workdir", help="Sandbox directory, kept so the fixtures are reused. Default: a temp dir"
+    )
+    args = parser.parse_args()
+
+    print_step("Measuring the startup time")
+    startup_ok = check_startup(args.startup_budget)
+    if args.startup_only:
+        return 0 if startup_ok else 1
+
+    comment_counts = [int(count) for count in args.comments.split(",")]
+    resolutions = [parse_resolution(value) for value in args.resolutions.split(",")]
+    profiles = args.profiles.split(",")
+    for profile in profiles:
+        encoder_args(profile)  # unknown profiles fail now rather than after the first cases
+    if args.smoke:
+        comment_counts, resolutions, profiles = [1], [SMOKE_RESOLUTION], profiles[:1]
+        args.no_captions = True
+    captions = not args.no_captions and captions_available()
+    if not args.no_captions and not captions:
+        print_substep("captionGen or its Vosk model is not installed, skipping the captions.")
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="benchmark-")).absolute()
+    workdir.mkdir(parents=True, exist_ok=True)
+    results = {}
+    try:
+        print_step(f"Preparing the benchmark fixtures in {workdir}")
+        prepare_sandbox(workdir, max(comment_counts))
+        os.chdir(REPO)  # import the pipeline from the repo, then work in the sandbox
+        import video_creation.background  # noqa: F401
+
+        os.chdir(workdir)
+        for comments in comment_counts:
+            for width, height in resolutions:
+                for profile in profiles:
+                    case = f"{comments}_comments_{width}x{height}_{profile}"
+                    print_step(f"Benchmarking {case}")
+                    results[case] = run_case(comments, width, height, profile, captions)
+                    for stage, record in results[case]["stages"].items():
+                        print_substep(f"{stage}: {record['wall_s']}s", style="bold blue")
+                    print_substep(
+                        f"{results[case]['output_bytes'] / 1024 / 1024:.1f} MB, "
+                        f"{results[case]['encode_fps']} fps",
+                        style="bold blue",
+                    )
+        for max_chars in [int(value) for value in args.packing.split(",") if value]:
+            case = f"packing_{max_chars}_chars"
+            print_step(f"Benchmarking {case}")
+            packing = run_packing_case(max_chars)
+            results[case] = {**packing, "stages": {"tts": {"wall_s": packing["synthesis_s"]}}}
+            print_substep(
+                f"{packing['requests']} request(s) for {packing['comment_chars']} characters "
+                f"in {packing['synthesis_s']}s",
+                style="bold blue",
+            )
+    finally:
+        os.chdir(REPO)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.smoke:
+        case = next(iter(results.values()))
+        print_substep(
+            f"Rendered a {case['video_seconds']}s video with the {case['profile']} profile 🎉",
+            style="bold green",
+        )
+        return 0 if startup_ok else 1
+
+    report = {"environment": environment(), "cases": results}
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    Path(args.output).write_text(json.dumps(report, indent=4), encoding="utf-8")
+    print_substep(f"Saved the results to {args.output}", style="bold green")
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline or not baseline_path.exists():
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=4), encoding="utf-8")
+        print_substep(f"Recorded the baseline in {baseline_path}", style="bold green")
+        return 0 if startup_ok else 1
+
+    print_step("Comparing with the baseline")
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    if baseline["environment"] != report["environment"]:
+        print_substep("The baseline was recorded on a different machine or setup.", "bold yellow")
+    regressions = compare(results, baseline["cases"], args.tolerance)
+    if regressions:
+        print_substep(f"{len(regressions)} stage(s) got slower than the baseline.", "bold red")
+        return 1
+    if not startup_ok:
+        return 1
+    print_substep("No regressions 🎉", style="bold green")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,14 +11,19 @@ import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from vosk import Model, KaldiRecognizer, SetLogLevel
 import argparse
+from contextlib import nullcontext
+
+from utils.profiling import StageProfiler, benchmark_args, record_ffmpeg
 
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Vosk model download function
 # TODO small model can be used "vosk-model-small-en-us-0.15"
-def download_vosk_model(model_name="vosk-model-en-us-0.22"):
+VOSK_MODEL = "vosk-model-en-us-0.22"
+
+# Vosk model download function
+def download_vosk_model(model_name=VOSK_MODEL):
     model_url = f"https://alphacephei.com/vosk/models/{model_name}.zip"
     model_path = os.path.join(os.path.dirname(__file__), model_name)
     
@@ -36,17 +41,29 @@ def extract_audio(video_path, audio_path):
         logging.info(f"File '{audio_path}' already exists. Overwriting...")
         os.remove(audio_path)
 	
+    bench = benchmark_args()
     command = [
         "ffmpeg",
+        *bench,
         "-i", video_path,
         "-acodec", "pcm_s16le",
         "-ac", "1",
         "-ar", "16000",
         audio_path
     ]
-    subprocess.run(command, check=True)
+    # Capture the output only when profiling, for the -benchmark report
+    result = subprocess.run(command, check=True, capture_output=bool(bench))
+    record_ffmpeg("extract_audio", result.stderr)
     logging.info(f"Audio extracted to {audio_path}")
 
+# Loaded once per process, daemon.py captions every video it makes
+_models = {}
+
+def load_model(model_path):
+    if model_path not in _models:
+        _models[model_path] = Model(model_path)
+    return _models[model_path]
+
 def transcribe_audio(audio_path, model_path):
     SetLogLevel(0)
     wf = wave.open(audio_path, "rb")
@@ -54,7 +71,7 @@ def transcribe_audio(audio_path, model_path):
         logging.error("Audio file must be WAV format mono PCM.")
         return []
 
-    model = Model(model_path)
+    model = load_model(model_path)
     rec = KaldiRecognizer(model, wf.getframerate())
     rec.SetWords(True)
 
@@ -124,27 +141,36 @@ def create_caption_clips(word_timings, video_width, video_height, font_path):
 
 
 
-def main(input_video_path, output_video_path, font_path):
+def main(input_video_path, output_video_path, font_path, profile=False):
+    profiler = StageProfiler() if profile else None
+
+    def stage(name):
+        return profiler.stage(name) if profiler else nullcontext()
+
     # Download Vosk model if not present
-    model_path = download_vosk_model()
+    with stage("download_model"):
+        model_path = download_vosk_model()
 
     # Extract audio from video
     audio_path = "temp_audio.wav"
-    extract_audio(input_video_path, audio_path)
+    with stage("extract_audio"):
+        extract_audio(input_video_path, audio_path)
     
     # Transcribe audio
-    word_timings = transcribe_audio(audio_path, model_path)
+    with stage("transcribe"):
+        word_timings = transcribe_audio(audio_path, model_path)
     
     if not word_timings:
         logging.error("No words were transcribed. Check the audio quality and format.")
-        return
+        return None
 
     # Print first 10 transcribed words for debugging
     logging.info(f"First 10 transcribed words: {word_timings[:10]}")
 
     # Create caption clips
     video = VideoFileClip(input_video_path)
-    caption_clips = create_caption_clips(word_timings, video.w, video.h, font_path)
+    with stage("caption_clips"):
+        caption_clips = create_caption_clips(word_timings, video.w, video.h, font_path)
     
     # Overlay captions on video
     final_video = CompositeVideoClip([video] + caption_clips)
@@ -154,22 +180,30 @@ def main(input_video_path, output_video_path, font_path):
 
 
     # Write output video
-    final_video.write_videofile(output_video_path,)
+    with stage("write_video"):
+        final_video.write_videofile(output_video_path,)
     
     # Clean up temporary files
     os.remove(audio_path)
+    if profiler:
+        output_dir, output_name = os.path.split(output_video_path)
+        profile_dir = os.path.join(output_dir, "profiles", os.path.splitext(output_name)[0])
+        profiler.save(profile_dir)
+        logging.info(f"Profiles saved to {profile_dir}")
     logging.info("Video processing completed")
+    return output_video_path
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Add captions to video using Vosk and MoviePy.')
     parser.add_argument('input_video', type=str, help='Path to the input video file')
     parser.add_argument('--font', type=str, default='/home/user/RedditVideoMakerBot-master/fonts/Rubik-Black.ttf', help='Path to the font file')
+    parser.add_argument('--profile', action='store_true', help='Profile every stage into <video folder>/profiles/<video name>/')
     args = parser.parse_args()
 
     input_video = args.input_video
     output_video = os.path.splitext(input_video)[0] + "_out.mp4"
     font_path = args.font
-    main(input_video, output_video, font_path)
+    main(input_video, output_video, font_path, profile=args.profile)
 
 
 
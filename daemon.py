@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""Makes, captions and uploads videos on a schedule, in one long-running process.
+
+Replaces Automator.sh: instead of five Python processes per video and fixed sleeps, the models
+(Vosk, the similarity model), the Reddit client, the upload clients and the screenshot browser
+with its Reddit login stay loaded between videos, and the path of each video is handed from
+stage to stage. Only the TikTok upload still runs as a subprocess, as TiktokAutoUploader lives
+in its own virtualenv.
+
+The schedule and the steps are set in settings.daemon of config.toml.
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+import traceback
+from pathlib import Path
+from typing import Optional
+
+
+from utils import settings
+from utils.console import print_step, print_substep
+
+TIKTOK_UPLOADER = Path("uploaders/TiktokAutoUploader")
+
+
+class Daemon:
+    def __init__(self):
+        self.youtube = None
+        self.instagram = None
+
+    @property
+    def config(self) -> dict:
+        return settings.config["settings"]["daemon"]
+
+    def run(self, once: bool = False) -> None:
+        from utils.ffmpeg_progress import StatusFile, subscribe, unsubscribe
+        from utils.playwright import keep_browser_warm
+
+        # The screenshots of every video are taken by the same browser, logged in once
+        browser = keep_browser_warm()
+        status = StatusFile()
+        subscribe(status)
+        try:
+            while True:
+                try:
+                    self.cycle()
+                except (KeyboardInterrupt, SystemExit):
+                    raise
+                except Exception:
+                    print_substep(
+                        f"The cycle failed:\n{traceback.format_exc()}", style="bold red"
+                    )
+                if once:
+                    return
+                shortest = self.config["min_interval"]
+                wait = random.randint(shortest, max(shortest, self.config["max_interval"]))
+                print_step(f"Next video in {wait // 60} minutes")
+                time.sleep(wait)
+        finally:
+            unsubscribe(status)
+            browser.close()
+
+    def cycle(self) -> Optional[str]:
+        """Makes one video and publishes it. Returns the path of the published video."""
+        import main
+
+        video = main.main()
+        if video is None:
+            print_substep("The render was queued, renderfarm.py publishes nothing.", "bold blue")
+            return None
+        title = Path(video).stem
+
+        if self.config["captions"]:
+            video = self.caption(video) or video
+        if self.config["upload_youtube"]:
+            self.upload("YouTube", self.upload_youtube, video, title)
+        if self.config["upload_instagram"]:
+            self.upload("Instagram", self.upload_instagram, video, title)
+        if self.config["upload_tiktok"]:
+            self.upload("TikTok", self.upload_tiktok, video, title)
+        return video
+
+    def caption(self, video: str) -> Optional[str]:
+        import captionGen
+
+        print_step(f"Adding captions to {video}")
+        return captionGen.main(
+            video, os.path.splitext(video)[0] + "_out.mp4", self.config["caption_font"]
+        )
+
+    def upload(self, platform: str, upload, video: str, title: str) -> None:
+        print_step(f"Uploading {video} to {platform}")
+        try:
+            upload(video, title)
+        except Exception:
+            print_substep(f"{platform} upload failed:\n{traceback.format_exc()}", style="bold red")
+
+    def upload_youtube(self, video: str, title: str) -> None:
+        from uploaders import youtubeUpload
+
+        if self.youtube is None:
+            self.youtube = youtubeUpload.get_authenticated_service()
+        youtubeUpload.upload_video(self.youtube, video, title, title=title)
+
+    def upload_instagram(self, video: str, title: str) -> None:
+        from uploaders import instaUpload
+
+        if self.instagram is None:
+            self.instagram = instaUpload.login(*instaUpload.load_credentials())
+        instaUpload.upload_reel(self.instagram, video, title)
+
+    def upload_tiktok(self, video: str, title: str) -> None:
+        shutil.copy(video, TIKTOK_UPLOADER / "VideosDirPath")
+        subprocess.run(
+            [
+                str(Path(self.config["tiktok_python"]).absolute()),
+                "cli.py",
+                "upload",
+                "--user",
+                self.config["tiktok_user"],
+                "-v",
+                Path(video).name,
+                "-t",
+                title,
+            ],
+            cwd=TIKTOK_UPLOADER,
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Make and publish videos on a schedule.")
+    parser.add_argument("--once", action="store_true", help="Make a single video and exit")
+    args = parser.parse_args()
+
+    directory = Path().absolute()
+    config = settings.check_toml(
+        f"{directory}/utils/.config.template.toml", f"{directory}/config.toml"
+    )
+    config is False and sys.exit()
+
+    import main
+    from utils.ffmpeg_install import ffmpeg_install
+    from utils.version import checkversion
+
+    checkversion(main.__VERSION__)
+    ffmpeg_install()
+    try:
+        Daemon().run(once=args.once)
+    except KeyboardInterrupt:
+        main.shutdown()
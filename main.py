@@ -1,31 +1,43 @@
 #!/usr/bin/env python
+import argparse
 import math
+import re
 import sys
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 from os import name
 from pathlib import Path
 from subprocess import Popen
-from typing import NoReturn
+from typing import List, NoReturn, Optional
 
 from prawcore import ResponseException
 
-from reddit.subreddit import get_subreddit_threads
 from utils import settings
-from utils.cleanup import cleanup
 from utils.console import print_markdown, print_step, print_substep
 from utils.ffmpeg_install import ffmpeg_install
+from utils.ffmpeg_progress import StatusFile, subscribe, terminate_ffmpeg
 from utils.id import id
+from utils.manifest import JobManifest, find_unfinished
+from utils.metrics import JobMetrics
+from utils.profiling import StageProfiler
+from utils.stages import JobCancelled, StageLimits, StageScheduler
+from utils.subreddit import claim_submission, claimed_submissions, release_submission
+from utils.workspace import Workspace, WorkspaceQuotaExceeded, sweep_workspaces
 from utils.version import checkversion
 from video_creation.background import (
     chop_background,
     download_background_audio,
     download_background_video,
+    get_background_choice,
     get_background_config,
 )
-from video_creation.final_video import make_final_video
-from video_creation.screenshot_downloader import get_screenshots_of_reddit_posts
-from video_creation.voices import save_text_to_mp3
+from video_creation.render_farm import enqueue_render
+
+# The modules of the other stages (praw, playwright, the TTS providers, ffmpeg and PIL) are
+# imported by the stage that needs them, so starting up doesn't pay for all of them.
 
 __VERSION__ = "3.3.0"
+PROFILE = False  # set by --profile
 
 print(
     """
@@ -40,27 +52,258 @@ print(
 print_markdown(
     "### Thanks for using this tool! Feel free to contribute to this project on GitHub! If you have any questions, feel free to join my Discord server or submit a GitHub issue. You can find solutions to many common problems in the documentation: https://reddit-video-maker-bot.netlify.app/"
 )
-checkversion(__VERSION__)
 
 
-def main(POST_ID=None) -> None:
-    global redditid, reddit_object
-    reddit_object = get_subreddit_threads(POST_ID)
-    redditid = id(reddit_object)
-    length, number_of_comments = save_text_to_mp3(reddit_object)
+def main(
+    POST_ID=None, limits: StageLimits = None, cancel: threading.Event = None
+) -> Optional[str]:
+    """Makes one video. Returns its path, or None if its render was queued.
+
+    Raises:
+        SubmissionUnavailable: If the given post is done or made by another job, or no post
+            is left
+        JobCancelled: If cancel was set, checked between the stages
+    """
+    cancel = cancel or threading.Event()
+    limits = limits or StageLimits()
+    metrics = JobMetrics(profiler=StageProfiler() if PROFILE else None)
+    workspace = None
+    sweep_workspaces()
+    try:
+        manifest = resumable_job(POST_ID)
+        if manifest is not None:
+            print_step(f"Resuming the unfinished video of thread {manifest.reddit_id}")
+            reddit_object = manifest.result("reddit")
+        else:
+            with limits("reddit"), metrics.stage("reddit"):
+                from reddit.subreddit import get_subreddit_threads
+
+                reddit_object = get_subreddit_threads(POST_ID)
+        redditid = id(reddit_object)
+        metrics.job.update(
+            reddit_id=redditid,
+            title=reddit_object["thread_title"],
+            subreddit=settings.config["reddit"]["thread"]["subreddit"],
+            storymode=bool(settings.config["settings"]["storymode"]),
+            voice=settings.config["settings"]["tts"]["voice_choice"],
+            resumed=manifest is not None,
+        )
+        try:
+            workspace = Workspace(redditid).create()
+            if manifest is None:
+                manifest = JobManifest(redditid)
+                manifest.record("reddit", reddit_object)
+            final_path = make_video(reddit_object, limits, manifest, metrics, workspace, cancel)
+        finally:
+            release_submission(reddit_object["thread_id"])
+    except BaseException as err:
+        # Unless the next run should resume it, a failed job doesn't leave its temp files behind
+        resumable = settings.config["settings"]["pipeline"]["resume_unfinished"]
+        if workspace is not None and (not resumable or isinstance(err, WorkspaceQuotaExceeded)):
+            metrics.job["temp_bytes_freed"] = workspace.remove()
+        metrics.save_profiles(profile_directory(metrics))
+        metrics.write(status="failed", error=repr(err))
+        raise
+    metrics.save_profiles(profile_directory(metrics))
+    metrics.write(status="ok")
+    return final_path
+
+
+def profile_directory(metrics: JobMetrics) -> str:
+    subreddit = settings.config["reddit"]["thread"]["subreddit"]
+    return f"results/{subreddit}/profiles/{metrics.job.get('reddit_id', 'unknown')}"
+
+
+def resumable_job(POST_ID=None) -> Optional[JobManifest]:
+    """Finds the checkpoints of a job that crashed, for the given post or any post.
+
+    The job is claimed, so other jobs of a pipelined batch won't resume it too. Every resume is
+    counted in the manifest, see find_unfinished.
+    """
+    pipeline = settings.config["settings"]["pipeline"]
+    if POST_ID:
+        # Asked for explicitly, so it is resumed even if it was abandoned
+        manifest = JobManifest(re.sub(r"[^\w\s-]", "", POST_ID))
+    elif pipeline["resume_unfinished"]:
+        manifest = find_unfinished(
+            exclude=claimed_submissions(), max_attempts=int(pipeline["max_resume_attempts"])
+        )
+    else:
+        return None
+    if manifest is None or manifest.finished or not manifest.completed("reddit"):
+        return None
+    if not claim_submission(manifest.result("reddit")["thread_id"]):
+        return None
+    manifest.resumed()
+    return manifest
+
+
+def make_video(
+    reddit_object: dict,
+    limits: StageLimits,
+    manifest: JobManifest,
+    metrics: JobMetrics,
+    workspace: Workspace,
+    cancel: threading.Event,
+) -> Optional[str]:
+    temp = f"assets/temp/{manifest.reddit_id}"
+    bg_choice = manifest.checkpoint(
+        "background",
+        lambda: {
+            "video": get_background_choice("video"),
+            "audio": get_background_choice("audio"),
+        },
+    )()
+    bg_config = {mode: get_background_config(mode, choice) for mode, choice in bg_choice.items()}
+    storymode = settings.config["settings"]["storymode"]
+
+    def tts(results):
+        from video_creation.voices import save_text_to_mp3
+
+        return save_text_to_mp3(reddit_object)
+
+    def screenshots(results):
+        from video_creation.screenshot_downloader import get_screenshots_of_reddit_posts
+
+        # Story screenshots don't depend on the audio, comment screenshots need the comment count
+        number_of_comments = 0 if storymode else results["tts"][1]
+        get_screenshots_of_reddit_posts(reddit_object, number_of_comments)
+
+    stages = StageScheduler(
+        parallel=settings.config["settings"]["pipeline"]["parallel_stages"],
+        limits=limits,
+        metrics=metrics,
+        cancel=cancel,
+    )
+    # The stages writing into the workspace are checked against its quota
+    stages.add(
+        "tts",
+        workspace.guard(
+            manifest.checkpoint(
+                "tts",
+                tts,
+                outputs=lambda result: [f"{temp}/mp3/*.mp3"],
+            )
+        ),
+    )
+    stages.add(
+        "screenshots",
+        workspace.guard(
+            manifest.checkpoint(
+                "screenshots",
+                screenshots,
+                # title.png is redrawn by the render, so it is not part of the checkpoint
+                outputs=lambda result: [
+                    f"{temp}/png/comment_*.png",
+                    f"{temp}/png/img*.png",
+                    f"{temp}/png/story_content.png",
+                ],
+            )
+        ),
+        after=() if storymode else ("tts",),
+    )
+    stages.add("background_video", lambda results: download_background_video(bg_config["video"]))
+    stages.add("background_audio", lambda results: download_background_audio(bg_config["audio"]))
+    stages.add(
+        "chop_background",
+        workspace.guard(
+            manifest.checkpoint(
+                "chop_background",
+                lambda results: chop_background(
+                    bg_config, math.ceil(results["tts"][0]), reddit_object
+                ),
+                outputs=lambda result: [
+                    f"{temp}/background.mp4",
+                    f"{temp}/background.mp3",
+                    f"{temp}/background.wav",
+                ],
+            )
+        ),
+        after=("tts", "background_video", "background_audio"),
+    )
+    results = stages.run()
+    if cancel.is_set():
+        raise JobCancelled("Cancelled before the render")
+
+    length, number_of_comments = results["tts"]
     length = math.ceil(length)
-    get_screenshots_of_reddit_posts(reddit_object, number_of_comments)
-    bg_config = {
-        "video": get_background_config("video"),
-        "audio": get_background_config("audio"),
-    }
-    download_background_video(bg_config["video"])
-    download_background_audio(bg_config["audio"])
-    chop_background(bg_config, length, reddit_object)
-    make_final_video(number_of_comments, length, reddit_object, bg_config)
+    pipeline = settings.config["settings"]["pipeline"]
+    if pipeline["render_mode"] == "queue":
+        # Rendered by renderfarm.py worker processes, which also finish the manifest
+        enqueue_render(number_of_comments, length, reddit_object, bg_choice)
+        manifest.record("enqueued")
+        return None
+    with limits("render"), metrics.stage("render"):
+        from video_creation.final_video import make_final_video
+
+        final_path = workspace.guard(make_final_video)(
+            number_of_comments,
+            length,
+            reddit_object,
+            bg_config,
+            threads=pipeline["render_threads"] or None,
+        )
+    metrics.job["output"] = final_path
+    with metrics.stage("cleanup"):
+        manifest.finish(final_path)
+    return final_path
+
+
+def run_pipelined(post_ids: List[Optional[str]]) -> None:
+    """Makes several videos with overlapping stages.
+
+    Up to settings.pipeline.jobs_in_flight jobs run at once, so the network-bound stages of the
+    next video (reddit fetch and AI cleanup, TTS, screenshots) run while the current one renders.
+    Each stage is capped by its settings.pipeline.<stage>_concurrency limit.
+
+    Args:
+        post_ids (List[Optional[str]]): One entry per video, None picks a thread from the subreddit
+    """
+    pipeline = settings.config["settings"]["pipeline"]
+    limits = StageLimits(
+        {
+            "reddit": pipeline["reddit_concurrency"],
+            "tts": pipeline["tts_concurrency"],
+            "screenshots": pipeline["screenshots_concurrency"],
+            "render": pipeline["render_concurrency"],
+        }
+    )
+
+    cancel = threading.Event()
+
+    def job(index: int, post_id: Optional[str]) -> None:
+        print_step(f"Starting video {index} of {len(post_ids)}")
+        main(post_id, limits, cancel)
+
+    executor = ThreadPoolExecutor(int(pipeline["jobs_in_flight"]), thread_name_prefix="job")
+    futures = []
+    try:
+        futures = [
+            executor.submit(job, index, post_id) for index, post_id in enumerate(post_ids, 1)
+        ]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in done:
+            future.result()  # raises the error of the job that failed, if any
+    except BaseException:
+        # The jobs in flight stop at their next stage, or as soon as their ffmpeg is stopped, and
+        # clean up after themselves in main()
+        print_substep("Stopping the videos in progress...", style="bold red")
+        cancel.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        started = [future for future in futures if not future.cancelled()]
+        while wait(started, timeout=0.5).not_done:
+            terminate_ffmpeg()
+        raise
+    executor.shutdown()
+
+
+def is_pipelined() -> bool:
+    return int(settings.config["settings"]["pipeline"]["jobs_in_flight"]) > 1
 
 
 def run_many(times) -> None:
+    if is_pipelined():
+        return run_pipelined([None] * times)
     for x in range(1, times + 1):
         print_step(
             f'on the {x}{("th", "st", "nd", "rd", "th", "th", "th", "th", "th", "th")[x % 10]} iteration of {times}'
@@ -70,9 +313,9 @@ def run_many(times) -> None:
 
 
 def shutdown() -> NoReturn:
-    if "redditid" in globals():
-        print_markdown("## Clearing temp files")
-        cleanup(redditid)
+    # Each interrupted job already removed its temp files in main(), unless it can be resumed
+    if settings.config["settings"]["pipeline"]["resume_unfinished"]:
+        print_markdown("## Keeping temp files so the next run can resume this video")
 
     print("Exiting...")
     sys.exit()
@@ -84,12 +327,28 @@ if __name__ == "__main__":
             "Hey! Congratulations, you've made it so far (which is pretty rare with no Python 3.10). Unfortunately, this program only works on Python 3.10. Please install Python 3.10 and try again."
         )
         sys.exit()
+    parser = argparse.ArgumentParser(description="Make videos out of reddit threads.")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile every stage into results/<subreddit>/profiles/<thread id>/",
+    )
+    args = parser.parse_args()
+    checkversion(__VERSION__)
     ffmpeg_install()
     directory = Path().absolute()
     config = settings.check_toml(
         f"{directory}/utils/.config.template.toml", f"{directory}/config.toml"
     )
     config is False and sys.exit()
+    # The GUI shows the progress of the renders from video_creation/data/render_status/
+    subscribe(StatusFile())
+
+    if args.profile:
+        PROFILE = True
+        # cProfile only sees the thread it runs in, so don't overlap the stages or the videos
+        config["settings"]["pipeline"].update(parallel_stages=False, jobs_in_flight=1)
+        print_substep("Profiling is on, the stages run one after another.", style="bold blue")
 
     if (
         not settings.config["settings"]["tts"]["tiktok_sessionid"]
@@ -101,7 +360,9 @@ if __name__ == "__main__":
         )
         sys.exit()
     try:
-        if config["reddit"]["thread"]["post_id"]:
+        if config["reddit"]["thread"]["post_id"] and is_pipelined():
+            run_pipelined(config["reddit"]["thread"]["post_id"].split("+"))
+        elif config["reddit"]["thread"]["post_id"]:
             for index, post_id in enumerate(config["reddit"]["thread"]["post_id"].split("+")):
                 index += 1
                 print_step(
@@ -1,29 +1,53 @@
+import hashlib
+import json
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import requests
 import praw
 from praw.models import MoreComments
 from prawcore.exceptions import ResponseException
-import json
 
 
 from utils import settings
-from utils.ai_methods import sort_by_similarity
 from utils.console import print_step, print_substep
-from utils.posttextparser import posttextparser
-from utils.subreddit import get_subreddit_undone
+from utils.subreddit import (
+    SubmissionUnavailable,
+    already_done,
+    claim_submission,
+    get_subreddit_undone,
+)
 from utils.videos import check_done
 from utils.voice import sanitize_text
 
 GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"  # Replace with the actual Groq API URL
+GROQ_MODEL = "llama-3.1-70b-versatile"
+GROQ_TIMEOUT = 30  # seconds, used when ai.groq_timeout is not set
+GROQ_CACHE_DIR = "assets/cache/groq"
+# Posts picked before giving up, when other jobs keep claiming them first
+MAX_PICKS = 5
 
-def get_subreddit_threads(POST_ID: str):
-    """
-    Returns a list of threads from the AskReddit subreddit.
+# Define the system prompt to guide the model's output
+SYSTEM_PROMPT = "Please clean up the following story for clarity without changing any details. The story should sound like a reddit story since it comes from reddit, for example don't do stuff like I'm 28, female, do stuff like I (28F) (age is just an example). Keep details such as age and gender, do not make the story soulless. Optimize for TTS use. The story will be used without any filtering so please do not write anything other than the sanitized story. I am serious, DO NOT, WRITE ANYTHING OTHER than the sanitized story, or it will ruin the whole entire automation."
+
+# Background cleanups of upcoming candidates, keyed by cache key so a post is never sent twice
+_prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="groq-prefetch")
+_prefetch_jobs = {}
+_prefetch_lock = threading.Lock()
+_clients = threading.local()
+
+def reddit_client():
+    """The Reddit client of this thread, logged in on first use and reused by the next videos.
+
+    praw clients aren't thread safe, so pipelined jobs each get their own.
     """
+    reddit = getattr(_clients, "reddit", None)
+    if reddit is not None:
+        return reddit
 
     print_substep("Logging into Reddit.")
-
-    content = {}
     if settings.config["reddit"]["creds"]["2fa"]:
         print("\nEnter your two-factor authentication code from your authenticator app.\n")
         code = input("> ")
@@ -51,32 +75,28 @@ def get_subreddit_threads(POST_ID: str):
             print("Invalid credentials - please check them in config.toml")
     except Exception as e:
         print("Something went wrong...", e)
-
-    print_step("Getting subreddit threads...")
-    similarity_score = 0
-    if not settings.config["reddit"]["thread"]["subreddit"]:
-        try:
-            subreddit = reddit.subreddit(
-                re.sub(r"r\/", "", input("What subreddit would you like to pull from? "))
-            )
-        except ValueError:
-            subreddit = reddit.subreddit("askreddit")
-            print_substep("Subreddit not defined. Using AskReddit.")
     else:
-        sub = settings.config["reddit"]["thread"]["subreddit"]
-        print_substep(f"Using subreddit: r/{sub} from TOML config")
-        subreddit_choice = sub
-        if str(subreddit_choice).casefold().startswith("r/"):
-            subreddit_choice = subreddit_choice[2:]
-        subreddit = reddit.subreddit(subreddit_choice)
+        _clients.reddit = reddit
+    return reddit
+
+
+def pick_submission(reddit, subreddit, POST_ID: str):
+    """The post to make a video of: the given one, or the best one not done yet.
 
+    Returns:
+        tuple: (submission or None, similarity score, the candidate threads or None)
+    """
+    similarity_score = 0
+    threads = None
     if POST_ID:
         submission = reddit.submission(id=POST_ID)
     elif (settings.config["reddit"]["thread"]["post_id"] and
           len(str(settings.config["reddit"]["thread"]["post_id"]).split("+")) == 1):
         submission = reddit.submission(id=settings.config["reddit"]["thread"]["post_id"])
     elif settings.config["ai"]["ai_similarity_enabled"]:
-        threads = subreddit.hot(limit=50)
+        from utils.ai_methods import sort_by_similarity  # loads torch and transformers
+
+        threads = list(subreddit.hot(limit=50))
         keywords = settings.config["ai"]["ai_similarity_keywords"].split(",")
         keywords = [keyword.strip() for keyword in keywords]
         keywords_print = ", ".join(keywords)
@@ -86,17 +106,59 @@ def get_subreddit_threads(POST_ID: str):
             threads, subreddit, similarity_scores=similarity_scores
         )
     else:
-        threads = subreddit.hot(limit=25)
+        threads = list(subreddit.hot(limit=25))
         submission = get_subreddit_undone(threads, subreddit)
+    return submission, similarity_score, threads
 
-    if submission is None:
-        return get_subreddit_threads(POST_ID)
 
-    elif not submission.num_comments and settings.config["settings"]["storymode"] == "false":
-        print_substep("No comments found. Skipping.")
-        exit()
+def get_subreddit_threads(POST_ID: str):
+    """
+    Returns a list of threads from the AskReddit subreddit.
+    """
 
-    submission = check_done(submission)
+    content = {}
+    reddit = reddit_client()
+
+    print_step("Getting subreddit threads...")
+    if not settings.config["reddit"]["thread"]["subreddit"]:
+        try:
+            subreddit = reddit.subreddit(
+                re.sub(r"r\/", "", input("What subreddit would you like to pull from? "))
+            )
+        except ValueError:
+            subreddit = reddit.subreddit("askreddit")
+            print_substep("Subreddit not defined. Using AskReddit.")
+    else:
+        sub = settings.config["reddit"]["thread"]["subreddit"]
+        print_substep(f"Using subreddit: r/{sub} from TOML config")
+        subreddit_choice = sub
+        if str(subreddit_choice).casefold().startswith("r/"):
+            subreddit_choice = subreddit_choice[2:]
+        subreddit = reddit.subreddit(subreddit_choice)
+
+    explicit = POST_ID or (
+        settings.config["reddit"]["thread"]["post_id"]
+        and len(str(settings.config["reddit"]["thread"]["post_id"]).split("+")) == 1
+    )
+    for _ in range(MAX_PICKS):
+        submission, similarity_score, threads = pick_submission(reddit, subreddit, POST_ID)
+        if submission is not None and (
+            not submission.num_comments and settings.config["settings"]["storymode"] == "false"
+        ):
+            print_substep("No comments found. Skipping.")
+            exit()
+        submission = check_done(submission) if submission is not None else None
+        if submission is not None and claim_submission(submission.id):
+            break
+        if explicit:
+            # Picking again would give the same post
+            raise SubmissionUnavailable(
+                f"Post {POST_ID or settings.config['reddit']['thread']['post_id']} is already "
+                "done or being made by another job"
+            )
+        # Nothing left, or another job of the batch picked this post in the meantime
+    else:
+        raise SubmissionUnavailable(f"Found no post to make a video of in {MAX_PICKS} tries")
 
     upvotes = submission.score
     ratio = submission.upvote_ratio * 100
@@ -120,10 +182,7 @@ def get_subreddit_threads(POST_ID: str):
     content["is_nsfw"] = submission.over_18
     content["comments"] = []
     if settings.config["settings"]["storymode"]:
-        if settings.config["settings"]["storymodemethod"] == 1:
-            content["thread_post"] = posttextparser(submission.selftext)
-        else:
-            content["thread_post"] = submission.selftext
+        content["thread_post"] = story_text_of(submission)
     else:
         for top_level_comment in submission.comments:
             if isinstance(top_level_comment, MoreComments):
@@ -150,44 +209,183 @@ def get_subreddit_threads(POST_ID: str):
     print_substep("Received subreddit threads Successfully.", style="bold green")
 
     # New: Clean up the story using AI
-    if settings.config["settings"]["storymode"]:
+    if settings.config["settings"]["storymode"] and settings.config["ai"].get(
+        "ai_cleanup_enabled", True
+    ):
         story_text = content["thread_post"]
         print("Old story content: (before AI)")
         print(story_text)
-        content["thread_post"] = clean_story_with_ai(story_text)
+        content["thread_post"] = clean_story_with_ai(story_text, submission.id)
         print("New content (after AI):")
         print(content["thread_post"])
 
+        if threads is not None:
+            # Clean the next candidates in the background while this video is made
+            prefetch_story_cleanups(threads, exclude=submission.id)
+
     return content
 
-def clean_story_with_ai(story_text: list) -> str:
-    api_key = settings.config["ai"]["groq_api_key"]  # Get the API key from the config
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
 
-    # Define the system prompt to guide the model's output
-    system_prompt = "Please clean up the following story for clarity without changing any details. The story should sound like a reddit story since it comes from reddit, for example don't do stuff like I'm 28, female, do stuff like I (28F) (age is just an example). Keep details such as age and gender, do not make the story soulless. Optimize for TTS use. The story will be used without any filtering so please do not write anything other than the sanitized story. I am serious, DO NOT, WRITE ANYTHING OTHER than the sanitized story, or it will ruin the whole entire automation."
+def story_text_of(submission) -> list | str:
+    """Returns the story text of a submission in the shape the configured storymode method expects"""
+    if settings.config["settings"]["storymodemethod"] == 1:
+        from utils.posttextparser import posttextparser  # loads spacy
+
+        return posttextparser(submission.selftext)
+    return submission.selftext
+
+
+def _groq_settings() -> dict:
+    ai = settings.config["ai"]
+    return {
+        "url": ai.get("groq_api_url") or GROQ_API_URL,
+        "model": ai.get("groq_model") or GROQ_MODEL,
+        "timeout": float(ai.get("groq_timeout") or GROQ_TIMEOUT),
+    }
+
+
+def _cache_key(submission_id: str, model: str) -> str:
+    prompt_hash = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{submission_id}:{prompt_hash}:{model}".encode("utf-8")).hexdigest()
+
+
+def _read_cache(key: str, story_hash: str) -> str | None:
+    cache_file = Path(GROQ_CACHE_DIR) / f"{key}.json"
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # The post may have been edited since it was cleaned
+    if cached.get("story_hash") != story_hash:
+        return None
+    return cached.get("cleaned")
+
+
+def _write_cache(key: str, story_hash: str, cleaned: str) -> None:
+    cache_dir = Path(GROQ_CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_dir / f"{key}.json.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump({"story_hash": story_hash, "cleaned": cleaned}, f, ensure_ascii=False)
+    tmp_file.replace(cache_dir / f"{key}.json")
+
+
+def clean_story_with_ai(story_text: list | str, submission_id: str = None) -> str:
+    """Cleans up the story with the Groq chat endpoint.
+
+    Results are cached on disk per (submission id, prompt hash, model), so re-renders of a post
+    and posts cleaned by prefetch_story_cleanups don't pay for the request again. The request is
+    bounded by ai.groq_timeout; on any error the original text is returned.
 
+    Args:
+        story_text (list | str): The story, either as sentences or as one string
+        submission_id (str, optional): Reddit id of the post, enables the cache
+
+    Returns:
+        str: The cleaned story
+    """
     # Concatenate the story text into a single string
-    story_text_str = "\n".join(story_text)
+    story_text_str = story_text if isinstance(story_text, str) else "\n".join(story_text)
+    groq = _groq_settings()
+
+    key = story_hash = None
+    if submission_id:
+        key = _cache_key(submission_id, groq["model"])
+        story_hash = hashlib.sha256(story_text_str.encode("utf-8")).hexdigest()
+        with _prefetch_lock:
+            pending = _prefetch_jobs.pop(key, None)
+        if pending is not None:
+            # A prefetch for this post is in flight, wait for it instead of asking twice
+            try:
+                pending.result(timeout=groq["timeout"])
+            except Exception:
+                pass
+        cached = _read_cache(key, story_hash)
+        if cached is not None:
+            print_substep("Using cached AI cleanup of the story.", style="bold blue")
+            return cached
+
+    cleaned_story = _request_cleanup(story_text_str, groq)
+    if cleaned_story is None:
+        return story_text_str  # Fallback to the original if there's an error
+    if key is not None:
+        _write_cache(key, story_hash, cleaned_story)
+    return cleaned_story
+
+
+def _request_cleanup(story_text_str: str, groq: dict) -> str | None:
+    api_key = settings.config["ai"]["groq_api_key"]  # Get the API key from the config
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
 
     data = {
         "messages": [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": story_text_str}  # Changed this to a single string
         ],
         "max_tokens": 1000,  # Adjust based on your needs
         "temperature": 0.7,
-        "model": "llama-3.1-70b-versatile"
+        "model": groq["model"],
     }
 
     try:
-        response = requests.post(GROQ_API_URL, headers=headers, json=data)
+        response = requests.post(groq["url"], headers=headers, json=data, timeout=groq["timeout"])
         response.raise_for_status()
         cleaned_story = response.json().get("choices")[0].get("message", {}).get("content", "")
-        return cleaned_story.strip()  # Clean up the response
+        cleaned_story = cleaned_story.strip()  # Clean up the response
+        if cleaned_story:
+            return cleaned_story
+    except requests.exceptions.Timeout:
+        print(f"AI cleanup timed out after {groq['timeout']} seconds, using the original story")
     except requests.exceptions.HTTPError as e:
         print(f"HTTP error occurred: {e.response.status_code} - {e.response.text}")
     except Exception as e:
         print(f"Error cleaning story: {e}")
 
-    return "\n".join(story_text)  # Fallback to the original if there's an error
+    return None
+
+
+def prefetch_story_cleanups(threads: list, exclude: str = None) -> None:
+    """Starts cleaning the next few candidate stories in the background.
+
+    The number of candidates is set by ai.ai_prefetch_count (0 disables prefetching). Candidates
+    are taken in listing order, skipping posts that are already done or wouldn't pass the
+    storymode checks anyway.
+    """
+    count = int(settings.config["ai"].get("ai_prefetch_count") or 0)
+    if count <= 0:
+        return
+    try:
+        with open("./video_creation/data/videos.json", "r", encoding="utf-8") as done_vids_raw:
+            done_videos = json.load(done_vids_raw)
+    except (OSError, ValueError):
+        done_videos = []
+    max_length = settings.config["settings"]["storymode_max_length"] or 2000
+    model = _groq_settings()["model"]
+
+    for submission in threads:
+        if count <= 0:
+            break
+        if submission.id == exclude or already_done(done_videos, submission):
+            continue
+        if not submission.is_self or not 30 <= len(submission.selftext) <= max_length:
+            continue
+        key = _cache_key(submission.id, model)
+        with _prefetch_lock:
+            if key in _prefetch_jobs:
+                continue
+            _prefetch_jobs[key] = _prefetch_executor.submit(_prefetch_one, submission)
+        count -= 1
+
+
+def _prefetch_one(submission) -> None:
+    story_text = story_text_of(submission)
+    story_text_str = story_text if isinstance(story_text, str) else "\n".join(story_text)
+    groq = _groq_settings()
+    key = _cache_key(submission.id, groq["model"])
+    story_hash = hashlib.sha256(story_text_str.encode("utf-8")).hexdigest()
+    if _read_cache(key, story_hash) is not None:
+        return
+    cleaned_story = _request_cleanup(story_text_str, groq)
+    if cleaned_story is not None:
+        _write_cache(key, story_hash, cleaned_story)
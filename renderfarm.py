@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+import argparse
+import sys
+from pathlib import Path
+
+from utils import settings
+from video_creation.render_farm import run_render_farm
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Render the videos queued by main.py (settings.pipeline.render_mode = \"queue\")."
+    )
+    parser.add_argument("--workers", type=int, help="Number of parallel renders")
+    parser.add_argument("--threads", type=int, help="ffmpeg threads per render, 0 splits the CPUs")
+    parser.add_argument("--drain", action="store_true", help="Exit once the queue is empty")
+    args = parser.parse_args()
+
+    directory = Path().absolute()
+    config = settings.check_toml(
+        f"{directory}/utils/.config.template.toml", f"{directory}/config.toml"
+    )
+    config is False and sys.exit()
+
+    pipeline = config["settings"]["pipeline"]
+    try:
+        run_render_farm(
+            workers=args.workers if args.workers is not None else pipeline["render_workers"],
+            threads=args.threads if args.threads is not None else pipeline["render_threads"],
+            drain=args.drain,
+        )
+    except KeyboardInterrupt:
+        print("Exiting...")
+        sys.exit()
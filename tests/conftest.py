@@ -0,0 +1,15 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The bot is run from the root of the repository and imports its modules from there
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Runs the test from an empty directory, as the bot uses paths relative to its root."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,61 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("elevenlabs")
+
+from elevenlabs.core.api_error import ApiError  # noqa: E402
+
+from TTS.elevenlabs import KeyPool, QuotaExceeded  # noqa: E402
+
+
+def client(used: int, limit: int, reset: float = 0):
+    subscription = SimpleNamespace(
+        character_count=used, character_limit=limit, next_character_count_reset_unix=reset
+    )
+    return SimpleNamespace(user=SimpleNamespace(get_subscription=lambda: subscription))
+
+
+def unreadable_client():
+    def get_subscription():
+        raise ApiError(status_code=401, body={"detail": {"status": "missing_permissions"}})
+
+    return SimpleNamespace(user=SimpleNamespace(get_subscription=get_subscription))
+
+
+def pool(**clients) -> KeyPool:
+    keys = KeyPool(list(clients))
+    keys.clients.update(clients)
+    return keys
+
+
+def test_the_first_key_with_enough_characters_is_used():
+    keys = pool(a=client(990, 1000), b=client(0, 1000))
+
+    assert keys.acquire(5) == "a"
+    assert keys.acquire(50) == "b"
+
+
+def test_characters_are_counted_as_texts_are_read():
+    keys = pool(a=client(900, 1000), b=client(0, 1000))
+    keys.acquire(60)
+    keys.used("a", 60)
+
+    assert keys.acquire(60) == "b"
+
+
+def test_exhausted_keys_are_skipped_until_their_reset():
+    keys = pool(a=client(0, 1000, reset=time.time() + 3600), b=client(0, 1000))
+    keys.exhausted("a")
+
+    assert keys.acquire(10) == "b"
+    keys.exhausted("b")
+    with pytest.raises(QuotaExceeded):
+        keys.acquire(10)
+
+
+def test_keys_without_a_readable_subscription_are_still_used():
+    keys = pool(a=unreadable_client())
+
+    assert keys.acquire(10_000) == "a"
@@ -0,0 +1,97 @@
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import ffmpeg
+import pytest
+
+from utils.ffmpeg_progress import (
+    STATUS_STALE_S,
+    RenderProgress,
+    StatusFile,
+    read_status,
+    run_ffmpeg,
+    terminate_ffmpeg,
+)
+from utils.stages import JobCancelled
+
+
+class Command:
+    """Stands in for an ffmpeg-python output, running a Python snippet instead of ffmpeg."""
+
+    def __init__(self, code: str):
+        self.code = code
+
+    def run_async(self, pipe_stdout=False, pipe_stderr=False, quiet=False):
+        return subprocess.Popen(
+            [sys.executable, "-c", self.code],
+            stdout=subprocess.PIPE if pipe_stdout or quiet else None,
+            stderr=subprocess.PIPE if pipe_stderr or quiet else None,
+        )
+
+
+def test_run_ffmpeg_returns_the_output():
+    assert run_ffmpeg(Command("print('done')"), capture_stdout=True) == (b"done\n", None)
+
+
+def test_a_failed_run_raises_ffmpeg_errors():
+    with pytest.raises(ffmpeg.Error) as error:
+        run_ffmpeg(Command("import sys; sys.exit('bad input')"), quiet=True)
+
+    assert b"bad input" in error.value.stderr
+
+
+def test_terminated_runs_raise_job_cancelled():
+    errors = []
+
+    def render():
+        try:
+            run_ffmpeg(Command("import time; time.sleep(30)"), quiet=True)
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=render)
+    started = time.monotonic()
+    thread.start()
+    while not terminate_ffmpeg():
+        time.sleep(0.01)
+    thread.join(5)
+
+    assert time.monotonic() - started < 5
+    assert len(errors) == 1 and isinstance(errors[0], JobCancelled)
+    assert terminate_ffmpeg() == 0
+
+
+def report(directory, job, done=False):
+    StatusFile(directory)(RenderProgress("render", 10, 30.0, 1.5, 4000.0, 5, 10, 3, done, job))
+
+
+def test_the_status_of_every_process_is_merged(tmp_path):
+    workers = [
+        multiprocessing.Process(target=report, args=(str(tmp_path), job)) for job in ("a", "b")
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(10)
+    report(str(tmp_path), "c")
+
+    status = read_status(str(tmp_path))
+
+    assert sorted(status) == ["a/render", "b/render", "c/render"]
+    assert status["a/render"]["percent"] == 50.0
+    assert len(list(tmp_path.glob("*.json"))) == 3
+
+
+def test_the_status_of_dead_processes_is_dropped(tmp_path):
+    report(str(tmp_path), "a")
+    dead = tmp_path / "1.json"
+    dead.write_text(json.dumps({"b/render": {}}), encoding="utf-8")
+    stale = time.time() - STATUS_STALE_S - 1
+    os.utime(dead, (stale, stale))
+
+    assert list(read_status(str(tmp_path))) == ["a/render"]
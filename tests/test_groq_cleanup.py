@@ -0,0 +1,96 @@
+import time
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("praw")
+
+from reddit import subreddit  # noqa: E402
+from utils import groq_stub, settings  # noqa: E402
+
+STORY = "I (28F) told my roommate to stop eating my food."
+
+
+@pytest.fixture
+def ai(workdir, monkeypatch):
+    """The settings.ai of the test."""
+    config = {"groq_api_key": "key", "groq_model": "model-a", "groq_timeout": 5}
+    monkeypatch.setattr(settings, "config", {"ai": config}, raising=False)
+    return config
+
+
+@pytest.fixture
+def start_stub(ai):
+    """Starts a Groq stub with the given options and points the AI cleanup at it."""
+    servers = []
+
+    def start(**options):
+        server = groq_stub.serve(**options)
+        servers.append(server)
+        ai["groq_api_url"] = groq_stub.url_of(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def cached_files():
+    return list(Path(subreddit.GROQ_CACHE_DIR).glob("*.json"))
+
+
+def test_a_repeat_call_is_served_from_the_cache(start_stub):
+    stub = start_stub()
+
+    assert subreddit.clean_story_with_ai(STORY, "abc") == STORY
+    assert subreddit.clean_story_with_ai(STORY, "abc") == STORY
+    assert stub.requests_served == 1
+    assert len(cached_files()) == 1
+
+
+def test_an_edited_post_is_cleaned_again(start_stub):
+    stub = start_stub()
+    subreddit.clean_story_with_ai(STORY, "abc")
+
+    assert subreddit.clean_story_with_ai(STORY + " Edit: typo", "abc") == STORY + " Edit: typo"
+    assert stub.requests_served == 2
+
+
+def test_the_cache_key_follows_the_model(ai, start_stub):
+    stub = start_stub()
+    subreddit.clean_story_with_ai(STORY, "abc")
+    ai["groq_model"] = "model-b"
+    subreddit.clean_story_with_ai(STORY, "abc")
+
+    assert stub.requests_served == 2
+    assert len(cached_files()) == 2
+
+
+def test_the_cache_key_follows_the_prompt(start_stub, monkeypatch):
+    stub = start_stub()
+    subreddit.clean_story_with_ai(STORY, "abc")
+    monkeypatch.setattr(subreddit, "SYSTEM_PROMPT", subreddit.SYSTEM_PROMPT + " Be brief.")
+    subreddit.clean_story_with_ai(STORY, "abc")
+
+    assert stub.requests_served == 2
+    assert len(cached_files()) == 2
+
+
+def test_a_timeout_falls_back_to_the_original_story(ai, start_stub):
+    start_stub(delay=2)
+    ai["groq_timeout"] = 0.2
+
+    started = time.monotonic()
+    assert subreddit.clean_story_with_ai(["First line.", "Second line."], "abc") == (
+        "First line.\nSecond line."
+    )
+    assert time.monotonic() - started < 1.5
+    assert cached_files() == []  # the next run asks again
+
+
+def test_an_error_answer_falls_back_to_the_original_story(start_stub):
+    start_stub(status=500)
+
+    assert subreddit.clean_story_with_ai(STORY, "abc") == STORY
+    assert cached_files() == []
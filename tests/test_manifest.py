@@ -0,0 +1,107 @@
+import os
+import time
+from pathlib import Path
+
+from utils.manifest import JobManifest, find_unfinished
+
+
+def write(path, content=b"data"):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_bytes(content)
+    return path
+
+
+def started_job(reddit_id, age=0.0):
+    """A job that fetched its thread, as main() leaves it after the reddit stage."""
+    manifest = JobManifest(reddit_id)
+    manifest.record("reddit", {"thread_id": reddit_id})
+    mtime = time.time() - age
+    os.utime(manifest.path, (mtime, mtime))
+    return manifest
+
+
+def test_completed_stages_are_skipped_when_resumed(workdir):
+    calls = []
+
+    def tts():
+        calls.append("tts")
+        write("assets/temp/abc/mp3/title.mp3")
+        return 42
+
+    JobManifest("abc").checkpoint("tts", tts, lambda result: ["assets/temp/abc/mp3/*.mp3"])()
+    resumed = JobManifest("abc")
+
+    assert resumed.checkpoint("tts", tts)() == 42
+    assert calls == ["tts"]
+
+
+def test_a_stage_whose_files_changed_is_redone(workdir):
+    manifest = JobManifest("abc")
+    write("assets/temp/abc/mp3/title.mp3")
+    manifest.record("tts", 42, ["assets/temp/abc/mp3/*.mp3"])
+    assert manifest.completed("tts")
+
+    write("assets/temp/abc/mp3/title.mp3", b"other size")
+    assert not JobManifest("abc").completed("tts")
+    write("assets/temp/abc/mp3/title.mp3", b"datx")  # same size, other content
+    assert not JobManifest("abc").completed("tts")
+    os.remove("assets/temp/abc/mp3/title.mp3")
+    assert not JobManifest("abc").completed("tts")
+
+
+def test_finish_removes_the_temp_files(workdir):
+    manifest = started_job("abc")
+    write("assets/temp/abc/png/title.png")
+
+    assert not manifest.finish("results/missing.mp4")
+    assert Path("assets/temp/abc").is_dir()
+
+    assert manifest.finish(write("results/video.mp4"))
+    assert not Path("assets/temp/abc").exists()
+
+
+def test_find_unfinished_returns_the_most_recent_started_job(workdir):
+    started_job("old", age=60)
+    started_job("new")
+    JobManifest("not_fetched").record("background")
+    queued = started_job("queued", age=-60)
+    queued.record("enqueued")
+
+    assert find_unfinished().reddit_id == "new"
+    assert find_unfinished(exclude=["new"]).reddit_id == "old"
+    assert find_unfinished(exclude=["new", "old"]) is None
+
+
+def test_attempts_are_counted_across_runs(workdir):
+    started_job("abc").resumed()
+    JobManifest("abc").resumed()
+
+    assert JobManifest("abc").attempts == 2
+
+
+def test_jobs_resumed_too_often_are_abandoned(workdir):
+    manifest = started_job("abc")
+    for _ in range(3):
+        manifest.resumed()
+
+    assert find_unfinished(max_attempts=4).reddit_id == "abc"
+    assert find_unfinished(max_attempts=3) is None
+    # Its temp files go with it rather than waiting for the age sweep
+    assert not Path("assets/temp/abc").exists()
+    assert find_unfinished(max_attempts=0) is None
+
+
+def test_abandoned_jobs_stay_skipped(workdir):
+    manifest = started_job("abc")
+    manifest.data.update(abandoned=True)  # e.g. its files could not all be deleted
+    manifest.record("tts")
+
+    assert find_unfinished(max_attempts=0) is None
+
+
+def test_no_limit_resumes_forever(workdir):
+    manifest = started_job("abc")
+    for _ in range(10):
+        manifest.resumed()
+
+    assert find_unfinished(max_attempts=0).reddit_id == "abc"
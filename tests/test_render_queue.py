@@ -0,0 +1,145 @@
+import multiprocessing
+import sqlite3
+import time
+
+from utils.render_queue import RenderQueue
+
+
+def claim_all(path, worker, claimed):
+    queue = RenderQueue(path)
+    while (job := queue.claim(worker)) is not None:
+        claimed.put(job[0])
+
+
+def test_jobs_are_claimed_oldest_first(tmp_path):
+    queue = RenderQueue(str(tmp_path / "queue.db"))
+    first = queue.enqueue("a", {"length": 10})
+    second = queue.enqueue("b", {"length": 20})
+
+    assert queue.claim("w1") == (first, {"length": 10})
+    assert queue.claim("w2") == (second, {"length": 20})
+    assert queue.claim("w3") is None
+    assert queue.counts() == {"running": 2}
+
+
+def test_a_thread_is_queued_once_until_it_is_rendered(tmp_path):
+    queue = RenderQueue(str(tmp_path / "queue.db"))
+    job_id = queue.enqueue("a", {})
+
+    assert queue.enqueue("a", {}) is None
+    queue.claim("w1")
+    assert queue.enqueue("a", {}) is None
+    assert queue.pending_ids() == {"a"}
+
+    queue.complete(job_id)
+    assert queue.pending_ids() == set()
+    assert queue.enqueue("a", {}) is not None
+
+
+def test_failed_jobs_keep_their_error(tmp_path):
+    queue = RenderQueue(str(tmp_path / "queue.db"))
+    job_id = queue.enqueue("a", {})
+    queue.claim("w1")
+    queue.fail(job_id, "ffmpeg exited with 1")
+
+    assert queue.counts() == {"failed": 1}
+    assert queue.claim("w1") is None
+
+
+def claim_and_die(path):
+    """A worker that takes a job and dies without finishing it, e.g. killed for memory."""
+    RenderQueue(path).claim("doomed")
+
+
+def run_dying_worker(path):
+    process = multiprocessing.Process(target=claim_and_die, args=(path,))
+    process.start()
+    process.join(30)
+
+
+def test_jobs_of_dead_workers_are_requeued(tmp_path):
+    path = str(tmp_path / "queue.db")
+    queue = RenderQueue(path)
+    job_id = queue.enqueue("a", {})
+    run_dying_worker(path)
+
+    assert queue.requeue_stale() == (1, 0)
+    assert queue.claim("w2") == (job_id, {})
+
+
+def test_jobs_of_live_workers_are_left_alone(tmp_path):
+    queue = RenderQueue(str(tmp_path / "queue.db"))
+    job_id = queue.enqueue("a", {})
+    queue.claim("w1")  # this process, which is alive and just claimed it
+
+    assert RenderQueue(queue.path).requeue_stale() == (0, 0)
+    assert queue.counts() == {"running": 1}
+
+    # Until its heartbeat stops, e.g. a worker of another host that lost its network
+    assert queue.requeue_stale(stale_after=-1) == (1, 0)
+    assert queue.claim("w2") == (job_id, {})
+
+
+def test_heartbeats_keep_a_job_running(tmp_path):
+    queue = RenderQueue(str(tmp_path / "queue.db"))
+    job_id = queue.enqueue("a", {})
+    queue.claim("w1")
+    time.sleep(0.2)
+
+    queue.heartbeat(job_id)
+    assert queue.requeue_stale(stale_after=0.1) == (0, 0)
+    time.sleep(0.2)
+    assert queue.requeue_stale(stale_after=0.1) == (1, 0)
+
+
+def test_a_job_that_keeps_killing_its_worker_fails(tmp_path):
+    path = str(tmp_path / "queue.db")
+    queue = RenderQueue(path)
+    queue.enqueue("poison", {})
+    healthy = queue.enqueue("b", {})
+
+    for _ in range(2):
+        run_dying_worker(path)
+        assert queue.requeue_stale(max_attempts=3) == (1, 0)
+    run_dying_worker(path)
+    assert queue.requeue_stale(max_attempts=3) == (0, 1)
+
+    assert queue.counts() == {"failed": 1, "queued": 1}
+    assert queue.claim("w1") == (healthy, {})
+
+
+def test_queues_from_before_the_heartbeat_are_upgraded(tmp_path):
+    path = str(tmp_path / "queue.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, reddit_id TEXT NOT NULL, "
+            "payload TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'queued', attempts INTEGER NOT "
+            "NULL DEFAULT 0, worker TEXT, error TEXT, created REAL, started REAL, finished REAL)"
+        )
+        conn.execute("INSERT INTO jobs (reddit_id, payload, status) VALUES ('a', '{}', 'running')")
+    conn.close()
+
+    queue = RenderQueue(path)
+
+    # Left running by a version that didn't record heartbeats, so its worker is unknown
+    assert queue.requeue_stale() == (1, 0)
+    assert queue.claim("w1") is not None
+
+
+def test_every_job_is_claimed_by_exactly_one_process(tmp_path):
+    path = str(tmp_path / "queue.db")
+    queue = RenderQueue(path)
+    job_ids = {queue.enqueue(f"thread{i}", {"i": i}) for i in range(40)}
+
+    claimed = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=claim_all, args=(path, f"w{i}", claimed)) for i in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+
+    ids = [claimed.get(timeout=5) for _ in range(len(job_ids))]
+    assert sorted(ids) == sorted(job_ids)
+    assert claimed.empty()
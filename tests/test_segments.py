@@ -0,0 +1,36 @@
+from video_creation.overlays import OverlayClip
+from video_creation.segments import split_timeline
+
+
+def clips(*durations):
+    start = 0.0
+    result = []
+    for duration in durations:
+        result.append(OverlayClip(f"{len(result)}.png", start, duration))
+        start += duration
+    return result
+
+
+def test_parts_are_cut_between_screenshots():
+    ranges = split_timeline(clips(10, 10, 10, 10), 40, 2)
+
+    assert ranges == [(0.0, 20), (20, 40.0)]
+
+
+def test_cuts_are_the_boundaries_closest_to_even_parts():
+    ranges = split_timeline(clips(5, 20, 3, 12), 40, 2)
+
+    assert ranges == [(0.0, 25), (25, 40.0)]
+
+
+def test_parts_cover_the_whole_video_without_gaps():
+    ranges = split_timeline(clips(3, 7, 2, 9, 4, 6, 5), 36, 4)
+
+    assert ranges[0][0] == 0 and ranges[-1][1] == 36
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+    assert all(start < end for start, end in ranges)
+
+
+def test_fewer_parts_when_there_are_few_screenshots():
+    assert split_timeline(clips(30), 30, 4) == [(0.0, 30.0)]
+    assert len(split_timeline(clips(10, 20), 30, 4)) == 2
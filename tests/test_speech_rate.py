@@ -0,0 +1,69 @@
+import pytest
+
+from TTS.speech_rate import DEFAULT_OVERHEAD_S, DEFAULT_SECONDS_PER_CHAR, SpeechRateModel
+from utils import settings
+
+
+class TikTok:
+    pass
+
+
+@pytest.fixture
+def tts_config(workdir, monkeypatch):
+    config = {"random_voice": False, "tiktok_voice": "en_us_001"}
+    monkeypatch.setattr(settings, "config", {"settings": {"tts": config}}, raising=False)
+    return config
+
+
+def test_the_default_rate_is_used_until_enough_clips(tts_config):
+    model = SpeechRateModel(TikTok())
+    model.observe(100, 20.0)
+
+    assert model.coefficients() == (DEFAULT_OVERHEAD_S, DEFAULT_SECONDS_PER_CHAR)
+
+
+def test_the_fit_finds_the_overhead_and_the_rate(tts_config):
+    model = SpeechRateModel(TikTok())
+    for characters in (20, 50, 100, 150, 300):
+        model.observe(characters, 0.5 + characters / 12)
+
+    overhead, per_char = model.coefficients()
+    assert overhead == pytest.approx(0.5)
+    assert per_char == pytest.approx(1 / 12)
+    assert model.estimate(120, clips=3) == pytest.approx(1.5 + 10)
+
+
+def test_clips_of_the_same_length_use_the_average_rate(tts_config):
+    model = SpeechRateModel(TikTok())
+    for _ in range(5):
+        model.observe(100, 8.0)
+
+    assert model.coefficients() == (0.0, pytest.approx(0.08))
+
+
+def test_models_are_saved_per_voice(tts_config):
+    model = SpeechRateModel(TikTok())
+    for characters in (20, 50, 100, 150, 300):
+        model.observe(characters, characters / 10)
+    model.save()
+
+    assert SpeechRateModel(TikTok()).estimate(100) == pytest.approx(10)
+    tts_config["tiktok_voice"] = "en_us_006"
+    assert SpeechRateModel(TikTok()).sums["n"] == 0
+    tts_config["random_voice"] = True
+    assert SpeechRateModel(TikTok()).key == "TikTok:random"
+
+
+def test_models_saving_at_the_same_time_add_up_their_clips(tts_config):
+    first, second = SpeechRateModel(TikTok()), SpeechRateModel(TikTok())
+    for characters in (20, 50, 100):
+        first.observe(characters, characters / 10)
+    for characters in (150, 300):
+        second.observe(characters, characters / 10)
+    first.save()
+    second.save()
+
+    assert SpeechRateModel(TikTok()).sums["n"] == 5
+    assert SpeechRateModel(TikTok()).estimate(100) == pytest.approx(10)
+    second.save()  # nothing new to add
+    assert SpeechRateModel(TikTok()).sums["n"] == 5
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from utils.stages import JobCancelled, StageLimits, StageScheduler
+
+
+def stage(name, log, delay=0.0):
+    def run(results):
+        log.append(("start", name, sorted(results)))
+        time.sleep(delay)
+        log.append(("end", name))
+        return name.upper()
+
+    return run
+
+
+@pytest.mark.parametrize("parallel", [True, False])
+def test_stages_see_the_results_of_their_dependencies(parallel):
+    log = []
+    scheduler = StageScheduler(parallel=parallel)
+    scheduler.add("reddit", stage("reddit", log))
+    scheduler.add("tts", stage("tts", log), after=["reddit"])
+    scheduler.add("background", stage("background", log), after=["reddit"])
+    scheduler.add("render", stage("render", log), after=["tts", "background"])
+
+    results = scheduler.run()
+
+    assert results == {
+        "reddit": "REDDIT",
+        "tts": "TTS",
+        "background": "BACKGROUND",
+        "render": "RENDER",
+    }
+    assert ("start", "render", ["background", "reddit", "tts"]) in log
+    assert log.index(("end", "reddit")) < log.index(("start", "tts", ["reddit"]))
+
+
+def test_sequential_stages_run_in_the_order_they_were_added():
+    log = []
+    scheduler = StageScheduler(parallel=False)
+    for name in ("a", "b", "c"):
+        scheduler.add(name, stage(name, log))
+
+    scheduler.run()
+
+    assert [entry[1] for entry in log if entry[0] == "start"] == ["a", "b", "c"]
+
+
+def test_independent_stages_overlap():
+    both_started = threading.Barrier(2, timeout=5)
+    scheduler = StageScheduler(parallel=True)
+    scheduler.add("tts", lambda results: both_started.wait())
+    scheduler.add("background", lambda results: both_started.wait())
+
+    scheduler.run()  # the barrier breaks if the stages run one after another
+
+
+def test_unknown_and_duplicate_stages_are_rejected():
+    scheduler = StageScheduler()
+    scheduler.add("a", lambda results: None)
+    with pytest.raises(ValueError):
+        scheduler.add("b", lambda results: None, after=["missing"])
+    with pytest.raises(ValueError):
+        scheduler.add("a", lambda results: None)
+
+
+def test_an_error_waits_for_running_stages_and_cancels_pending_ones():
+    log = []
+    started = threading.Event()
+
+    def fail(results):
+        started.wait(5)
+        raise RuntimeError("tts failed")
+
+    def slow(results):
+        started.set()
+        time.sleep(0.2)
+        log.append("background finished")
+
+    scheduler = StageScheduler(parallel=True)
+    scheduler.add("tts", fail)
+    scheduler.add("background", slow)
+    scheduler.add("render", lambda results: log.append("render ran"), after=["tts"])
+
+    with pytest.raises(RuntimeError, match="tts failed"):
+        scheduler.run()
+
+    # The running stage returned before the error reached the caller, the dependent one never ran
+    assert log == ["background finished"]
+
+
+def test_limits_are_shared_between_schedulers():
+    limits = StageLimits({"render": 1})
+    running = []
+    overlapped = []
+
+    def render(results):
+        running.append(1)
+        overlapped.append(len(running) > 1)
+        time.sleep(0.05)
+        running.pop()
+
+    threads = []
+    for _ in range(3):
+        scheduler = StageScheduler(limits=limits)
+        scheduler.add("render", render)
+        threads.append(threading.Thread(target=scheduler.run))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlapped == [False, False, False]
+
+
+@pytest.mark.parametrize("parallel", [True, False])
+def test_cancelled_jobs_stop_before_their_next_stage(parallel):
+    cancel = threading.Event()
+    log = []
+    scheduler = StageScheduler(parallel=parallel, cancel=cancel)
+    scheduler.add("tts", lambda results: (log.append("tts"), cancel.set()))
+    scheduler.add("render", lambda results: log.append("render"), after=["tts"])
+
+    with pytest.raises(JobCancelled):
+        scheduler.run()
+
+    assert log == ["tts"]
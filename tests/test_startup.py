@@ -0,0 +1,22 @@
+import subprocess
+import sys
+
+import pytest
+
+from benchmark import REPO, STARTUP_BUDGET_S, measure_startup
+
+pytest.importorskip("prawcore")  # main.py imports it for its error handling
+
+HEAVY_MODULES = ["moviepy", "numpy", "PIL", "playwright", "praw", "spacy", "torch", "translators"]
+
+
+def test_main_imports_within_the_budget():
+    assert measure_startup() <= STARTUP_BUDGET_S
+
+
+def test_main_leaves_the_heavy_modules_to_the_stages():
+    code = f"import sys, main; print('loaded:', *[m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO, capture_output=True, text=True, check=True
+    )
+    assert result.stdout.splitlines()[-1].split() == ["loaded:"]  # main.py prints a banner
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+from requests import Response
+
+from utils.voice import TokenBucket, pack_text
+
+TEXT = (
+    "My neighbour keeps parking in front of my garage. I asked him nicely twice, then left a "
+    "note on his windshield, and he still does it every single day! What would you do? "
+    "Supercalifragilisticexpialidocious."
+)
+
+
+def test_short_texts_are_one_chunk():
+    assert pack_text("Hello there. How are you?", 100) == ["Hello there. How are you?"]
+    assert pack_text("", 100) == []
+
+
+def test_chunks_are_filled_with_whole_sentences():
+    assert pack_text("One two. Three four. Five six. Seven eight.", 20) == [
+        "One two. Three four.",
+        "Five six.",
+        "Seven eight.",
+    ]
+
+
+def test_long_sentences_are_cut_between_clauses_then_words():
+    assert pack_text("A very long sentence, with two clauses that are long. Short.", 30) == [
+        "A very long sentence, with two",
+        "clauses that are long. Short.",
+    ]
+    assert pack_text("abcdefghijklmnop qr", 5) == ["abcde", "fghij", "klmno", "p qr"]
+
+
+@pytest.mark.parametrize("max_chars", [10, 25, 60, 300])
+def test_chunks_fit_and_keep_every_word(max_chars):
+    chunks = pack_text(TEXT, max_chars)
+
+    assert all(len(chunk) <= max_chars for chunk in chunks)
+    assert "".join("".join(chunks).split()) == "".join(TEXT.split())
+
+
+def response(status: int, **headers) -> Response:
+    result = Response()
+    result.status_code = status
+    result.headers.update({name.replace("_", "-"): value for name, value in headers.items()})
+    return result
+
+
+def timed_acquires(bucket: TokenBucket, count: int) -> float:
+    started = time.monotonic()
+    for _ in range(count):
+        bucket.acquire()
+    return time.monotonic() - started
+
+
+def test_the_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=20, capacity=3)
+
+    assert timed_acquires(bucket, 3) < 0.03
+    assert timed_acquires(bucket, 4) == pytest.approx(0.2, abs=0.05)
+
+
+def test_the_rate_is_shared_between_threads():
+    bucket = TokenBucket(rate=20, capacity=1)
+    bucket.acquire()
+    started = time.monotonic()
+    threads = [threading.Thread(target=timed_acquires, args=(bucket, 2)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert time.monotonic() - started == pytest.approx(0.3, abs=0.07)
+
+
+def test_a_limited_response_pauses_until_the_reset():
+    bucket = TokenBucket(rate=100, capacity=5)
+
+    assert bucket.update(response(200, X_RateLimit_Remaining="4"))
+    assert not bucket.update(response(429, X_RateLimit_Reset=str(time.time() + 0.2)))
+    assert timed_acquires(bucket, 1) == pytest.approx(0.2, abs=0.05)
+
+
+def test_the_last_allowed_request_pauses_without_retrying():
+    bucket = TokenBucket(rate=100, capacity=5, pause=0.1)
+
+    assert bucket.update(response(200, X_RateLimit_Remaining="0"))
+    assert timed_acquires(bucket, 1) == pytest.approx(0.1, abs=0.05)
+
+
+def test_pause_until_holds_every_request():
+    bucket = TokenBucket(rate=100, capacity=5)
+    bucket.pause_until(time.time() + 0.15, "Connection failed")
+
+    assert timed_acquires(bucket, 1) == pytest.approx(0.15, abs=0.05)
@@ -0,0 +1,90 @@
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from utils import settings
+from utils.render_queue import RenderQueue
+from utils.workspace import Workspace, WorkspaceQuotaExceeded, sweep_workspaces
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def workspace_config(workdir, monkeypatch):
+    config = {"temp_root": "", "job_quota_mb": 0, "total_quota_mb": 0, "max_age_hours": 1}
+    monkeypatch.setattr(settings, "config", {"settings": {"workspace": config}}, raising=False)
+    return config
+
+
+def age(path, hours):
+    mtime = time.time() - hours * 60 * 60
+    os.utime(path, (mtime, mtime))
+
+
+def test_workspaces_in_a_temp_root_are_linked(workspace_config, tmp_path):
+    workspace_config["temp_root"] = str(tmp_path / "shm")
+    workspace = Workspace("abc").create()
+
+    assert workspace.path.is_symlink()
+    (workspace.path / "audio.wav").write_bytes(b"x" * 10)
+    assert (tmp_path / "shm" / "abc" / "audio.wav").is_file()
+
+    assert workspace.remove() == 10
+    assert not workspace.path.exists() and not workspace.path.is_symlink()
+    assert not (tmp_path / "shm" / "abc").exists()
+
+
+def test_the_job_quota_is_enforced(workspace_config):
+    workspace_config["job_quota_mb"] = 1
+    workspace = Workspace("abc").create()
+    stage = workspace.guard(lambda: (workspace.path / "big").write_bytes(b"x" * (MB + 1)))
+
+    with pytest.raises(WorkspaceQuotaExceeded):
+        stage()
+
+
+def test_sweep_removes_only_stale_workspaces(workspace_config):
+    stale = Workspace("stale").create().path
+    (stale / "audio.wav").write_bytes(b"x" * 100)
+    age(stale, 2)
+    fresh = Workspace("fresh").create().path
+
+    assert sweep_workspaces() == 100
+    assert not stale.exists()
+    assert fresh.is_dir()
+
+
+def test_sweep_keeps_the_workspaces_of_queued_renders(workspace_config, tmp_path):
+    queue = RenderQueue(str(tmp_path / "queue.db"))
+    queue.enqueue("queued", {})
+    queued = Workspace("queued").create().path
+    age(queued, 2)
+    done = Workspace("done").create().path
+    queue.complete(queue.enqueue("done", {}))
+    age(done, 2)
+
+    sweep_workspaces(queue.path)
+
+    assert queued.is_dir()
+    assert not done.exists()
+
+
+def test_sweep_removes_links_to_a_wiped_temp_root(workspace_config, tmp_path):
+    workspace_config["temp_root"] = str(tmp_path / "shm")
+    link = Workspace("abc").create().path
+    (tmp_path / "shm" / "abc").rmdir()  # e.g. a reboot cleared the tmpfs
+
+    sweep_workspaces()
+
+    assert not link.is_symlink()
+
+
+def test_sweep_is_off_without_a_max_age(workspace_config):
+    workspace_config["max_age_hours"] = 0
+    stale = Workspace("stale").create().path
+    age(stale, 100)
+
+    assert sweep_workspaces() == 0
+    assert Path(stale).is_dir()
@@ -32,15 +32,17 @@ def upload_reel(cl, video_path, description):
     except Exception as e:
         print(f"Failed to upload reel: {e}")
 
-def main():
+def load_credentials():
     # Load configuration
     config = configparser.ConfigParser()
     script_dir = os.path.dirname(os.path.abspath(__file__))
     config.read(os.path.join(script_dir, 'instagram_creds.conf'))  # Updated to use .conf file
 
     # Retrieve username and password from config file
-    username = config['instagram']['username']
-    password = config['instagram']['password']
+    return config['instagram']['username'], config['instagram']['password']
+
+def main():
+    username, password = load_credentials()
 
     # Set up command-line argument parsing
     parser = argparse.ArgumentParser(description="Upload an Instagram Reel from video source.")
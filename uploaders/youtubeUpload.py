@@ -35,9 +35,10 @@ def get_authenticated_service():
 
     return build("youtube", "v3", credentials=credentials)
 
-def upload_video(youtube, video_file, description):
+def upload_video(youtube, video_file, description, title=None):
 
-    title, _ = os.path.splitext(os.path.basename(video_file))
+    if title is None:
+        title, _ = os.path.splitext(os.path.basename(video_file))
     sanitized_title = re.sub(r'[^\x00-\x7F]+', '', title)
     print("Uploading: "+ sanitized_title)
 
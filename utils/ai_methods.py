@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 import numpy as np
 import torch
 from transformers import AutoModel, AutoTokenizer
@@ -12,11 +14,17 @@ def mean_pooling(model_output, attention_mask):
     )
 
 
-# This function sort the given threads based on their total similarity with the given keywords
-def sort_by_similarity(thread_objects, keywords):
-    # Initialize tokenizer + model.
+@lru_cache(maxsize=1)
+def load_model():
+    # Loaded once per process, the daemon sorts threads for every video
     tokenizer = AutoTokenizer.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
     model = AutoModel.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
+    return tokenizer, model
+
+
+# This function sort the given threads based on their total similarity with the given keywords
+def sort_by_similarity(thread_objects, keywords):
+    tokenizer, model = load_model()
 
     # Transform the generator to a list of Submission Objects, so we can sort later based on context similarity to
     # keywords
@@ -1,20 +1,37 @@
 import os
 import shutil
-from os.path import exists
+from pathlib import Path
 
 
 def _listdir(d):  # listdir with full path
     return [os.path.join(d, f) for f in os.listdir(d)]
 
 
+def dir_size(directory) -> int:
+    """Total size in bytes of the files under the directory"""
+    total = 0
+    for root, _, files in os.walk(directory):
+        for file in files:
+            try:
+                total += os.lstat(os.path.join(root, file)).st_size
+            except OSError:  # deleted meanwhile
+                pass
+    return total
+
+
 def cleanup(reddit_id) -> int:
-    """Deletes all temporary assets in assets/temp
+    """Deletes all temporary assets in assets/temp/<reddit_id>, and the directory it links to
+    when the workspace was placed on another disk (see utils/workspace.py)
 
     Returns:
-        int: How many files were deleted
+        int: How many bytes were freed
     """
-    directory = f"../assets/temp/{reddit_id}/"
-    if exists(directory):
-        shutil.rmtree(directory)
-
-        return 1
+    link = Path(f"assets/temp/{reddit_id}")
+    if not link.is_symlink() and not link.exists():
+        return 0
+    directory = link.resolve()
+    freed = dir_size(directory)
+    shutil.rmtree(directory, ignore_errors=True)
+    if link.is_symlink():
+        link.unlink()
+    return freed
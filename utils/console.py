@@ -1,14 +1,19 @@
 import re
+import threading
 
 from rich.columns import Columns
 from rich.console import Console
 from rich.markdown import Markdown
 from rich.padding import Padding
 from rich.panel import Panel
+from rich.progress import track as rich_track
 from rich.text import Text
 
 console = Console()
 
+# rich only allows one live display at a time, stages running in parallel share this one
+_progress_lock = threading.Lock()
+
 
 def print_markdown(text) -> None:
     """Prints a rich info message. Support Markdown syntax."""
@@ -35,6 +40,18 @@ def print_substep(text, style="") -> None:
     console.print(text, style=style)
 
 
+def track(sequence, description="Working...", **kwargs):
+    """rich.progress.track, but falls back to a plain iterator while another progress bar is shown."""
+    if not _progress_lock.acquire(blocking=False):
+        console.print(description, style="dim")
+        yield from sequence
+        return
+    try:
+        yield from rich_track(sequence, description, **kwargs)
+    finally:
+        _progress_lock.release()
+
+
 def handle_input(
     message: str = "",
     check_type=False,
@@ -0,0 +1,70 @@
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict
+
+from utils import settings
+
+# Next to this module, so the profiles are found whatever the working directory, e.g. the
+# sandbox of benchmark.py
+PROFILES_PATH = Path(__file__).with_name("encoder_profiles.json")
+
+
+@lru_cache(maxsize=None)
+def load_encoder_profiles() -> Dict[str, dict]:
+    with open(PROFILES_PATH) as json_file:
+        profiles = json.load(json_file)
+    # Remove "__comment" from the profiles
+    del profiles["__comment"]
+    return profiles
+
+
+def encoder_profile(purpose: str = "profile") -> str:
+    """Name of the profile configured for the purpose, "profile" for the videos in results/ and
+    "intermediate_profile" for the temp files that are encoded again later."""
+    return settings.config["settings"]["encoding"][purpose]
+
+
+def encoder_args(profile: str, threads: int = None, audio: bool = True) -> dict:
+    """The ffmpeg output options of an encoder profile from utils/encoder_profiles.json.
+
+    Args:
+        profile (str): Name of the profile, e.g. "shorts"
+        threads (int, optional): ffmpeg threads. Defaults to ffmpeg's choice.
+        audio (bool): Whether the output has an audio stream to encode
+
+    Returns:
+        dict: Keyword arguments for ffmpeg.output
+    """
+    profiles = load_encoder_profiles()
+    if profile not in profiles:
+        raise ValueError(f"Unknown encoder profile {profile!r}, expected one of {list(profiles)}")
+    options = profiles[profile]
+    args = {"c:v": options["codec"], "pix_fmt": options["pix_fmt"]}
+    if options.get("preset"):
+        args["preset"] = options["preset"]
+    if options.get("crf") is not None:
+        args["crf"] = options["crf"]
+    elif options.get("bitrate"):
+        args["b:v"] = options["bitrate"]
+    if options.get("maxrate"):
+        args.update(maxrate=options["maxrate"], bufsize=options.get("bufsize", options["maxrate"]))
+    if options.get("gop"):
+        args["g"] = options["gop"]
+    if options.get("faststart"):
+        args["movflags"] = "+faststart"
+    if audio:
+        args.update({"c:a": options["audio_codec"], "b:a": options["audio_bitrate"]})
+    if threads:
+        args["threads"] = threads
+    return args
+
+
+def mux_args(profile: str) -> dict:
+    """ffmpeg output options to add the audio to a video already encoded with the profile,
+    copying the video stream."""
+    args = encoder_args(profile)
+    muxed = {"c:v": "copy", "c:a": args["c:a"], "b:a": args["b:a"]}
+    if "movflags" in args:
+        muxed["movflags"] = args["movflags"]
+    return muxed
@@ -1,9 +1,14 @@
 import os
+import shutil
 import subprocess
 import zipfile
 
 import requests
 
+from utils import ttl_cache
+
+FFMPEG_CHECK_TTL = 7 * 24 * 60 * 60  # seconds
+
 
 def ffmpeg_install_windows():
     try:
@@ -102,6 +107,10 @@ def ffmpeg_install_mac():
 
 
 def ffmpeg_install():
+    # Skip the check while the ffmpeg found last time is still the one on the PATH
+    ffmpeg_path = shutil.which("ffmpeg")
+    if ffmpeg_path is not None and ttl_cache.load("ffmpeg_path", FFMPEG_CHECK_TTL) == ffmpeg_path:
+        return None
     try:
         # Try to run the FFmpeg command
         subprocess.run(
@@ -139,4 +148,6 @@ def ffmpeg_install():
             "Welcome fellow traveler! You're one of the few who have made it this far. We have no idea how you got at this error, but we're glad you're here. Please report this error to the developer, and we'll try to fix it as soon as possible. Thank you for your patience!"
         )
         print(e)
+    else:
+        ttl_cache.save("ffmpeg_path", shutil.which("ffmpeg"))
     return None
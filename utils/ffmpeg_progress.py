@@ -0,0 +1,283 @@
+import glob
+import json
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import ffmpeg
+
+from utils.metrics import annotate_stage
+from utils.stages import JobCancelled
+
+__all__ = [
+    "RenderProgress",
+    "StatusFile",
+    "read_status",
+    "subscribe",
+    "unsubscribe",
+    "run_ffmpeg",
+    "run_with_progress",
+    "terminate_ffmpeg",
+]
+
+STATUS_DIR = "video_creation/data/render_status"
+# How often the status file is rewritten while ffmpeg runs
+STATUS_INTERVAL_S = 1.0
+# Status files not rewritten for this long belong to a process that died
+STATUS_STALE_S = 60.0
+
+
+class RenderProgress(NamedTuple):
+    """One progress report of an ffmpeg run, as written to -progress."""
+
+    name: str
+    frame: int
+    fps: float
+    speed: Optional[float]  # times realtime, None until ffmpeg knows it
+    bitrate_kbps: Optional[float]
+    out_time_s: float
+    duration_s: float
+    elapsed_s: float
+    done: bool
+    job: str = ""  # e.g. the reddit id of the video
+
+    @property
+    def percent(self) -> float:
+        if self.done:
+            return 100.0
+        return min(100.0, 100 * self.out_time_s / self.duration_s) if self.duration_s else 0.0
+
+    @property
+    def eta_s(self) -> Optional[float]:
+        """Seconds until the run is done, at the speed it had so far."""
+        if self.done:
+            return 0.0
+        if not self.out_time_s or not self.duration_s:
+            return None
+        return max(0.0, self.duration_s - self.out_time_s) * self.elapsed_s / self.out_time_s
+
+
+# Called with every report of every run, e.g. by a GUI
+_listeners: List[Callable[[RenderProgress], None]] = []
+
+
+def subscribe(listener: Callable[[RenderProgress], None]) -> None:
+    _listeners.append(listener)
+
+
+def unsubscribe(listener: Callable[[RenderProgress], None]) -> None:
+    _listeners.remove(listener)
+
+
+class StatusFile:
+    """Writes the last report of every running render to a JSON file, for the GUI or a daemon.
+
+    Every process writes its own file, <directory>/<pid>.json, so the render farm workers don't
+    overwrite each other's reports, see read_status. The file maps "<job>/<name>" to the report,
+    with its percent and ETA, and is rewritten at most once every STATUS_INTERVAL_S, and whenever
+    a run ends. Finished runs are dropped the next time the file is written, so it only lists
+    what is rendering.
+
+    Args:
+        directory (str): Where to write the JSON file
+    """
+
+    def __init__(self, directory: str = STATUS_DIR):
+        self.directory = directory
+        self.running: Dict[str, dict] = {}
+        self.written = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        # Looked up on every write, the workers forked by the render farm inherit the instance
+        return os.path.join(self.directory, f"{os.getpid()}.json")
+
+    def __call__(self, progress: RenderProgress) -> None:
+        with self._lock:
+            self.running = {key: run for key, run in self.running.items() if not run["done"]}
+            self.running[f"{progress.job}/{progress.name}"] = {
+                **progress._asdict(),
+                "percent": round(progress.percent, 1),
+                "eta_s": None if progress.eta_s is None else round(progress.eta_s, 1),
+                "updated": time.time(),
+            }
+            if not progress.done and time.monotonic() - self.written < STATUS_INTERVAL_S:
+                return
+            self.written = time.monotonic()
+            os.makedirs(self.directory, exist_ok=True)
+            # Readers never see half a file
+            path = self.path
+            with open(f"{path}.part", "w", encoding="utf-8") as f:
+                json.dump(self.running, f, indent=2)
+            os.replace(f"{path}.part", path)
+
+
+def read_status(directory: str = STATUS_DIR) -> Dict[str, dict]:
+    """Merges the status files of every process, leaving out those not written for
+    STATUS_STALE_S, whose process died before it could drop its runs."""
+    status = {}
+    for entry in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        try:
+            if time.time() - os.path.getmtime(entry) > STATUS_STALE_S:
+                continue
+            with open(entry, "r", encoding="utf-8") as f:
+                status.update(json.load(f))
+        except (OSError, ValueError):  # removed or replaced meanwhile
+            continue
+    return status
+
+
+# The ffmpeg processes of the running jobs, see terminate_ffmpeg
+_processes: Set[subprocess.Popen] = set()
+_processes_lock = threading.Lock()
+
+
+@contextmanager
+def _tracked(process: subprocess.Popen):
+    with _processes_lock:
+        _processes.add(process)
+    try:
+        yield process
+    finally:
+        with _processes_lock:
+            _processes.discard(process)
+
+
+def _check(process: subprocess.Popen, stdout: Optional[bytes], stderr: Optional[bytes]) -> None:
+    if process.returncode:
+        if getattr(process, "cancelled", False):
+            raise JobCancelled("ffmpeg was stopped")
+        raise ffmpeg.Error("ffmpeg", stdout, stderr)
+
+
+def terminate_ffmpeg() -> int:
+    """Stops every ffmpeg process started by run_ffmpeg or run_with_progress, e.g. when a batch
+    is cancelled. They raise JobCancelled instead of ffmpeg.Error.
+
+    Returns:
+        int: How many processes were stopped
+    """
+    with _processes_lock:
+        processes = list(_processes)
+    for process in processes:
+        process.cancelled = True
+        process.terminate()
+    return len(processes)
+
+
+def run_ffmpeg(
+    output, capture_stdout: bool = False, capture_stderr: bool = False, quiet: bool = False
+) -> Tuple[Optional[bytes], Optional[bytes]]:
+    """ffmpeg-python's run, with the process stopped by terminate_ffmpeg.
+
+    Raises:
+        ffmpeg.Error: If ffmpeg failed
+        JobCancelled: If ffmpeg was stopped by terminate_ffmpeg
+    """
+    process = output.run_async(
+        pipe_stdout=capture_stdout, pipe_stderr=capture_stderr, quiet=quiet
+    )
+    with _tracked(process):
+        stdout, stderr = process.communicate()
+    _check(process, stdout, stderr)
+    return stdout, stderr
+
+
+def _number(value: Optional[str], suffix: str = "") -> Optional[float]:
+    # ffmpeg writes N/A until it has a value, e.g. bitrate=N/A or speed=N/A
+    try:
+        return float(value.strip().removesuffix(suffix))
+    except (AttributeError, ValueError):
+        return None
+
+
+def _report(
+    block: dict, name: str, duration: float, started: float, job: str
+) -> RenderProgress:
+    # out_time_ms is in microseconds as well, older ffmpeg versions only write that one
+    out_time_us = _number(block.get("out_time_us")) or _number(block.get("out_time_ms")) or 0
+    return RenderProgress(
+        name=name,
+        frame=int(_number(block.get("frame")) or 0),
+        fps=_number(block.get("fps")) or 0.0,
+        speed=_number(block.get("speed"), "x"),
+        bitrate_kbps=_number(block.get("bitrate"), "kbits/s"),
+        out_time_s=max(0.0, out_time_us / 1e6),
+        duration_s=duration,
+        elapsed_s=time.perf_counter() - started,
+        done=block.get("progress") == "end",
+        job=job,
+    )
+
+
+def run_with_progress(
+    output,
+    name: str,
+    duration: float,
+    callback: Optional[Callable[[RenderProgress], None]] = None,
+    job: str = "",
+) -> bytes:
+    """Runs an ffmpeg-python output, reading its progress from -progress pipe:1.
+
+    Every report goes to the callback and to the subscribed listeners as soon as ffmpeg writes
+    it. Once done, the encode speed is added to the metrics of the running stage as
+    <name>_encode.
+
+    Args:
+        output: The ffmpeg-python output to run, it must not write to stdout
+        name (str): What ffmpeg is doing, e.g. "render"
+        duration (float): Length of the output in seconds, for the percentage and the ETA
+        callback (Callable, optional): Called with every RenderProgress of this run
+        job (str, optional): Which video is rendered, e.g. its reddit id
+
+    Returns:
+        bytes: ffmpeg's stderr
+
+    Raises:
+        ffmpeg.Error: If ffmpeg failed
+        JobCancelled: If ffmpeg was stopped by terminate_ffmpeg
+    """
+    started = time.perf_counter()
+    process = output.global_args("-progress", "pipe:1", "-nostats").run_async(
+        pipe_stdout=True, pipe_stderr=True
+    )
+    # stderr has to be read meanwhile, ffmpeg blocks once the pipe is full
+    stderr_chunks: List[bytes] = []
+    drain = threading.Thread(
+        target=lambda: stderr_chunks.append(process.stderr.read()), name=f"{name}-stderr"
+    )
+    drain.start()
+
+    block: dict = {}
+    last: Optional[RenderProgress] = None
+    with _tracked(process):
+        for line in process.stdout:
+            key, _, value = line.decode("utf-8", errors="replace").strip().partition("=")
+            block[key] = value
+            if key == "progress":  # the last line of each report
+                last = _report(block, name, duration, started, job)
+                block = {}
+                for listener in ([callback] if callback else []) + _listeners:
+                    listener(last)
+        process.wait()
+    drain.join()
+    stderr = b"".join(stderr_chunks)
+    _check(process, None, stderr)
+
+    if last is not None:
+        elapsed = time.perf_counter() - started
+        annotate_stage(
+            **{
+                f"{name}_encode": {
+                    "frames": last.frame,
+                    "fps": round(last.frame / elapsed, 1) if elapsed else None,
+                    "speed": round(last.out_time_s / elapsed, 2) if elapsed else None,
+                    "bitrate_kbps": last.bitrate_kbps,
+                }
+            }
+        )
+    return stderr
@@ -0,0 +1,81 @@
+"""Local stand-in for the Groq chat completions endpoint.
+
+Echoes the user message back as the "cleaned" story, optionally after a delay, so the AI cleanup
+(cache, timeout and fallback) can be exercised without network access or an API key.
+
+Usage:
+    python -m utils.groq_stub --port 8765 --delay 0
+    then set ai.groq_api_url = "http://127.0.0.1:8765/openai/v1/chat/completions"
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class GroqStubHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    status = 200
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            request = {}
+        if self.delay:
+            time.sleep(self.delay)
+
+        story = next(
+            (m["content"] for m in request.get("messages", []) if m.get("role") == "user"), ""
+        )
+        self.server.requests_served += 1
+        body = json.dumps(
+            {
+                "model": request.get("model", ""),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": story}}],
+            }
+        ).encode("utf-8")
+        self.send_response(self.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # keep the console quiet
+        pass
+
+
+def serve(port: int = 0, delay: float = 0.0, status: int = 200) -> ThreadingHTTPServer:
+    """Starts the stub in a background thread and returns the server.
+
+    Pass port 0 to get a free port, read it back from server.server_address[1].
+    Call server.shutdown() when done.
+    """
+    handler = type("Handler", (GroqStubHandler,), {"delay": delay, "status": status})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.requests_served = 0
+    threading.Thread(target=server.serve_forever, name="groq-stub", daemon=True).start()
+    return server
+
+
+def url_of(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/openai/v1/chat/completions"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Groq chat endpoint.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait per request")
+    parser.add_argument("--status", type=int, default=200, help="HTTP status to answer with")
+    args = parser.parse_args()
+
+    stub = serve(args.port, args.delay, args.status)
+    print(f"Groq stub listening on {url_of(stub)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.shutdown()
@@ -0,0 +1,187 @@
+import glob
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Optional
+
+from utils.cleanup import cleanup
+from utils.console import print_step, print_substep
+
+MANIFEST_NAME = "manifest.json"
+
+
+def sha256_of(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class JobManifest:
+    """Checkpoints of a video job, kept in assets/temp/<id>/manifest.json.
+
+    Every completed stage is recorded with its result and the files it produced (with their
+    size and sha256). A stage counts as completed only while all of its files still match, so
+    re-running the same thread skips the stages that already succeeded and redoes the rest.
+
+    Args:
+        reddit_id (str): The sanitized reddit id of the job
+    """
+
+    def __init__(self, reddit_id: str):
+        self.reddit_id = reddit_id
+        self.path = Path(f"assets/temp/{reddit_id}/{MANIFEST_NAME}")
+        self._lock = threading.Lock()  # stages finish concurrently
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {"reddit_id": reddit_id, "created": time.time(), "stages": {}}
+
+    @property
+    def finished(self) -> bool:
+        return bool(self.data.get("finished"))
+
+    @property
+    def attempts(self) -> int:
+        """How many times the job was resumed."""
+        return int(self.data.get("attempts", 0))
+
+    @property
+    def abandoned(self) -> bool:
+        return bool(self.data.get("abandoned"))
+
+    def resumed(self) -> None:
+        with self._lock:
+            self.data["attempts"] = self.attempts + 1
+            self._save()
+
+    def abandon(self, reason: str) -> None:
+        """Marks the job so it isn't resumed anymore and deletes its temp files. The mark keeps
+        it skipped if some of them can't be deleted, e.g. a file still open on Windows."""
+        with self._lock:
+            self.data.update(abandoned=True, abandoned_reason=reason)
+            self._save()
+        print_substep(f"Giving up on the unfinished video {self.reddit_id}: {reason}", "bold red")
+        freed = cleanup(self.reddit_id)
+        print_substep(f"Removed {freed / 1024 / 1024:.1f} MB of temporary files 🗑")
+
+    def completed(self, stage: str) -> bool:
+        """Whether the stage was recorded and all of its output files are still intact."""
+        record = self.data["stages"].get(stage)
+        if record is None:
+            return False
+        for output in record["outputs"]:
+            file = Path(output["path"])
+            if not file.is_file() or file.stat().st_size != output["size"]:
+                return False
+            if sha256_of(output["path"]) != output["sha256"]:
+                return False
+        return True
+
+    def result(self, stage: str) -> Any:
+        return self.data["stages"][stage]["result"]
+
+    def record(self, stage: str, result: Any = None, outputs: Iterable[str] = ()) -> None:
+        """Marks a stage as completed.
+
+        Args:
+            stage (str): Name of the stage
+            result (Any): JSON serializable value returned when the stage is skipped later
+            outputs (Iterable[str]): Files or glob patterns of the files the stage produced
+        """
+        files = sorted({file for pattern in outputs for file in glob.glob(pattern)})
+        entry = {
+            "result": result,
+            "outputs": [
+                {"path": file, "size": Path(file).stat().st_size, "sha256": sha256_of(file)}
+                for file in files
+            ],
+            "time": time.time(),
+        }
+        with self._lock:
+            self.data["stages"][stage] = entry
+            self._save()
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=4)
+        tmp_path.replace(self.path)
+
+    def checkpoint(
+        self,
+        stage: str,
+        func: Callable[..., Any],
+        outputs: Callable[[Any], Iterable[str]] = lambda result: (),
+    ) -> Callable[..., Any]:
+        """Wraps a stage so it is skipped when already completed and recorded when it succeeds.
+
+        Args:
+            stage (str): Name of the stage
+            func (Callable): The stage itself
+            outputs (Callable): Returns the files or glob patterns produced, given the result
+        """
+
+        def run_stage(*args, **kwargs):
+            if self.completed(stage):
+                print_substep(f"Skipping {stage}, it was completed by a previous run.", "bold blue")
+                return self.result(stage)
+            result = func(*args, **kwargs)
+            self.record(stage, result, outputs(result))
+            return result
+
+        return run_stage
+
+    def finish(self, final_path: str) -> bool:
+        """Records the final video and deletes the temp directory if the video checks out.
+
+        Returns:
+            bool: Whether the final video was verified and the temp files removed
+        """
+        file = Path(final_path)
+        if not file.is_file() or file.stat().st_size == 0:
+            print_substep(f"The final video {final_path} is missing, keeping the temp files.", "red")
+            return False
+        self.record("render", final_path, [glob.escape(final_path)])
+        with self._lock:
+            self.data["finished"] = True
+            self._save()
+        print_step("Removing temporary files 🗑")
+        freed = cleanup(self.reddit_id)
+        print_substep(f"Removed {freed / 1024 / 1024:.1f} MB of temporary files 🗑")
+        return True
+
+
+def find_unfinished(exclude: Iterable[str] = (), max_attempts: int = 0) -> Optional[JobManifest]:
+    """Returns the most recently updated job that was fetched but never finished, if any.
+
+    A job that was already resumed max_attempts times is abandoned instead, it most likely
+    fails the same way every time.
+
+    Args:
+        exclude (Iterable[str]): Reddit ids to ignore, e.g. jobs other workers are running
+        max_attempts (int): How many times a job may be resumed, 0 for no limit
+    """
+    exclude = set(exclude)
+    candidates: List[Path] = sorted(
+        Path("assets/temp").glob(f"*/{MANIFEST_NAME}"),
+        key=lambda path: path.stat().st_mtime,
+        reverse=True,
+    )
+    for path in candidates:
+        manifest = JobManifest(path.parent.name)
+        if manifest.reddit_id in exclude or manifest.finished or manifest.abandoned:
+            continue
+        stages = manifest.data["stages"]
+        # Jobs handed to the render queue are finished by the render farm
+        if "reddit" in stages and "enqueued" not in stages:
+            if max_attempts and manifest.attempts >= max_attempts:
+                manifest.abandon(f"it failed again after {manifest.attempts} resume(s)")
+                continue
+            return manifest
+    return None
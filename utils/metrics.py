@@ -0,0 +1,136 @@
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.profiling import StageProfiler
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_PATH = "results/metrics.jsonl"
+
+_write_lock = threading.Lock()
+# Extra fields of the stage running in each thread, see annotate_stage
+_active = threading.local()
+
+
+def _rusage() -> Dict[str, float]:
+    if resource is None:
+        return {}
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "children_cpu": children.ru_utime + children.ru_stime,
+        # ru_oublock counts 512 byte blocks written to storage, for ffmpeg & co once they exited
+        "written_blocks": own.ru_oublock + children.ru_oublock,
+        "peak_rss": own.ru_maxrss,
+        "children_peak_rss": children.ru_maxrss,
+    }
+
+
+def _rss_mb(maxrss: float) -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def annotate_stage(**fields) -> None:
+    """Adds fields to the record of the stage running in this thread, if there is one."""
+    stage_fields = getattr(_active, "fields", None)
+    if stage_fields is not None:
+        stage_fields.update(fields)
+
+
+class JobMetrics:
+    """Timings and resource usage of the stages of one video job.
+
+    Each stage records its wall time, the CPU time of the thread that ran it, the CPU time of
+    the subprocesses (ffmpeg) that exited meanwhile, the bytes written to disk and the peak RSS
+    of the bot and of its largest subprocess so far. Subprocess CPU and bytes written are
+    process-wide, so stages that overlap share them.
+
+    write() appends the job as one JSON line to results/metrics.jsonl.
+
+    Args:
+        path (str): The JSON lines file to append to
+        profiler (StageProfiler, optional): Also profiles every stage, which makes them slower
+    """
+
+    def __init__(self, path: str = METRICS_PATH, profiler: Optional[StageProfiler] = None):
+        self.path = path
+        self.profiler = profiler
+        self.started = time.time()
+        self.job: Dict[str, Any] = {}
+        self.stages: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        before = _rusage()
+        status = "ok"
+        profiling = self.profiler.stage(name) if self.profiler is not None else nullcontext()
+        previous_fields = getattr(_active, "fields", None)
+        _active.fields = fields = {}
+        try:
+            with profiling:
+                yield
+        except BaseException:
+            status = "failed"
+            raise
+        finally:
+            _active.fields = previous_fields
+            record = {
+                "stage": name,
+                "status": status,
+                "wall_s": round(time.perf_counter() - wall, 3),
+                "cpu_s": round(time.thread_time() - cpu, 3),
+            }
+            after = _rusage()
+            if after:
+                children_cpu = after["children_cpu"] - before["children_cpu"]
+                record.update(
+                    {
+                        "subprocess_cpu_s": round(children_cpu, 3),
+                        "bytes_written": (after["written_blocks"] - before["written_blocks"]) * 512,
+                        "peak_rss_mb": _rss_mb(after["peak_rss"]),
+                        "subprocess_peak_rss_mb": _rss_mb(after["children_peak_rss"]),
+                    }
+                )
+            record.update(fields)
+            with self._lock:
+                self.stages.append(record)
+
+    def wrap(self, name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Returns func measured as the stage `name`."""
+
+        def measured(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+
+        return measured
+
+    def write(self, **fields) -> None:
+        """Appends the job record, with any extra fields given, to the metrics file."""
+        record = {
+            "time": round(self.started, 3),
+            "total_wall_s": round(time.time() - self.started, 3),
+            **self.job,
+            **fields,
+            "stages": self.stages,
+        }
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with _write_lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def save_profiles(self, directory: str) -> None:
+        """Saves the stage profiles into the directory, if the job was profiled."""
+        if self.profiler is not None:
+            self.profiler.save(directory)
+            self.job["profiles"] = directory
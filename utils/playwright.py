@@ -1,5 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from utils.console import print_substep
+
+
 def clear_cookie_by_name(context, cookie_cleared_name):
     cookies = context.cookies()
     filtered_cookies = [cookie for cookie in cookies if cookie["name"] != cookie_cleared_name]
     context.clear_cookies()
     context.add_cookies(filtered_cookies)
+
+
+class WarmBrowser:
+    """A headless Chromium kept running between videos, for long-running processes like
+    daemon.py. The Reddit login of the first video is kept too, as the storage state of its
+    context, so the next videos skip the login page.
+
+    Playwright's sync API only works in the thread that started it, so the browser lives in a
+    thread of its own and every use of it is sent to that thread by run().
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="browser")
+        self._playwright = None
+        self._browser = None
+        self.login_state: Optional[dict] = None
+
+    def run(self, func: Callable[..., Any], *args) -> Any:
+        """Calls func(browser, self, *args) in the browser thread and returns its result."""
+        return self._executor.submit(self._call, func, *args).result()
+
+    def _call(self, func: Callable[..., Any], *args) -> Any:
+        if self._browser is None or not self._browser.is_connected():
+            from playwright.sync_api import sync_playwright
+
+            print_substep("Launching Headless Browser...")
+            if self._playwright is None:
+                self._playwright = sync_playwright().start()
+            self._browser = self._playwright.chromium.launch(headless=True)
+            self.login_state = None
+        try:
+            return func(self._browser, self, *args)
+        except BaseException:
+            self.login_state = None  # log in again next time, in case the session expired
+            raise
+
+    def close(self) -> None:
+        def stop():
+            if self._browser is not None:
+                self._browser.close()
+            if self._playwright is not None:
+                self._playwright.stop()
+
+        self._executor.submit(stop).result()
+        self._executor.shutdown()
+
+
+_warm: Optional[WarmBrowser] = None
+
+
+def keep_browser_warm() -> WarmBrowser:
+    """Keeps one browser running for the screenshots of every following video."""
+    global _warm
+    if _warm is None:
+        _warm = WarmBrowser()
+    return _warm
+
+
+def with_browser(func: Callable[..., Any], *args) -> Any:
+    """Calls func(browser, warm, *args) with the warm browser if there is one, warm being None
+    otherwise, in which case a browser is launched for this call only."""
+    if _warm is not None:
+        return _warm.run(func, *args)
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as p:
+        print_substep("Launching Headless Browser...")
+        browser = p.chromium.launch(
+            headless=True
+        )  # headless=False will show the browser for debugging purposes
+        try:
+            return func(browser, None, *args)
+        finally:
+            browser.close()
@@ -0,0 +1,88 @@
+import cProfile
+import io
+import json
+import pstats
+import re
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Profiler of the stage running in each thread, so ffmpeg calls deep in a stage can report to it
+_active = threading.local()
+
+_BENCH_LINE = re.compile(r"^bench: (.*)$", re.MULTILINE)
+_BENCH_VALUE = re.compile(r"(\w+)=([\d.]+)")
+
+
+def benchmark_args() -> List[str]:
+    """["-benchmark"] while a profiled stage runs in this thread, to add to ffmpeg's arguments."""
+    return ["-benchmark"] if getattr(_active, "profiler", None) is not None else []
+
+
+def record_ffmpeg(name: str, stderr: Optional[bytes]) -> None:
+    """Keeps the -benchmark report of an ffmpeg run for the profiled stage of this thread.
+
+    Args:
+        name (str): What ffmpeg was doing, e.g. "render"
+        stderr (bytes): ffmpeg's stderr, None when it wasn't captured
+    """
+    profiler: Optional[StageProfiler] = getattr(_active, "profiler", None)
+    if profiler is None or not stderr:
+        return
+    # e.g. "bench: utime=10.113s stime=0.301s rtime=3.117s" and "bench: maxrss=190252kB"
+    report = {}
+    for line in _BENCH_LINE.findall(stderr.decode("utf-8", errors="replace")):
+        report.update({key: float(value) for key, value in _BENCH_VALUE.findall(line)})
+    if report:
+        with profiler._lock:
+            profiler.ffmpeg[name].append(report)
+
+
+class StageProfiler:
+    """cProfile of every stage of a job, plus the -benchmark reports of its ffmpeg runs.
+
+    The profiles are kept in memory until save(), because the folder of a job is only known once
+    its thread was fetched. cProfile only sees the thread it was started in, and on Python 3.12
+    only one profile can run at a time, so stages should run one after another while profiling.
+    """
+
+    def __init__(self):
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        self.ffmpeg: Dict[str, List[dict]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # another profile is running (Python 3.12+)
+            yield
+            return
+        previous = getattr(_active, "profiler", None)
+        _active.profiler = self
+        try:
+            yield
+        finally:
+            profile.disable()
+            _active.profiler = previous
+            with self._lock:
+                self.profiles[name] = profile
+
+    def save(self, directory: str) -> None:
+        """Writes <stage>.prof (for snakeviz, flameprof or pstats), a readable <stage>.txt summary
+        of the slowest functions, and ffmpeg_benchmark.json into the directory."""
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            for name, profile in self.profiles.items():
+                profile.dump_stats(path / f"{name}.prof")
+                summary = io.StringIO()
+                pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(40)
+                (path / f"{name}.txt").write_text(summary.getvalue(), encoding="utf-8")
+            if self.ffmpeg:
+                (path / "ffmpeg_benchmark.json").write_text(
+                    json.dumps(self.ffmpeg, indent=4), encoding="utf-8"
+                )
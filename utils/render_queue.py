@@ -0,0 +1,198 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Tuple
+
+DEFAULT_QUEUE_PATH = "video_creation/data/render_queue.db"
+# A worker rendering a job updates its heartbeat this often
+HEARTBEAT_S = 30
+# A job whose heartbeat is older than this has lost its worker, e.g. to a crash or a reboot
+STALE_AFTER_S = 4 * HEARTBEAT_S
+HOST = socket.gethostname()
+
+
+def _is_running(pid: Optional[int]) -> bool:
+    if os.name == "nt" or pid is None:
+        return True  # os.kill would kill it on Windows, only the heartbeat tells
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # it runs, as another user
+        return True
+    return True
+
+
+class RenderQueue:
+    """Persistent queue of prepared render jobs, backed by SQLite.
+
+    A job is everything make_final_video needs besides the files already prepared in
+    assets/temp/<id>/ (audio, screenshots, chopped background). Jobs survive restarts, and
+    claiming one is atomic, so several worker processes can share the queue.
+
+    Args:
+        path (str): Location of the SQLite database.
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    reddit_id TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    error TEXT,
+                    created REAL,
+                    started REAL,
+                    finished REAL,
+                    host TEXT,
+                    pid INTEGER,
+                    heartbeat REAL
+                )"""
+            )
+            # Queues created before the heartbeat
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("host", "TEXT"), ("pid", "INTEGER"), ("heartbeat", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            conn.execute("COMMIT")
+
+    @contextmanager
+    def _connect(self):
+        # isolation_level=None so transactions are only the ones opened explicitly
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def enqueue(self, reddit_id: str, payload: dict) -> Optional[int]:
+        """Adds a job. Returns its id, or None if the thread is already queued or rendering."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            existing = conn.execute(
+                "SELECT id FROM jobs WHERE reddit_id = ? AND status IN ('queued', 'running')",
+                (reddit_id,),
+            ).fetchone()
+            if existing is not None:
+                conn.execute("COMMIT")
+                return None
+            cursor = conn.execute(
+                "INSERT INTO jobs (reddit_id, payload, created) VALUES (?, ?, ?)",
+                (reddit_id, json.dumps(payload), time.time()),
+            )
+            conn.execute("COMMIT")
+            return cursor.lastrowid
+
+    def claim(self, worker: str) -> Optional[Tuple[int, dict]]:
+        """Takes the oldest queued job. Returns (job id, payload), or None if the queue is empty.
+
+        The job is held by this process, which has to call heartbeat while it renders it.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, payload FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, host = ?, pid = ?, started = ?, "
+                "heartbeat = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker, HOST, os.getpid(), now, now, row[0]),
+            )
+            conn.execute("COMMIT")
+        return row[0], json.loads(row[1])
+
+    def heartbeat(self, job_id: int) -> None:
+        """Tells requeue_stale that the worker of the job is still rendering it."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = 'running'",
+                (time.time(), job_id),
+            )
+
+    def complete(self, job_id: int) -> None:
+        self._finish(job_id, "done", None)
+
+    def fail(self, job_id: int, error: str) -> None:
+        self._finish(job_id, "failed", error)
+
+    def _finish(self, job_id: int, status: str, error: Optional[str]) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+
+    def requeue_stale(
+        self, max_attempts: int = 0, stale_after: float = STALE_AFTER_S
+    ) -> Tuple[int, int]:
+        """Puts the jobs of workers that died back in the queue.
+
+        A worker is gone once its heartbeat is older than stale_after, or, on this host, once
+        its process exited. Jobs of live workers, e.g. of another renderfarm.py, are left alone.
+        A job that was already claimed max_attempts times fails instead, it most likely kills
+        its worker, e.g. by running out of memory.
+
+        Args:
+            max_attempts (int): How many times a job may be claimed, 0 for no limit
+            stale_after (float): Seconds without a heartbeat before a worker counts as gone
+
+        Returns:
+            tuple[int, int]: How many jobs were requeued, and how many failed
+        """
+        requeued = failed = 0
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, host, pid, heartbeat, attempts FROM jobs WHERE status = 'running'"
+            ).fetchall()
+            for job_id, host, pid, heartbeat, attempts in rows:
+                stale = heartbeat is None or now - heartbeat > stale_after
+                if not stale and not (host == HOST and not _is_running(pid)):
+                    continue
+                if max_attempts and attempts >= max_attempts:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished = ? WHERE id = ?",
+                        (f"Its worker died on each of its {attempts} attempt(s)", now, job_id),
+                    )
+                    failed += 1
+                else:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', worker = NULL, pid = NULL, "
+                        "heartbeat = NULL WHERE id = ?",
+                        (job_id,),
+                    )
+                    requeued += 1
+            conn.execute("COMMIT")
+        return requeued, failed
+
+    def pending_ids(self) -> set:
+        """Reddit ids of the jobs that are queued or rendering."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT reddit_id FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def counts(self) -> dict:
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
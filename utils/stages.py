@@ -0,0 +1,122 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+from utils.metrics import JobMetrics
+
+
+class JobCancelled(Exception):
+    """Raised between the stages of a job once its batch was cancelled, e.g. by Ctrl-C."""
+
+
+class StageLimits:
+    """Per-stage concurrency limits, shared by every job of a batch.
+
+    Calling it with a stage name returns a context manager that holds one of that stage's
+    slots; stages without a limit (or with a limit of 0) are not restricted.
+
+    Args:
+        limits (Dict[str, int]): Maximum number of jobs running each stage at the same time.
+    """
+
+    def __init__(self, limits: Dict[str, int] = None):
+        self._semaphores = {
+            name: threading.BoundedSemaphore(int(limit))
+            for name, limit in (limits or {}).items()
+            if int(limit) > 0
+        }
+
+    def __call__(self, name: str):
+        return self._semaphores.get(name, nullcontext())
+
+
+class StageScheduler:
+    """Runs the stages of a video job as a small dependency graph.
+
+    A stage is a callable that receives a dict with the results of the stages that already
+    finished and returns its own result. A stage starts as soon as every stage it was added
+    `after` has finished, so independent stages (e.g. TTS and background downloads) overlap.
+
+    Args:
+        parallel (bool): Run independent stages at the same time. When False, stages run one
+            after another in the order they were added.
+        max_workers (int): Maximum number of stages running at the same time.
+        limits (StageLimits, optional): Concurrency limits shared with other jobs.
+        metrics (JobMetrics, optional): Records the timings and resource usage of every stage.
+        cancel (threading.Event, optional): Once set, the stages that didn't start yet raise
+            JobCancelled instead of running.
+    """
+
+    def __init__(
+        self,
+        parallel: bool = True,
+        max_workers: int = 4,
+        limits: StageLimits = None,
+        metrics: JobMetrics = None,
+        cancel: threading.Event = None,
+    ):
+        self.parallel = parallel
+        self.max_workers = max_workers
+        self.limits = limits or StageLimits()
+        self.metrics = metrics
+        self.cancel = cancel or threading.Event()
+        self.stages: Dict[str, Tuple[Callable[[Dict[str, Any]], Any], Tuple[str, ...]]] = {}
+
+    def add(self, name: str, func: Callable[[Dict[str, Any]], Any], after: Iterable[str] = ()):
+        after = tuple(after)
+        unknown = [dep for dep in after if dep not in self.stages]
+        if unknown:
+            raise ValueError(f"Stage {name} depends on unknown stage(s): {', '.join(unknown)}")
+        if name in self.stages:
+            raise ValueError(f"Stage {name} was added twice")
+        self.stages[name] = (self._limited(name, func), after)
+
+    def _limited(self, name: str, func: Callable[[Dict[str, Any]], Any]):
+        if self.metrics is not None:
+            func = self.metrics.wrap(name, func)
+
+        def run_stage(results: Dict[str, Any]) -> Any:
+            # Time spent waiting for a slot is not part of the stage's metrics
+            with self.limits(name):
+                if self.cancel.is_set():
+                    raise JobCancelled(f"Cancelled before the {name} stage")
+                return func(results)
+
+        return run_stage
+
+    def run(self) -> Dict[str, Any]:
+        """Runs every stage and returns their results by name.
+
+        The first exception raised by a stage is re-raised here, once the stages that didn't
+        start yet are cancelled and the ones already running have returned, so the caller can
+        clean up files no stage is still writing.
+        """
+        results: Dict[str, Any] = {}
+        if not self.parallel:
+            for name, (func, _) in self.stages.items():
+                results[name] = func(dict(results))
+            return results
+
+        pending = dict(self.stages)
+        running = {}
+        executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="stage")
+        try:
+            while pending or running:
+                ready = [
+                    name
+                    for name, (_, after) in pending.items()
+                    if all(dep in results for dep in after)
+                ]
+                for name in ready:
+                    func, _ = pending.pop(name)
+                    running[executor.submit(func, dict(results))] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        executor.shutdown()
+        return results
@@ -1,9 +1,37 @@
 import json
+import threading
 from os.path import exists
 
 from utils import settings
-from utils.ai_methods import sort_by_similarity
 from utils.console import print_substep
+from utils.render_queue import RenderQueue
+
+class SubmissionUnavailable(Exception):
+    """No post can be made into a video: the given one is done or claimed, or none is left."""
+
+
+# Submissions picked by jobs that are still running, so parallel jobs don't pick the same post
+_in_progress = set()
+_in_progress_lock = threading.Lock()
+
+
+def claim_submission(submission_id: str) -> bool:
+    """Marks a submission as being worked on. Returns False if another job already claimed it."""
+    with _in_progress_lock:
+        if submission_id in _in_progress:
+            return False
+        _in_progress.add(submission_id)
+        return True
+
+
+def claimed_submissions() -> set:
+    with _in_progress_lock:
+        return set(_in_progress)
+
+
+def release_submission(submission_id: str) -> None:
+    with _in_progress_lock:
+        _in_progress.discard(submission_id)
 
 
 def get_subreddit_undone(submissions: list, subreddit, times_checked=0, similarity_scores=None):
@@ -19,6 +47,8 @@ def get_subreddit_undone(submissions: list, subreddit, times_checked=0, similari
     # Second try of getting a valid Submission
     if times_checked and settings.config["ai"]["ai_similarity_enabled"]:
         print("Sorting based on similarity for a different date filter and thread limit..")
+        from utils.ai_methods import sort_by_similarity  # loads torch and transformers
+
         submissions = sort_by_similarity(
             submissions, keywords=settings.config["ai"]["ai_similarity_enabled"]
         )
@@ -29,8 +59,18 @@ def get_subreddit_undone(submissions: list, subreddit, times_checked=0, similari
             json.dump([], f)
     with open("./video_creation/data/videos.json", "r", encoding="utf-8") as done_vids_raw:
         done_videos = json.load(done_vids_raw)
+    # Posts waiting in the render queue aren't in videos.json yet
+    queued = (
+        RenderQueue().pending_ids()
+        if settings.config["settings"]["pipeline"]["render_mode"] == "queue"
+        else set()
+    )
     for i, submission in enumerate(submissions):
-        if already_done(done_videos, submission):
+        if (
+            already_done(done_videos, submission)
+            or str(submission) in _in_progress
+            or str(submission) in queued
+        ):
             continue
         if submission.over_18:
             try:
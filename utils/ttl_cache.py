@@ -0,0 +1,27 @@
+import json
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+CACHE_DIR = "assets/cache"
+
+
+def load(name: str, ttl: float) -> Optional[Any]:
+    """Returns the value saved under the name, or None if there is none younger than ttl seconds."""
+    try:
+        with open(Path(CACHE_DIR) / f"{name}.json", "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - entry.get("time", 0) > ttl:
+        return None
+    return entry.get("value")
+
+
+def save(name: str, value: Any) -> None:
+    path = Path(CACHE_DIR) / f"{name}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"time": time.time(), "value": value}, f)
+    tmp_path.replace(path)
@@ -1,13 +1,24 @@
 import requests
 
+from utils import ttl_cache
 from utils.console import print_step
 
+VERSION_CHECK_TTL = 24 * 60 * 60  # seconds
+
 
 def checkversion(__VERSION__: str):
-    response = requests.get(
-        "https://api.github.com/repos/elebumm/RedditVideoMakerBot/releases/latest"
-    )
-    latestversion = response.json()["tag_name"]
+    # The latest release is looked up at most once a day, not on every start
+    latestversion = ttl_cache.load("latest_version", VERSION_CHECK_TTL)
+    if latestversion is None:
+        try:
+            response = requests.get(
+                "https://api.github.com/repos/elebumm/RedditVideoMakerBot/releases/latest",
+                timeout=5,
+            )
+            latestversion = response.json()["tag_name"]
+        except (requests.RequestException, ValueError, KeyError):
+            return False  # offline or rate limited, try again on the next start
+        ttl_cache.save("latest_version", latestversion)
     if __VERSION__ == latestversion:
         print_step(f"You are using the newest version ({__VERSION__}) of the bot")
         return True
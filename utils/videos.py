@@ -1,15 +1,53 @@
 import json
+import threading
 import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator
 
-from praw.models import Submission
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 from utils import settings
 from utils.console import print_step
 
+if TYPE_CHECKING:
+    from praw.models import Submission
+
+VIDEOS_PATH = "./video_creation/data/videos.json"
+
+# Jobs of a pipelined batch can finish at the same time
+_videos_lock = threading.Lock()
+
+
+@contextmanager
+def videos_lock() -> Iterator[None]:
+    """Holds videos.json for a read-modify-write.
+
+    The thread lock covers the jobs of this process, an OS lock on videos.json.lock the other
+    processes, e.g. the renderfarm.py workers.
+    """
+    with _videos_lock, open(f"{VIDEOS_PATH}.lock", "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
 
 def check_done(
-    redditobj: Submission,
-) -> Submission:
+    redditobj: "Submission",
+) -> "Submission":
     # don't set this to be run anyplace that isn't subreddit.py bc of inspect stack
     """Checks if the chosen post has already been generated
 
@@ -43,7 +81,7 @@ def save_data(subreddit: str, filename: str, reddit_title: str, reddit_id: str,
         @param reddit_id:
         @param reddit_title:
     """
-    with open("./video_creation/data/videos.json", "r+", encoding="utf-8") as raw_vids:
+    with videos_lock(), open(VIDEOS_PATH, "r+", encoding="utf-8") as raw_vids:
         done_vids = json.load(raw_vids)
         if reddit_id in [video["id"] for video in done_vids]:
             return  # video already done but was specified to continue anyway in the config file
@@ -58,3 +96,4 @@ def save_data(subreddit: str, filename: str, reddit_title: str, reddit_id: str,
         done_vids.append(payload)
         raw_vids.seek(0)
         json.dump(done_vids, raw_vids, ensure_ascii=False, indent=4)
+        raw_vids.truncate()
@@ -1,8 +1,10 @@
 import re
 import sys
+import threading
 import time as pytime
 from datetime import datetime
 from time import sleep
+from typing import Iterator, List
 
 from cleantext import clean
 from requests import Response
@@ -12,6 +14,9 @@ from utils import settings
 if sys.version_info[0] >= 3:
     from datetime import timezone
 
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+_CLAUSE_END = re.compile(r"(?<=[,;:])\s+")
+
 
 def check_ratelimit(response: Response) -> bool:
     """
@@ -30,6 +35,65 @@ def check_ratelimit(response: Response) -> bool:
     return True
 
 
+class TokenBucket:
+    """Spaces out the requests to a rate limited API, shared by every thread calling it.
+
+    Holds up to capacity tokens, refilled at rate tokens a second, and each request takes one.
+    A limited response empties it until the X-RateLimit-Reset of the response.
+
+    Args:
+        rate (float): Requests a second in the long run
+        capacity (int): Requests that can be sent at once after a pause
+        pause (float): Seconds to wait after a limited response without X-RateLimit-Reset
+    """
+
+    def __init__(self, rate: float, capacity: int, pause: float = 5):
+        self.rate = rate
+        self.capacity = capacity
+        self.pause = pause
+        self.tokens = float(capacity)
+        self.refilled_at = pytime.monotonic()
+        self.paused_until = 0.0  # unix time, like X-RateLimit-Reset
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Waits until a request can be sent."""
+        while True:
+            with self._lock:
+                now = pytime.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.refilled_at) * self.rate)
+                self.refilled_at = now
+                wait = self.paused_until - pytime.time()
+                if wait <= 0 and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(wait, (1 - self.tokens) / self.rate)
+            sleep(wait)
+
+    def update(self, response: Response) -> bool:
+        """Reads the rate limit of a response.
+
+        Returns:
+            bool: False if the request was limited and has to be sent again
+        """
+        limited = response.status_code == 429
+        if limited or response.headers.get("X-RateLimit-Remaining") == "0":
+            try:
+                until = float(response.headers["X-RateLimit-Reset"])
+            except (KeyError, ValueError):  # we don't know how long to wait
+                until = pytime.time() + self.pause
+            self.pause_until(until, "Ratelimit hit")
+        return not limited
+
+    def pause_until(self, until: float, reason: str) -> None:
+        """Holds every request until the unix time until, e.g. after a failed request."""
+        with self._lock:
+            if until > self.paused_until:
+                print(f"{reason}. Pausing for {until - pytime.time():.0f} seconds.")
+            self.paused_until = max(self.paused_until, until)
+            self.tokens = 0
+
+
 def sleep_until(time) -> None:
     """
     Pause your program until a specific end time.
@@ -94,3 +158,42 @@ def sanitize_text(text: str) -> str:
 
     # remove extra whitespace
     return " ".join(result.split())
+
+
+def _pieces(text: str, max_chars: int) -> Iterator[str]:
+    """The sentences of the text, with the ones over max_chars cut into clauses, then words."""
+    for sentence in _SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if len(sentence) <= max_chars:
+            if sentence:
+                yield sentence
+            continue
+        for clause in _CLAUSE_END.split(sentence):
+            if len(clause) <= max_chars:
+                yield clause
+                continue
+            for word in clause.split():
+                while len(word) > max_chars:  # only happens with absurdly long "words"
+                    yield word[:max_chars]
+                    word = word[max_chars:]
+                if word:
+                    yield word
+
+
+def pack_text(text: str, max_chars: int) -> List[str]:
+    """Splits the text into as few chunks of at most max_chars as possible for a TTS provider.
+
+    Chunks are filled with whole sentences. Sentences that don't fit in a chunk on their own are
+    cut between clauses, and clauses between words.
+    """
+    chunks = []
+    current = ""
+    for piece in _pieces(text, max_chars):
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
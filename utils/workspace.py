@@ -0,0 +1,136 @@
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from utils import settings
+from utils.cleanup import cleanup, dir_size
+from utils.console import print_substep
+from utils.render_queue import DEFAULT_QUEUE_PATH, RenderQueue
+
+TEMP_DIR = "assets/temp"
+MB = 1024 * 1024
+
+
+class WorkspaceQuotaExceeded(Exception):
+    pass
+
+
+class Workspace:
+    """The temp directory of a job, assets/temp/<id>.
+
+    With settings.workspace.temp_root set (e.g. a tmpfs like /dev/shm/redditvideomakerbot), the
+    files are kept there and assets/temp/<id> links to them, so the rest of the bot keeps using
+    the same paths. Jobs that would take the temp root over total_quota_mb stay on disk.
+
+    Args:
+        reddit_id (str): The sanitized reddit id of the job
+    """
+
+    def __init__(self, reddit_id: str):
+        self.reddit_id = reddit_id
+        self.path = Path(TEMP_DIR) / reddit_id
+        config = settings.config["settings"]["workspace"]
+        self.root = config["temp_root"]
+        self.job_quota = int(config["job_quota_mb"]) * MB
+        self.total_quota = int(config["total_quota_mb"]) * MB
+
+    def create(self) -> "Workspace":
+        if self.path.exists():  # resumed job
+            return self
+        if self.path.is_symlink():  # its temp root was wiped, e.g. by a reboot
+            self.path.unlink()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.root and self._fits_in_root():
+            directory = Path(self.root) / self.reddit_id
+            directory.mkdir(parents=True, exist_ok=True)
+            self.path.symlink_to(directory.absolute(), target_is_directory=True)
+        else:
+            self.path.mkdir()
+        return self
+
+    def _fits_in_root(self) -> bool:
+        root = Path(self.root)
+        root.mkdir(parents=True, exist_ok=True)
+        needed = self.job_quota or 512 * MB
+        if self.total_quota and dir_size(root) + needed > self.total_quota:
+            print_substep(f"{self.root} is over its quota, using the disk for this video.")
+            return False
+        if shutil.disk_usage(root).free < needed:
+            print_substep(f"{self.root} is almost full, using the disk for this video.")
+            return False
+        return True
+
+    def usage(self) -> int:
+        return dir_size(self.path.resolve())
+
+    def check_quota(self) -> None:
+        """Raises WorkspaceQuotaExceeded if the job uses more than job_quota_mb."""
+        used = self.usage()
+        if self.job_quota and used > self.job_quota:
+            raise WorkspaceQuotaExceeded(
+                f"The temp files of {self.reddit_id} take {used // MB} MB, "
+                f"over the {self.job_quota // MB} MB quota"
+            )
+
+    def guard(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        """Wraps a stage so the quota is checked once it is done."""
+
+        def checked(*args, **kwargs):
+            result = func(*args, **kwargs)
+            self.check_quota()
+            return result
+
+        return checked
+
+    def remove(self) -> int:
+        """Deletes the workspace. Returns how many bytes were freed."""
+        freed = cleanup(self.reddit_id)
+        print_substep(f"Removed {freed / MB:.1f} MB of temporary files 🗑")
+        return freed
+
+
+def _queued_ids(queue_path: str) -> set:
+    """Sanitized reddit ids of the jobs waiting in the render queue, or being rendered."""
+    if not Path(queue_path).exists():
+        return set()
+    pending = RenderQueue(queue_path).pending_ids()
+    return {re.sub(r"[^\w\s-]", "", reddit_id) for reddit_id in pending}
+
+
+def sweep_workspaces(queue_path: str = DEFAULT_QUEUE_PATH) -> int:
+    """Deletes the workspaces older than settings.workspace.max_age_hours, whether their job
+    crashed or was abandoned, and links left behind by a wiped temp root. The workspaces of jobs
+    still in the render queue are kept however old, the render farm needs their files.
+
+    Args:
+        queue_path (str): The render queue to look the pending jobs up in
+
+    Returns:
+        int: How many bytes were freed
+    """
+    max_age = float(settings.config["settings"]["workspace"]["max_age_hours"]) * 60 * 60
+    temp = Path(TEMP_DIR)
+    if not max_age or not temp.is_dir():
+        return 0
+    queued = _queued_ids(queue_path)
+    freed = 0
+    for path in temp.iterdir():
+        if path.is_symlink() and not path.exists():
+            path.unlink()
+        elif path.name in queued:
+            continue
+        elif path.is_dir() and time.time() - path.resolve().stat().st_mtime > max_age:
+            freed += cleanup(path.name)
+    root = settings.config["settings"]["workspace"]["temp_root"]
+    if root and Path(root).is_dir():
+        # Directories whose link was deleted by hand
+        for path in Path(root).iterdir():
+            linked = (temp / path.name).is_symlink() or path.name in queued
+            if path.is_dir() and not linked and time.time() - path.stat().st_mtime > max_age:
+                freed += dir_size(path)
+                shutil.rmtree(path, ignore_errors=True)
+    if freed:
+        print_substep(f"Removed {freed / MB:.1f} MB of stale temporary files 🗑")
+    return freed
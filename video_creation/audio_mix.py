@@ -0,0 +1,125 @@
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import ffmpeg
+import numpy as np
+
+from utils.ffmpeg_progress import run_ffmpeg
+from utils.profiling import benchmark_args, record_ffmpeg
+
+__all__ = ["SAMPLE_RATE", "decode", "write_wav", "AudioTimeline"]
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+# How fast the background fades out under the voice and back in after it
+DUCKING_FADE_S = 0.25
+
+
+def decode(path: str, start: float = 0, duration: Optional[float] = None) -> np.ndarray:
+    """Decodes an audio file to float32 PCM samples, shaped (samples, channels).
+
+    Args:
+        path (str): The audio file
+        start (float): Where to start decoding, in seconds
+        duration (float, optional): How many seconds to decode. Defaults to the rest of the file.
+    """
+    options = {"ss": start} if start else {}
+    if duration is not None:
+        options["t"] = duration
+    out, stderr = run_ffmpeg(
+        ffmpeg.input(path, **options)
+        .output("pipe:", format="f32le", acodec="pcm_f32le", ac=CHANNELS, ar=SAMPLE_RATE)
+        .global_args(*benchmark_args()),
+        capture_stdout=True,
+        capture_stderr=True,
+    )
+    record_ffmpeg("audio_decode", stderr)
+    return np.frombuffer(out, np.float32).reshape(-1, CHANNELS)
+
+
+def write_wav(samples: np.ndarray, path: str) -> str:
+    """Writes float PCM samples as a 16 bit WAV, the only encode left is the one of the render."""
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(CHANNELS)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(pcm.tobytes())
+    return path
+
+
+class AudioTimeline:
+    """The voice clips of a video, one after another, at exact sample offsets.
+
+    Every clip is decoded once (in parallel, each decode is an ffmpeg process), so their
+    durations are exact to the sample instead of the duration ffprobe reads from the mp3 header.
+
+    Args:
+        paths (list[str]): The clips in the order they are played
+    """
+
+    def __init__(self, paths: List[str]):
+        with ThreadPoolExecutor(min(len(paths), 8) or 1, thread_name_prefix="decode") as pool:
+            self.clips = list(pool.map(decode, paths))
+        self.offsets = np.cumsum([0] + [len(clip) for clip in self.clips])
+
+    @property
+    def durations(self) -> List[float]:
+        """Seconds each clip is played."""
+        return [len(clip) / SAMPLE_RATE for clip in self.clips]
+
+    @property
+    def length(self) -> int:
+        """Number of samples of all clips."""
+        return int(self.offsets[-1])
+
+    def voice(self, length: int = 0) -> np.ndarray:
+        """The clips placed on one track, padded with silence to at least length samples."""
+        track = np.zeros((max(self.length, length), CHANNELS), np.float32)
+        for offset, clip in zip(self.offsets, self.clips):
+            track[offset : offset + len(clip)] = clip
+        return track
+
+    def speaking(self, length: int) -> np.ndarray:
+        """1 where a clip is played and 0 elsewhere, eased over DUCKING_FADE_S."""
+        mask = np.zeros(length, np.float32)
+        for offset, clip in zip(self.offsets, self.clips):
+            mask[offset : offset + len(clip)] = 1
+        fade = max(1, int(DUCKING_FADE_S * SAMPLE_RATE))
+        # A moving average turns the steps into ramps, cumsum keeps it linear in the samples
+        padded = np.concatenate([np.zeros(fade, np.float32), mask, np.zeros(fade, np.float32)])
+        sums = np.cumsum(padded, dtype=np.float64)
+        eased = (sums[2 * fade :] - sums[: -2 * fade]) / (2 * fade)
+        return np.clip(eased[:length], 0, 1).astype(np.float32)
+
+    def mix(
+        self,
+        background: Optional[np.ndarray],
+        volume: float,
+        ducking: float = 0,
+        length: int = 0,
+    ) -> np.ndarray:
+        """The clips over the background.
+
+        Args:
+            background (np.ndarray, optional): PCM of the background audio, None for none
+            volume (float): Volume of the background
+            ducking (float): How much quieter the background gets while a clip plays, 0 to 1
+            length (int): Minimum length in samples, e.g. the length of the video
+
+        Returns:
+            np.ndarray: The mixed PCM, scaled down if it would clip
+        """
+        if background is not None:
+            length = max(length, len(background))
+        track = self.voice(length)
+        if background is not None and volume:
+            gain = np.full(len(background), volume, np.float32)
+            if ducking:
+                gain *= 1 - ducking * self.speaking(len(background))
+            track[: len(background)] += background * gain[:, None]
+        peak = float(np.abs(track).max()) if len(track) else 0.0
+        if peak > 1:
+            track /= peak
+        return track
@@ -5,10 +5,6 @@ from pathlib import Path
 from random import randrange
 from typing import Any, Dict, Tuple
 
-import yt_dlp
-from moviepy.editor import AudioFileClip, VideoFileClip
-from moviepy.video.io.ffmpeg_tools import ffmpeg_extract_subclip
-
 from utils import settings
 from utils.console import print_step, print_substep
 
@@ -57,8 +53,8 @@ def get_start_and_end_times(video_length: int, length_of_clip: int) -> Tuple[int
     return random_time, random_time + video_length
 
 
-def get_background_config(mode: str):
-    """Fetch the background/s configuration"""
+def get_background_choice(mode: str) -> str:
+    """Picks the name of the background/s to use, as configured or at random"""
     try:
         choice = str(settings.config["settings"]["background"][f"background_{mode}"]).casefold()
     except AttributeError:
@@ -70,11 +66,23 @@ def get_background_config(mode: str):
     if not choice or choice not in background_options[mode]:
         choice = random.choice(list(background_options[mode].keys()))
 
-    return background_options[mode][choice]
+    return choice
+
+
+def get_background_config(mode: str, choice: str = None):
+    """Fetch the background/s configuration
+
+    Args:
+        mode (str): "video" or "audio"
+        choice (str, optional): Name of the background, see get_background_choice
+    """
+    return background_options[mode][choice or get_background_choice(mode)]
 
 
 def download_background_video(background_config: Tuple[str, str, str, Any]):
     """Downloads the background/s video from YouTube."""
+    import yt_dlp  # slow to import, and only needed until the backgrounds are downloaded
+
     Path("./assets/backgrounds/video/").mkdir(parents=True, exist_ok=True)
     # note: make sure the file name doesn't include an - in it
     uri, filename, credit, _ = background_config
@@ -98,6 +106,8 @@ def download_background_video(background_config: Tuple[str, str, str, Any]):
 
 def download_background_audio(background_config: Tuple[str, str, str]):
     """Downloads the background/s audio from YouTube."""
+    import yt_dlp
+
     Path("./assets/backgrounds/audio/").mkdir(parents=True, exist_ok=True)
     # note: make sure the file name doesn't include an - in it
     uri, filename, credit = background_config
@@ -127,6 +137,9 @@ def chop_background(background_config: Dict[str, Tuple], video_length: int, redd
         background_config (Dict[str,Tuple]]) : Current background configuration
         video_length (int): Length of the clip where the background footage is to be taken out of
     """
+    from moviepy.editor import AudioFileClip, VideoFileClip
+    from moviepy.video.io.ffmpeg_tools import ffmpeg_extract_subclip
+
     id = re.sub(r"[^\w\s-]", "", reddit_object["thread_id"])
 
     if settings.config["settings"]["background"][f"background_audio_volume"] == 0:
@@ -134,12 +147,32 @@ def chop_background(background_config: Dict[str, Tuple], video_length: int, redd
     else:
         print_step("Finding a spot in the backgrounds audio to chop...✂️")
         audio_choice = f"{background_config['audio'][2]}-{background_config['audio'][1]}"
-        background_audio = AudioFileClip(f"assets/backgrounds/audio/{audio_choice}")
-        start_time_audio, end_time_audio = get_start_and_end_times(
-            video_length, background_audio.duration
-        )
-        background_audio = background_audio.subclip(start_time_audio, end_time_audio)
-        background_audio.write_audiofile(f"assets/temp/{id}/background.mp3")
+        if settings.config["settings"]["pipeline"]["audio_mixer"] == "numpy":
+            # Cut without encoding, the mixer decodes it once and the render encodes it once
+            import ffmpeg
+
+            from utils.ffmpeg_progress import run_ffmpeg
+            from video_creation.audio_mix import SAMPLE_RATE
+
+            source = f"assets/backgrounds/audio/{audio_choice}"
+            start_time_audio, end_time_audio = get_start_and_end_times(
+                video_length, float(ffmpeg.probe(source)["format"]["duration"])
+            )
+            run_ffmpeg(
+                ffmpeg.input(source, ss=start_time_audio, t=end_time_audio - start_time_audio)
+                .output(
+                    f"assets/temp/{id}/background.wav", acodec="pcm_s16le", ac=2, ar=SAMPLE_RATE
+                )
+                .overwrite_output(),
+                quiet=True,
+            )
+        else:
+            background_audio = AudioFileClip(f"assets/backgrounds/audio/{audio_choice}")
+            start_time_audio, end_time_audio = get_start_and_end_times(
+                video_length, background_audio.duration
+            )
+            background_audio = background_audio.subclip(start_time_audio, end_time_audio)
+            background_audio.write_audiofile(f"assets/temp/{id}/background.mp3")
 
     print_step("Finding a spot in the backgrounds video to chop...✂️")
     video_choice = f"{background_config['video'][2]}-{background_config['video'][1]}"
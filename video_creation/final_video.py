@@ -1,71 +1,31 @@
 import multiprocessing
 import os
 import re
-import tempfile
 import textwrap
-import threading
-import time
 from os.path import exists  # Needs to be imported specifically
 from pathlib import Path
-from typing import Dict, Final, Tuple
+from typing import Dict, Final, List, Optional, Tuple
 
 import ffmpeg
-import translators
 from PIL import Image, ImageDraw, ImageFont
 from rich.console import Console
-from rich.progress import track
 
 from utils import settings
-from utils.cleanup import cleanup
-from utils.console import print_step, print_substep
+from utils.console import print_step, print_substep, track
+from utils.encoding import encoder_args, encoder_profile, mux_args
+from utils.ffmpeg_progress import RenderProgress, run_ffmpeg, run_with_progress
 from utils.fonts import getheight
+from utils.profiling import benchmark_args, record_ffmpeg
 from utils.thumbnail import create_thumbnail
 from utils.videos import save_data
+from video_creation.audio_mix import SAMPLE_RATE, AudioTimeline, decode, write_wav
+from video_creation.overlays import OverlayClip, overlay_clips
+from video_creation.segments import render_segments, split_timeline
+from video_creation.variants import fit_variant, output_variants
 
 console = Console()
 
 
-class ProgressFfmpeg(threading.Thread):
-    def __init__(self, vid_duration_seconds, progress_update_callback):
-        threading.Thread.__init__(self, name="ProgressFfmpeg")
-        self.stop_event = threading.Event()
-        self.output_file = tempfile.NamedTemporaryFile(mode="w+", delete=False)
-        self.vid_duration_seconds = vid_duration_seconds
-        self.progress_update_callback = progress_update_callback
-
-    def run(self):
-        while not self.stop_event.is_set():
-            latest_progress = self.get_latest_ms_progress()
-            if latest_progress is not None:
-                completed_percent = latest_progress / self.vid_duration_seconds
-                self.progress_update_callback(completed_percent)
-            time.sleep(1)
-
-    def get_latest_ms_progress(self):
-        lines = self.output_file.readlines()
-
-        if lines:
-            for line in lines:
-                if "out_time_ms" in line:
-                    out_time_ms_str = line.split("=")[1].strip()
-                    if out_time_ms_str.isnumeric():
-                        return float(out_time_ms_str) / 1000000.0
-                    else:
-                        # Handle the case when "N/A" is encountered
-                        return None
-        return None
-
-    def stop(self):
-        self.stop_event.set()
-
-    def __enter__(self):
-        self.start()
-        return self
-
-    def __exit__(self, *args, **kwargs):
-        self.stop()
-
-
 def name_normalize(name: str) -> str:
     name = re.sub(r'[?\\"%*:|<>]', "", name)
     name = re.sub(r"( [w,W]\s?\/\s?[o,O,0])", r" without", name)
@@ -77,13 +37,15 @@ def name_normalize(name: str) -> str:
     lang = settings.config["reddit"]["thread"]["post_lang"]
     if lang:
         print_substep("Translating filename...")
+        import translators
+
         translated_name = translators.translate_text(name, translator="google", to_language=lang)
         return translated_name
     else:
         return name
 
 
-def prepare_background(reddit_id: str, W: int, H: int) -> str:
+def prepare_background(reddit_id: str, W: int, H: int, threads: int = None) -> str:
     output_path = f"assets/temp/{reddit_id}/background_noaudio.mp4"
     output = (
         ffmpeg.input(f"assets/temp/{reddit_id}/background.mp4")
@@ -91,20 +53,21 @@ def prepare_background(reddit_id: str, W: int, H: int) -> str:
         .output(
             output_path,
             an=None,
-            **{
-                "c:v": "h264",
-                "b:v": "20M",
-                "b:a": "192k",
-                "threads": multiprocessing.cpu_count(),
-            },
+            **encoder_args(
+                encoder_profile("intermediate_profile"),
+                threads=threads or multiprocessing.cpu_count(),
+                audio=False,
+            ),
         )
         .overwrite_output()
+        .global_args(*benchmark_args())
     )
     try:
-        output.run(quiet=True)
+        _, stderr = run_ffmpeg(output, quiet=True)
     except ffmpeg.Error as e:
         print(e.stderr.decode("utf8"))
-        exit(1)
+        raise
+    record_ffmpeg("prepare_background", stderr)
     return output_path
 
 
@@ -185,19 +148,52 @@ def merge_background_audio(audio: ffmpeg, reddit_id: str):
         return merged_audio  # Return merged audio
 
 
+def mix_audio(
+    audio_paths: List[str], reddit_id: str, length: int, only_voice: bool = False
+) -> Tuple[Optional[ffmpeg.nodes.Stream], ffmpeg.nodes.Stream, List[float]]:
+    """Mixes the voice clips and assets/temp/<id>/background.wav with NumPy, see AudioTimeline.
+
+    Returns:
+        The voice alone (only written when only_voice is set), the mixed audio, and how long each
+        clip is played
+    """
+    print_substep("Mixing the audio...")
+    background_settings = settings.config["settings"]["background"]
+    volume = background_settings["background_audio_volume"]
+    timeline = AudioTimeline(audio_paths)
+    background = decode(f"assets/temp/{reddit_id}/background.wav") if volume else None
+    mixed = timeline.mix(
+        background,
+        volume,
+        ducking=background_settings["background_audio_ducking"],
+        length=length * SAMPLE_RATE,
+    )
+    final_audio = ffmpeg.input(write_wav(mixed, f"assets/temp/{reddit_id}/audio.wav"))
+    voice = None
+    if only_voice:
+        voice = ffmpeg.input(write_wav(timeline.voice(), f"assets/temp/{reddit_id}/voice.wav"))
+    return voice, final_audio, timeline.durations
+
+
 def make_final_video(
     number_of_clips: int,
     length: int,
     reddit_obj: dict,
     background_config: Dict[str, Tuple],
-):
+    threads: int = None,
+) -> str:
     """Gathers audio clips, gathers all screenshots, stitches them together and saves the final video to assets/temp
     Args:
         number_of_clips (int): Index to end at when going through the screenshots'
         length (int): Length of the video
         reddit_obj (dict): The reddit object that contains the posts to read.
         background_config (Tuple[str, str, str, Any]): The background config to use.
+        threads (int, optional): Thread budget for ffmpeg. Defaults to the number of CPUs.
+
+    Returns:
+        str: Path of the final video. The temp files are left for the caller to clean up.
     """
+    threads = threads or multiprocessing.cpu_count()
     # settings values
     W: Final[int] = int(settings.config["settings"]["resolution_w"])
     H: Final[int] = int(settings.config["settings"]["resolution_h"])
@@ -213,10 +209,11 @@ def make_final_video(
 
     print_step("Creating the final video 🎥")
 
-    background_clip = ffmpeg.input(prepare_background(reddit_id, W=W, H=H))
+    background_path = prepare_background(reddit_id, W=W, H=H, threads=threads)
+    background_clip = ffmpeg.input(background_path)
 
     # Gather all audio clips
-    audio_clips = list()
+    audio_paths = list()
     if number_of_clips == 0 and settings.config["settings"]["storymode"] == "false":
         print(
             "No audio clips to gather. Please use a different TTS or post."
@@ -224,41 +221,56 @@ def make_final_video(
         exit()
     if settings.config["settings"]["storymode"]:
         if settings.config["settings"]["storymodemethod"] == 0:
-            audio_clips = [ffmpeg.input(f"assets/temp/{reddit_id}/mp3/title.mp3")]
-            audio_clips.insert(1, ffmpeg.input(f"assets/temp/{reddit_id}/mp3/postaudio.mp3"))
+            audio_paths = [f"assets/temp/{reddit_id}/mp3/title.mp3"]
+            audio_paths.insert(1, f"assets/temp/{reddit_id}/mp3/postaudio.mp3")
         elif settings.config["settings"]["storymodemethod"] == 1:
-            audio_clips = [
-                ffmpeg.input(f"assets/temp/{reddit_id}/mp3/postaudio-{i}.mp3")
+            audio_paths = [
+                f"assets/temp/{reddit_id}/mp3/postaudio-{i}.mp3"
                 for i in track(range(number_of_clips + 1), "Collecting the audio files...")
             ]
-            audio_clips.insert(0, ffmpeg.input(f"assets/temp/{reddit_id}/mp3/title.mp3"))
+            audio_paths.insert(0, f"assets/temp/{reddit_id}/mp3/title.mp3")
 
     else:
-        audio_clips = [
-            ffmpeg.input(f"assets/temp/{reddit_id}/mp3/{i}.mp3") for i in range(number_of_clips)
-        ]
-        audio_clips.insert(0, ffmpeg.input(f"assets/temp/{reddit_id}/mp3/title.mp3"))
-
-        audio_clips_durations = [
-            float(ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/{i}.mp3")["format"]["duration"])
-            for i in range(number_of_clips)
-        ]
-        audio_clips_durations.insert(
-            0,
-            float(ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/title.mp3")["format"]["duration"]),
+        audio_paths = [f"assets/temp/{reddit_id}/mp3/{i}.mp3" for i in range(number_of_clips)]
+        audio_paths.insert(0, f"assets/temp/{reddit_id}/mp3/title.mp3")
+
+    # Durations read from the mixed samples, exact where ffprobe estimates them from the mp3s
+    mixed_durations = None
+    if settings.config["settings"]["pipeline"]["audio_mixer"] == "numpy":
+        audio, final_audio, mixed_durations = mix_audio(
+            audio_paths, reddit_id, length, only_voice=allowOnlyTTSFolder
+        )
+    else:
+        audio_concat = ffmpeg.concat(*[ffmpeg.input(path) for path in audio_paths], a=1, v=0)
+        _, stderr = (
+            ffmpeg.output(audio_concat, f"assets/temp/{reddit_id}/audio.mp3", **{"b:a": "192k"})
+            .overwrite_output()
+            .global_args(*benchmark_args())
+            .run(quiet=True)
         )
-    audio_concat = ffmpeg.concat(*audio_clips, a=1, v=0)
-    ffmpeg.output(
-        audio_concat, f"assets/temp/{reddit_id}/audio.mp3", **{"b:a": "192k"}
-    ).overwrite_output().run(quiet=True)
+        record_ffmpeg("audio_concat", stderr)
+        audio = ffmpeg.input(f"assets/temp/{reddit_id}/audio.mp3")
+        final_audio = merge_background_audio(audio, reddit_id)
+
+    if not settings.config["settings"]["storymode"]:
+        if mixed_durations is not None:
+            audio_clips_durations = mixed_durations
+        else:
+            audio_clips_durations = [
+                float(ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/{i}.mp3")["format"]["duration"])
+                for i in range(number_of_clips)
+            ]
+            audio_clips_durations.insert(
+                0,
+                float(ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/title.mp3")["format"]["duration"]),
+            )
 
     console.log(f"[bold green] Video Will Be: {length} Seconds Long")
 
     screenshot_width = int((W * 45) // 100)
-    audio = ffmpeg.input(f"assets/temp/{reddit_id}/audio.mp3")
-    final_audio = merge_background_audio(audio, reddit_id)
 
-    image_clips = list()
+    # The screenshots and when they are shown, composited over the background at the end
+    overlays: List[OverlayClip] = []
 
     Path(f"assets/temp/{reddit_id}/png").mkdir(parents=True, exist_ok=True)
 
@@ -276,43 +288,32 @@ def make_final_video(
     # create_fancy_thumbnail(image, text, text_color, padding
     title_img = create_fancy_thumbnail(title_template, title, font_color, padding)
 
-    title_img.save(f"assets/temp/{reddit_id}/png/title.png")
-    image_clips.insert(
-        0,
-        ffmpeg.input(f"assets/temp/{reddit_id}/png/title.png")["v"].filter(
-            "scale", screenshot_width, -1
-        ),
-    )
+    title_path = f"assets/temp/{reddit_id}/png/title.png"
+    title_img.save(title_path)
 
     current_time = 0
     if settings.config["settings"]["storymode"]:
-        audio_clips_durations = [
-            float(
-                ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/postaudio-{i}.mp3")["format"]["duration"]
+        if mixed_durations is not None:
+            audio_clips_durations = mixed_durations[: number_of_clips + 1]
+        else:
+            audio_clips_durations = [
+                float(
+                    ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/postaudio-{i}.mp3")["format"][
+                        "duration"
+                    ]
+                )
+                for i in range(number_of_clips)
+            ]
+            audio_clips_durations.insert(
+                0,
+                float(ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/title.mp3")["format"]["duration"]),
             )
-            for i in range(number_of_clips)
-        ]
-        audio_clips_durations.insert(
-            0,
-            float(ffmpeg.probe(f"assets/temp/{reddit_id}/mp3/title.mp3")["format"]["duration"]),
-        )
          # Create a transparent image for other clips
         transparent_image = Image.new('RGBA', (screenshot_width, screenshot_width), (0, 0, 0, 0))
         transparent_image.save(f"assets/temp/{reddit_id}/png/transparent.png")
     
         if settings.config["settings"]["storymodemethod"] == 0:
-            image_clips.insert(
-                1,
-                ffmpeg.input(f"assets/temp/{reddit_id}/png/story_content.png").filter(
-                    "scale", screenshot_width, -1
-                ),
-            )
-            background_clip = background_clip.overlay(
-                image_clips[0],
-                enable=f"between(t,{current_time},{current_time + audio_clips_durations[0]})",
-                x="(main_w-overlay_w)/2",
-                y="(main_h-overlay_h)/2",
-            )
+            overlays.append(OverlayClip(title_path, current_time, audio_clips_durations[0]))
             current_time += audio_clips_durations[0]
         elif settings.config["settings"]["storymodemethod"] == 1:
             for i in track(range(0, number_of_clips + 1), "Collecting the image files..."):
@@ -320,34 +321,26 @@ def make_final_video(
                 transparent_image = Image.new('RGBA', (screenshot_width, screenshot_width), (0, 0, 0, 0))
                 transparent_image.save(f"assets/temp/{reddit_id}/png/trs{i}.png")
 
-                image_clips.append(
-                    ffmpeg.input(f"assets/temp/{reddit_id}/png/trs{i}.png")["v"].filter(
-                        "scale", screenshot_width, -1
+                overlays.append(
+                    OverlayClip(
+                        title_path if i == 0 else f"assets/temp/{reddit_id}/png/trs{i - 1}.png",
+                        current_time,
+                        audio_clips_durations[i],
                     )
                 )
-                background_clip = background_clip.overlay(
-                    image_clips[i],
-                    enable=f"between(t,{current_time},{current_time + audio_clips_durations[i]})",
-                    x="(main_w-overlay_w)/2",
-                    y="(main_h-overlay_h)/2",
-                )
                 current_time += audio_clips_durations[i]
     else:
         for i in range(0, number_of_clips + 1):
-            image_clips.append(
-                ffmpeg.input(f"assets/temp/{reddit_id}/png/comment_{i}.png")["v"].filter(
-                    "scale", screenshot_width, -1
-                )
-            )
-            image_overlay = image_clips[i].filter("colorchannelmixer", aa=opacity)
             assert (
                 audio_clips_durations is not None
             ), "Please make a GitHub issue if you see this. Ping @JasonLovesDoggo on GitHub."
-            background_clip = background_clip.overlay(
-                image_overlay,
-                enable=f"between(t,{current_time},{current_time + audio_clips_durations[i]})",
-                x="(main_w-overlay_w)/2",
-                y="(main_h-overlay_h)/2",
+            overlays.append(
+                OverlayClip(
+                    title_path if i == 0 else f"assets/temp/{reddit_id}/png/comment_{i - 1}.png",
+                    current_time,
+                    audio_clips_durations[i],
+                    opacity,
+                )
             )
             current_time += audio_clips_durations[i]
 
@@ -401,54 +394,102 @@ def make_final_video(
             thumbnailSave.save(f"./assets/temp/{reddit_id}/thumbnail.png")
             print_substep(f"Thumbnail - Building Thumbnail in assets/temp/{reddit_id}/thumbnail.png")
 
-    text = f" " #Removed mmention of bacground creator
-    background_clip = ffmpeg.drawtext(
-        background_clip,
-        text=text,
-        x=f"(w-text_w)",
-        y=f"(h-text_h)",
-        fontsize=5,
-        fontcolor="White",
-        fontfile=os.path.join("fonts", "Roboto-Regular.ttf"),
-    )
-    background_clip = background_clip.filter("scale", W, H)
+    def finish_frames(clip):
+        text = f" " #Removed mmention of bacground creator
+        clip = ffmpeg.drawtext(
+            clip,
+            text=text,
+            x=f"(w-text_w)",
+            y=f"(h-text_h)",
+            fontsize=5,
+            fontcolor="White",
+            fontfile=os.path.join("fonts", "Roboto-Regular.ttf"),
+        )
+        return clip.filter("scale", W, H)
+
+    output_args = encoder_args(encoder_profile(), threads=threads)
+    segments = int(settings.config["settings"]["pipeline"]["render_segments"])
+    ranges = split_timeline(overlays, length, segments) if segments > 1 else []
+    if len(ranges) > 1:
+        print_step(f"Rendering the video in {len(ranges)} parts 🎥")
+        video_path = render_segments(
+            background_path, overlays, ranges, screenshot_width, reddit_id, threads, finish_frames
+        )
+        # The renders below only add the audio to the joined parts
+        background_clip = ffmpeg.input(video_path)["v"]
+        output_args = mux_args(encoder_profile())
+    else:
+        background_clip = finish_frames(
+            overlay_clips(background_clip, overlays, screenshot_width, reddit_id)
+        )
     print_step("Rendering the video 🎥")
     from tqdm import tqdm
 
     pbar = tqdm(total=100, desc="Progress: ", bar_format="{l_bar}{bar}", unit=" %")
 
-    def on_update_example(progress) -> None:
-        status = round(progress * 100, 2)
+    def on_update_example(progress: RenderProgress) -> None:
+        status = round(progress.percent, 2)
         old_percentage = pbar.n
         pbar.update(status - old_percentage)
+        if progress.eta_s is not None:
+            pbar.set_postfix_str(
+                f"{progress.fps:.0f} fps, {progress.speed or 0:.2f}x, ETA {progress.eta_s:.0f}s"
+            )
 
     defaultPath = f"results/{subreddit}"
-    with ProgressFfmpeg(length, on_update_example) as progress:
-        path = defaultPath + f"/{filename}"
-        path = (
-            path[:251] + ".mp4"
-        )  # Prevent a error by limiting the path length, do not change this.
-        try:
+    path = defaultPath + f"/{filename}"
+    path = (
+        path[:251] + ".mp4"
+    )  # Prevent a error by limiting the path length, do not change this.
+    final_path = path
+    # Extra formats share the decode and the composition, each one only adds an encode
+    variants = output_variants()
+    audio_branches = final_audio.asplit() if variants else [final_audio]
+    if not variants:
+        video_branches = [background_clip]
+    elif output_args["c:v"] == "copy":
+        # The joined segments are copied as they are, a stream copy can't take a filtered stream
+        split = background_clip.split()
+        video_branches = [background_clip] + [split[i] for i in range(len(variants))]
+    else:
+        video_branches = background_clip.split()
+    outputs = [
+        ffmpeg.output(
+            video_branches[0],
+            audio_branches[0],
+            path,
+            f="mp4",
+            **output_args,
+        )
+    ]
+    for i, variant in enumerate(variants, start=1):
+        variant_path = f"{defaultPath}/{variant.name}/{filename}"[:251] + ".mp4"
+        os.makedirs(os.path.dirname(variant_path), exist_ok=True)
+        outputs.append(
             ffmpeg.output(
-                background_clip,
-                final_audio,
-                path,
+                fit_variant(video_branches[i], variant),
+                audio_branches[i],
+                variant_path,
                 f="mp4",
-                **{
-                    "c:v": "h264",
-                    "b:v": "20M",
-                    "b:a": "192k",
-                    "threads": multiprocessing.cpu_count(),
-                },
-            ).overwrite_output().global_args("-progress", progress.output_file.name).run(
-                quiet=True,
-                overwrite_output=True,
-                capture_stdout=False,
-                capture_stderr=False,
+                **encoder_args(encoder_profile(), threads=threads),
             )
-        except ffmpeg.Error as e:
-            print(e.stderr.decode("utf8"))
-            exit(1)
+        )
+    if variants:
+        print_substep(f"Also rendering {', '.join(variant.name for variant in variants)}")
+    try:
+        stderr = run_with_progress(
+            ffmpeg.merge_outputs(*outputs)
+            .overwrite_output()
+            .global_args(*benchmark_args()),
+            "render",
+            length,
+            on_update_example,
+            job=reddit_id,
+        )
+    except ffmpeg.Error as e:
+        print(e.stderr.decode("utf8"))
+        raise
+    record_ffmpeg("render", stderr)
     old_percentage = pbar.n
     pbar.update(100 - old_percentage)
     if allowOnlyTTSFolder:
@@ -457,34 +498,30 @@ def make_final_video(
             path[:251] + ".mp4"
         )  # Prevent a error by limiting the path length, do not change this.
         print_step("Rendering the Only TTS Video 🎥")
-        with ProgressFfmpeg(length, on_update_example) as progress:
-            try:
+        try:
+            stderr = run_with_progress(
                 ffmpeg.output(
                     background_clip,
                     audio,
                     path,
                     f="mp4",
-                    **{
-                        "c:v": "h264",
-                        "b:v": "20M",
-                        "b:a": "192k",
-                        "threads": multiprocessing.cpu_count(),
-                    },
-                ).overwrite_output().global_args("-progress", progress.output_file.name).run(
-                    quiet=True,
-                    overwrite_output=True,
-                    capture_stdout=False,
-                    capture_stderr=False,
+                    **output_args,
                 )
-            except ffmpeg.Error as e:
-                print(e.stderr.decode("utf8"))
-                exit(1)
+                .overwrite_output()
+                .global_args(*benchmark_args()),
+                "render_only_tts",
+                length,
+                on_update_example,
+                job=reddit_id,
+            )
+        except ffmpeg.Error as e:
+            print(e.stderr.decode("utf8"))
+            raise
+        record_ffmpeg("render_only_tts", stderr)
 
         old_percentage = pbar.n
         pbar.update(100 - old_percentage)
     pbar.close()
     save_data(subreddit, filename + ".mp4", title, idx, background_config["video"][2])
-    print_step("Removing temporary files 🗑")
-    cleanups = cleanup(reddit_id)
-    print_substep(f"Removed {cleanups} temporary files 🗑")
     print_step("Done! 🎉 The video is in the results folder 📁")
+    return final_path
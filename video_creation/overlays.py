@@ -0,0 +1,138 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+
+import ffmpeg
+from PIL import Image
+
+from utils import settings
+
+__all__ = [
+    "OverlayClip",
+    "overlay_clips",
+    "composite",
+    "overlay_chain",
+    "overlay_track",
+    "prepare_screenshots",
+]
+
+CENTER = {"x": "(main_w-overlay_w)/2", "y": "(main_h-overlay_h)/2"}
+
+
+class OverlayClip(NamedTuple):
+    """A screenshot shown over the background from start, for duration seconds."""
+
+    path: str
+    start: float
+    duration: float
+    opacity: float = 1.0
+
+
+def overlay_clips(background: ffmpeg, clips: List[OverlayClip], width: int, reddit_id: str):
+    """Composites the screenshots over the background, centered and scaled to width.
+
+    The screenshots are first scaled and faded by prepare_screenshots. Then
+    settings.pipeline.overlay_mode picks how: "track" turns them into a single image stream and
+    uses one overlay filter, "chain" adds an overlay filter per screenshot. Each filter of the
+    chain runs on every frame, so the chain gets slower with every comment.
+    """
+    return composite(background, prepare_screenshots(clips, width, reddit_id), reddit_id)
+
+
+def composite(background: ffmpeg, clips: List[OverlayClip], reddit_id: str, name: str = "track"):
+    """Composites screenshots prepared by prepare_screenshots over the background.
+
+    Args:
+        name (str): Prefix of the files of the overlay track, unique per graph
+    """
+    if settings.config["settings"]["pipeline"]["overlay_mode"] == "chain":
+        return overlay_chain(background, clips)
+    return background.overlay(overlay_track(clips, reddit_id, name), **CENTER)
+
+
+def _scale_and_fade(path: str, opacity: float, width: int, output: Path) -> None:
+    image = Image.open(path).convert("RGBA")
+    image = image.resize((width, max(1, round(image.height * width / image.width))))
+    if opacity != 1:
+        image.putalpha(image.getchannel("A").point(lambda alpha: round(alpha * opacity)))
+    # The PNGs are read once by ffmpeg, writing them fast beats writing them small
+    image.save(output, compress_level=1)
+
+
+def prepare_screenshots(clips: List[OverlayClip], width: int, reddit_id: str) -> List[OverlayClip]:
+    """Scales the screenshots to width and bakes their opacity into the alpha channel, once and
+    in parallel, so ffmpeg doesn't scale and fade them on every frame.
+
+    Screenshots are taken at a device scale factor of W//600+1, much larger than they are shown.
+
+    Returns:
+        list[OverlayClip]: The clips with the prepared images in assets/temp/<id>/png/overlay,
+            at full opacity
+    """
+    directory = Path(f"assets/temp/{reddit_id}/png/overlay")
+    directory.mkdir(parents=True, exist_ok=True)
+    # A screenshot shown several times at the same opacity is prepared once
+    outputs: Dict[Tuple[str, float], Path] = {}
+    for clip in clips:
+        key = (clip.path, clip.opacity)
+        if key not in outputs:
+            outputs[key] = directory / f"{Path(clip.path).stem}_{round(clip.opacity * 100)}.png"
+    # PIL releases the GIL while resizing and encoding
+    with ThreadPoolExecutor(min(len(outputs), os.cpu_count() or 1) or 1) as executor:
+        futures = [
+            executor.submit(_scale_and_fade, path, opacity, width, output)
+            for (path, opacity), output in outputs.items()
+        ]
+    for future in futures:
+        future.result()  # raises the error of a failed screenshot
+    return [
+        clip._replace(path=str(outputs[(clip.path, clip.opacity)]), opacity=1.0) for clip in clips
+    ]
+
+
+def overlay_chain(background: ffmpeg, clips: List[OverlayClip]):
+    for clip in clips:
+        image = ffmpeg.input(clip.path)["v"]
+        background = background.overlay(
+            image, enable=f"between(t,{clip.start},{clip.start + clip.duration})", **CENTER
+        )
+    return background
+
+
+def overlay_track(clips: List[OverlayClip], reddit_id: str, name: str = "track"):
+    """Turns the prepared screenshots into one timed image stream, read by ffmpeg's concat
+    demuxer.
+
+    The screenshots are centered on transparent canvases of the same size, so the stream keeps
+    one resolution and the overlay stays centered. Gaps and the time after the last screenshot
+    show a blank canvas.
+
+    Returns:
+        The input stream of assets/temp/<id>/<name>.ffconcat
+    """
+    directory = Path(f"assets/temp/{reddit_id}")
+    images = [Image.open(clip.path) for clip in clips]
+    width = max((image.width for image in images), default=1)
+    height = max((image.height for image in images), default=1)
+
+    def canvas(image: Image.Image = None) -> Image.Image:
+        frame = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        if image is not None:
+            frame.paste(image, ((width - image.width) // 2, (height - image.height) // 2))
+        return frame
+
+    blank = f"png/{name}_blank.png"
+    canvas().save(directory / blank, compress_level=1)
+    lines = ["ffconcat version 1.0"]
+    time = 0.0
+    for i, (clip, image) in enumerate(zip(clips, images)):
+        if clip.start > time:
+            lines += [f"file '{blank}'", f"duration {clip.start - time:.3f}"]
+        canvas(image).save(directory / f"png/{name}_{i}.png", compress_level=1)
+        lines += [f"file 'png/{name}_{i}.png'", f"duration {clip.duration:.3f}"]
+        time = clip.start + clip.duration
+    # The duration of the last entry is only used if a file follows it
+    lines += [f"file '{blank}'", "duration 1", f"file '{blank}'"]
+    (directory / f"{name}.ffconcat").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return ffmpeg.input(str(directory / f"{name}.ffconcat"), f="concat", safe=0)["v"]
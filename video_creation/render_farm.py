@@ -0,0 +1,172 @@
+import multiprocessing
+import os
+import re
+import threading
+import time
+import traceback
+from typing import Dict
+
+from utils import settings
+from utils.console import print_step, print_substep
+from utils.ffmpeg_progress import StatusFile, subscribe
+from utils.manifest import JobManifest
+from utils.metrics import JobMetrics
+from utils.render_queue import DEFAULT_QUEUE_PATH, HEARTBEAT_S, RenderQueue
+
+__all__ = ["enqueue_render", "run_render_farm"]
+
+
+def enqueue_render(
+    number_of_clips: int,
+    length: int,
+    reddit_obj: dict,
+    background_choice: Dict[str, str],
+    queue_path: str = DEFAULT_QUEUE_PATH,
+) -> None:
+    """Queues the render of a prepared video instead of rendering it in this process.
+
+    Args:
+        number_of_clips (int): Index to end at when going through the screenshots
+        length (int): Length of the video
+        reddit_obj (dict): The reddit object that contains the posts to read.
+        background_choice (Dict[str, str]): Names of the video and audio backgrounds used
+    """
+    reddit_id = reddit_obj["thread_id"]
+    payload = {
+        "number_of_clips": number_of_clips,
+        "length": length,
+        "reddit_obj": reddit_obj,
+        "background_choice": background_choice,
+    }
+    if RenderQueue(queue_path).enqueue(reddit_id, payload) is None:
+        print_substep(f"Thread {reddit_id} is already waiting to be rendered.", style="bold blue")
+    else:
+        print_substep(f"Queued the render of thread {reddit_id} 📥", style="bold green")
+
+
+def _render_job(payload: dict, threads: int) -> None:
+    # Imported here so the parent process doesn't need the render dependencies loaded
+    from video_creation.background import get_background_config
+    from video_creation.final_video import make_final_video
+
+    reddit_id = re.sub(r"[^\w\s-]", "", payload["reddit_obj"]["thread_id"])
+    metrics = JobMetrics()
+    metrics.job.update(reddit_id=reddit_id, worker=os.getpid(), threads=threads)
+    background_choice = payload["background_choice"]
+    background_config = {
+        mode: get_background_config(mode, background_choice[mode]) for mode in ("video", "audio")
+    }
+    try:
+        with metrics.stage("render"):
+            final_path = make_final_video(
+                payload["number_of_clips"],
+                payload["length"],
+                payload["reddit_obj"],
+                background_config,
+                threads=threads,
+            )
+        with metrics.stage("cleanup"):
+            JobManifest(reddit_id).finish(final_path)
+    except BaseException as err:
+        metrics.write(status="failed", error=repr(err))
+        raise
+    metrics.write(status="ok", output=final_path)
+
+
+def _heartbeat(queue: RenderQueue, job_id: int, done: threading.Event) -> None:
+    while not done.wait(HEARTBEAT_S):
+        queue.heartbeat(job_id)
+
+
+def _requeue_stale(queue: RenderQueue) -> int:
+    """Requeues the jobs of dead workers, see RenderQueue.requeue_stale. Returns how many."""
+    max_attempts = int(settings.config["settings"]["pipeline"]["render_max_attempts"])
+    requeued, failed = queue.requeue_stale(max_attempts)
+    if requeued:
+        print_substep(f"Requeued {requeued} render job(s) of dead workers.", style="bold blue")
+    if failed:
+        print_substep(
+            f"Gave up on {failed} render job(s) that killed their worker {max_attempts} times.",
+            style="bold red",
+        )
+    return requeued
+
+
+def _worker(queue_path: str, config: dict, threads: int, drain: bool, poll_interval: float):
+    settings.config = config
+    # Each worker reports its renders in its own status file, for the GUI
+    subscribe(StatusFile())
+    queue = RenderQueue(queue_path)
+    worker = f"{os.getpid()}"
+    while True:
+        job = queue.claim(worker)
+        if job is None:
+            # Workers of other hosts may have died meanwhile
+            if _requeue_stale(queue):
+                continue
+            if drain:
+                return
+            time.sleep(poll_interval)
+            continue
+        job_id, payload = job
+        print_step(f"Worker {worker} rendering thread {payload['reddit_obj']['thread_id']} 🎥")
+        done = threading.Event()
+        threading.Thread(
+            target=_heartbeat, args=(queue, job_id, done), name="heartbeat", daemon=True
+        ).start()
+        try:
+            _render_job(payload, threads)
+        except KeyboardInterrupt:
+            queue.fail(job_id, "interrupted")
+            raise
+        except BaseException:  # make_final_video exits on ffmpeg errors
+            queue.fail(job_id, traceback.format_exc())
+            print_substep(f"Job {job_id} failed, see the render queue for the traceback.", "red")
+        else:
+            queue.complete(job_id)
+        finally:
+            done.set()
+
+
+def run_render_farm(
+    workers: int = 2,
+    threads: int = 0,
+    drain: bool = False,
+    poll_interval: float = 5,
+    queue_path: str = DEFAULT_QUEUE_PATH,
+) -> None:
+    """Renders queued jobs with several ffmpeg processes at once.
+
+    x264 scales poorly past a few threads at 1080x1920, so several encodes with a fixed thread
+    budget each get more videos per hour out of a many-core machine than one encode using
+    every core.
+
+    Args:
+        workers (int): Number of worker processes.
+        threads (int): ffmpeg threads per worker, 0 splits the CPUs evenly between workers.
+        drain (bool): Exit once the queue is empty instead of waiting for new jobs.
+        poll_interval (float): Seconds between polls of an empty queue.
+    """
+    workers = max(1, workers)
+    threads = threads or max(1, multiprocessing.cpu_count() // workers)
+    _requeue_stale(RenderQueue(queue_path))
+    print_step(f"Starting {workers} render worker(s) with {threads} ffmpeg thread(s) each")
+
+    processes = [
+        multiprocessing.Process(
+            target=_worker,
+            args=(queue_path, settings.config, threads, drain, poll_interval),
+            name=f"render-worker-{i}",
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        raise
+    print_substep(f"Render queue: {RenderQueue(queue_path).counts()}", style="bold green")
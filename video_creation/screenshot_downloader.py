@@ -3,17 +3,19 @@ import re
 from pathlib import Path
 from typing import Dict, Final
 
-import translators
-from playwright.sync_api import ViewportSize, sync_playwright
-from rich.progress import track
+from playwright.sync_api import ViewportSize
 
 from utils import settings
-from utils.console import print_step, print_substep
+from utils.console import print_step, print_substep, track
 from utils.imagenarator import imagemaker
-from utils.playwright import clear_cookie_by_name
+from utils.playwright import clear_cookie_by_name, with_browser
 from utils.videos import save_data
 
-__all__ = ["get_screenshots_of_reddit_posts"]
+__all__ = ["ScreenshotError", "get_screenshots_of_reddit_posts"]
+
+
+class ScreenshotError(Exception):
+    pass
 
 
 def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
@@ -24,9 +26,6 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
         screenshot_num (int): Number of screenshots to download
     """
     # settings values
-    W: Final[int] = int(settings.config["settings"]["resolution_w"])
-    H: Final[int] = int(settings.config["settings"]["resolution_h"])
-    lang: Final[str] = settings.config["reddit"]["thread"]["post_lang"]
     storymode: Final[bool] = settings.config["settings"]["storymode"]
 
     print_step("Downloading screenshots of reddit posts...")
@@ -70,65 +69,86 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
         )
 
     screenshot_num: int
-    with sync_playwright() as p:
-        print_substep("Launching Headless Browser...")
-
-        browser = p.chromium.launch(
-            headless=True
-        )  # headless=False will show the browser for debugging purposes
-        # Device scale factor (or dsf for short) allows us to increase the resolution of the screenshots
-        # When the dsf is 1, the width of the screenshot is 600 pixels
-        # so we need a dsf such that the width of the screenshot is greater than the final resolution of the video
-        dsf = (W // 600) + 1
-
-        context = browser.new_context(
-            locale=lang or "en-us",
-            color_scheme="dark",
-            viewport=ViewportSize(width=W, height=H),
-            device_scale_factor=dsf,
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
-        )
-        cookies = json.load(cookie_file)
-        cookie_file.close()
+    cookies = json.load(cookie_file)
+    cookie_file.close()
+    with_browser(_capture, reddit_object, screenshot_num, cookies)
 
-        context.add_cookies(cookies)  # load preference cookies
+    print_substep("Screenshots downloaded Successfully.", style="bold green")
 
-        # Login to Reddit
-        print_substep("Logging in to Reddit...")
-        page = context.new_page()
-        page.goto("https://www.reddit.com/login", timeout=0)
-        page.set_viewport_size(ViewportSize(width=1920, height=1080))
-        page.wait_for_load_state()
 
-        page.locator(f'input[name="username"]').fill(settings.config["reddit"]["creds"]["username"])
-        page.locator(f'input[name="password"]').fill(settings.config["reddit"]["creds"]["password"])
-        page.get_by_role("button", name="Log In").click()
-        page.wait_for_timeout(5000)
+def log_in(page, context) -> None:
+    """Logs in to Reddit with the credentials of config.toml.
 
-        login_error_div = page.locator(".AnimatedForm__errorMessage").first
-        if login_error_div.is_visible():
-            login_error_message = login_error_div.inner_text()
-            if login_error_message.strip() == "":
-                # The div element is empty, no error
-                pass
-            else:
-                # The div contains an error message
-                print_substep(
-                    "Your reddit credentials are incorrect! Please modify them accordingly in the config.toml file.",
-                    style="red",
-                )
-                exit()
-        else:
+    Raises:
+        ScreenshotError: If Reddit refused the credentials
+    """
+    print_substep("Logging in to Reddit...")
+    page.goto("https://www.reddit.com/login", timeout=0)
+    page.set_viewport_size(ViewportSize(width=1920, height=1080))
+    page.wait_for_load_state()
+
+    page.locator(f'input[name="username"]').fill(settings.config["reddit"]["creds"]["username"])
+    page.locator(f'input[name="password"]').fill(settings.config["reddit"]["creds"]["password"])
+    page.get_by_role("button", name="Log In").click()
+    page.wait_for_timeout(5000)
+
+    login_error_div = page.locator(".AnimatedForm__errorMessage").first
+    if login_error_div.is_visible():
+        login_error_message = login_error_div.inner_text()
+        if login_error_message.strip() == "":
+            # The div element is empty, no error
             pass
+        else:
+            # The div contains an error message
+            raise ScreenshotError(
+                "Your reddit credentials are incorrect! Please modify them accordingly in the "
+                "config.toml file."
+            )
+    else:
+        pass
 
-        page.wait_for_load_state()
-        # Handle the redesign
-        # Check if the redesign optout cookie is set
-        if page.locator("#redesign-beta-optin-btn").is_visible():
-            # Clear the redesign optout cookie
-            clear_cookie_by_name(context, "redesign_optout")
-            # Reload the page for the redesign to take effect
-            page.reload()
+    page.wait_for_load_state()
+    # Handle the redesign
+    # Check if the redesign optout cookie is set
+    if page.locator("#redesign-beta-optin-btn").is_visible():
+        # Clear the redesign optout cookie
+        clear_cookie_by_name(context, "redesign_optout")
+        # Reload the page for the redesign to take effect
+        page.reload()
+
+
+def _capture(browser, warm, reddit_object: dict, screenshot_num: int, cookies: list):
+    """Takes the screenshots in a new context of the browser, see with_browser."""
+    W: Final[int] = int(settings.config["settings"]["resolution_w"])
+    H: Final[int] = int(settings.config["settings"]["resolution_h"])
+    lang: Final[str] = settings.config["reddit"]["thread"]["post_lang"]
+    storymode: Final[bool] = settings.config["settings"]["storymode"]
+    reddit_id = re.sub(r"[^\w\s-]", "", reddit_object["thread_id"])
+
+    # Device scale factor (or dsf for short) allows us to increase the resolution of the screenshots
+    # When the dsf is 1, the width of the screenshot is 600 pixels
+    # so we need a dsf such that the width of the screenshot is greater than the final resolution of the video
+    dsf = (W // 600) + 1
+
+    # A warm browser remembers the login of an earlier video
+    login_state = warm.login_state if warm is not None else None
+    context = browser.new_context(
+        storage_state=login_state,
+        locale=lang or "en-us",
+        color_scheme="dark",
+        viewport=ViewportSize(width=W, height=H),
+        device_scale_factor=dsf,
+        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+    )
+
+    context.add_cookies(cookies)  # load preference cookies
+
+    try:
+        page = context.new_page()
+        if login_state is None:
+            log_in(page, context)
+            if warm is not None:
+                warm.login_state = context.storage_state()
         # Get the thread screenshot
         page.goto(reddit_object["thread_url"], timeout=0)
         page.set_viewport_size(ViewportSize(width=W, height=H))
@@ -156,6 +176,8 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
 
         if lang:
             print_substep("Translating post...")
+            import translators  # slow to import, only needed for post_lang
+
             texts_in_tl = translators.translate_text(
                 reddit_object["thread_title"],
                 to_language=lang,
@@ -184,23 +206,12 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
             else:
                 page.locator('[data-test-id="post-content"]').screenshot(path=postcontentpath)
         except Exception as e:
-            print_substep("Something went wrong!", style="red")
-            resp = input(
-                "Something went wrong with making the screenshots! Do you want to skip the post? (y/n) "
-            )
-
-            if resp.casefold().startswith("y"):
-                save_data("", "", "skipped", reddit_id, "")
-                print_substep(
-                    "The post is successfully skipped! You can now restart the program and this post will skipped.",
-                    "green",
-                )
-
-            resp = input("Do you want the error traceback for debugging purposes? (y/n)")
-            if not resp.casefold().startswith("y"):
-                exit()
-
-            raise e
+            # No prompt here: the screenshots run in a stage thread, alongside other videos
+            save_data("", "", "skipped", reddit_id, "")
+            raise ScreenshotError(
+                f"Something went wrong with making the screenshots of {reddit_id}! The post is "
+                "skipped from now on."
+            ) from e
 
         if storymode:
             page.locator('[data-click-id="text"]').first.screenshot(
@@ -225,6 +236,8 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
                 # translate code
 
                 if settings.config["reddit"]["thread"]["post_lang"]:
+                    import translators
+
                     comment_tl = translators.translate_text(
                         comment["comment_body"],
                         translator="google",
@@ -259,8 +272,5 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
                     screenshot_num += 1
                     print("TimeoutError: Skipping screenshot...")
                     continue
-
-        # close browser instance when we are done using it
-        browser.close()
-
-    print_substep("Screenshots downloaded Successfully.", style="bold green")
+    finally:
+        context.close()
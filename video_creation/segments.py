@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+import ffmpeg
+
+from utils.console import print_substep
+from utils.encoding import encoder_args, encoder_profile
+from utils.ffmpeg_progress import run_ffmpeg
+from utils.profiling import benchmark_args, record_ffmpeg
+from video_creation.overlays import OverlayClip, composite, prepare_screenshots
+
+__all__ = ["split_timeline", "render_segments"]
+
+
+def split_timeline(
+    clips: List[OverlayClip], length: float, segments: int
+) -> List[Tuple[float, float]]:
+    """Splits the video into up to `segments` parts of about the same length, cut where one
+    screenshot ends and the next one starts, so no screenshot spans two parts.
+
+    Returns:
+        list[tuple[float, float]]: The start and end of every part
+    """
+    boundaries = {clip.start for clip in clips} | {clip.start + clip.duration for clip in clips}
+    boundaries = sorted(time for time in boundaries if 0 < time < length)
+    cuts = []
+    for k in range(1, segments):
+        target = k * length / segments
+        later = [time for time in boundaries if not cuts or time > cuts[-1]]
+        if later:
+            cuts.append(min(later, key=lambda time: abs(time - target)))
+    starts = [0.0] + sorted(set(cuts))
+    return list(zip(starts, starts[1:] + [float(length)]))
+
+
+def _frame_rate(path: str) -> Fraction:
+    stream = ffmpeg.probe(path, select_streams="v:0")["streams"][0]
+    return Fraction(stream["r_frame_rate"])
+
+
+def _clips_within(clips: List[OverlayClip], start: float, end: float) -> List[OverlayClip]:
+    """The part of every clip shown between start and end, timed from start."""
+    within = []
+    for clip in clips:
+        shown_from, shown_to = max(clip.start, start), min(clip.start + clip.duration, end)
+        if shown_to > shown_from:
+            within.append(clip._replace(start=shown_from - start, duration=shown_to - shown_from))
+    return within
+
+
+def render_segments(
+    background_path: str,
+    clips: List[OverlayClip],
+    ranges: List[Tuple[float, float]],
+    width: int,
+    reddit_id: str,
+    threads: int,
+    finish: Callable,
+) -> str:
+    """Renders the parts of the video in parallel ffmpeg processes and joins them.
+
+    Every part encodes its slice of the background with its screenshots, with the same encoder
+    profile, so the concat demuxer can join them without encoding again. The audio is left out,
+    it is muxed once over the whole video.
+
+    Args:
+        background_path (str): The cropped background, from prepare_background
+        clips (list[OverlayClip]): The screenshots over the whole video
+        ranges (list[tuple[float, float]]): The parts, from split_timeline
+        width (int): Width of the screenshots
+        reddit_id (str): The sanitized reddit id of the video
+        threads (int): ffmpeg threads, split between the parts
+        finish (Callable): Filters applied to every part after the screenshots, e.g. the scale
+
+    Returns:
+        str: Path of the joined video, without audio
+    """
+    directory = Path(f"assets/temp/{reddit_id}/segments")
+    directory.mkdir(parents=True, exist_ok=True)
+    clips = prepare_screenshots(clips, width, reddit_id)
+    # Cut on whole frames, so the parts add up to the length of the background
+    frame = 1 / _frame_rate(background_path)
+    ranges = [
+        (float(round(start / frame) * frame), float(round(end / frame) * frame))
+        for start, end in ranges
+    ]
+    profile = encoder_profile()
+    per_segment = max(1, threads // len(ranges))
+
+    def render(index: int) -> str:
+        start, end = ranges[index]
+        last = index == len(ranges) - 1
+        background = ffmpeg.input(
+            background_path, ss=start, **({} if last else {"t": end - start})
+        )
+        video = finish(
+            composite(
+                background, _clips_within(clips, start, end), reddit_id, name=f"segment{index}"
+            )
+        )
+        output = directory / f"{index}.mp4"
+        _, stderr = run_ffmpeg(
+            ffmpeg.output(
+                video, str(output), an=None, **encoder_args(profile, per_segment, audio=False)
+            )
+            .overwrite_output()
+            .global_args(*benchmark_args()),
+            quiet=True,
+        )
+        record_ffmpeg(f"render_segment_{index}", stderr)
+        print_substep(f"Rendered part {index + 1} of {len(ranges)}")
+        return output.name
+
+    try:
+        with ThreadPoolExecutor(len(ranges), thread_name_prefix="segment") as executor:
+            parts = list(executor.map(render, range(len(ranges))))
+    except ffmpeg.Error as e:
+        print(e.stderr.decode("utf8"))
+        raise
+
+    playlist = directory / "segments.ffconcat"
+    playlist.write_text(
+        "ffconcat version 1.0\n" + "".join(f"file '{part}'\n" for part in parts),
+        encoding="utf-8",
+    )
+    joined = f"assets/temp/{reddit_id}/video.mp4"
+    _, stderr = run_ffmpeg(
+        ffmpeg.input(str(playlist), f="concat", safe=0)
+        .output(joined, c="copy")
+        .overwrite_output()
+        .global_args(*benchmark_args()),
+        quiet=True,
+    )
+    record_ffmpeg("concat_segments", stderr)
+    return joined
@@ -0,0 +1,48 @@
+import re
+from typing import List, NamedTuple
+
+from utils import settings
+
+__all__ = ["OutputVariant", "output_variants", "fit_variant"]
+
+_VARIANT = re.compile(r"^(\d+)x(\d+)(?::(crop|pad))?$")
+
+
+class OutputVariant(NamedTuple):
+    """An extra format of the video, rendered next to resolution_w x resolution_h."""
+
+    width: int
+    height: int
+    fit: str = "crop"  # "crop" fills the frame, "pad" shows all of it with bars
+
+    @property
+    def name(self) -> str:
+        return f"{self.width}x{self.height}"
+
+
+def output_variants() -> List[OutputVariant]:
+    """The formats of settings.encoding.variants, e.g. "1080x1080,1920x1080:pad"."""
+    variants = []
+    for value in str(settings.config["settings"]["encoding"]["variants"]).split(","):
+        match = _VARIANT.match(value.strip().lower())
+        if match:
+            width, height, fit = match.groups()
+            variants.append(OutputVariant(int(width), int(height), fit or "crop"))
+    return variants
+
+
+def fit_variant(stream, variant: OutputVariant):
+    """Crops or pads the composed video to the aspect of the variant and scales it to its size.
+
+    Both keep the center, where the screenshots are.
+    """
+    width, height = variant.width, variant.height
+    if variant.fit == "pad":
+        stream = stream.filter(
+            "scale", width, height, force_original_aspect_ratio="decrease"
+        ).filter("pad", width, height, "(ow-iw)/2", "(oh-ih)/2")
+    else:
+        stream = stream.filter(
+            "crop", f"min(iw,ih*{width}/{height})", f"min(ih,iw*{height}/{width})"
+        ).filter("scale", width, height)
+    return stream.filter("setsar", 1)
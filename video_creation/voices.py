@@ -1,34 +1,33 @@
+import importlib
 from typing import Tuple
 
 from rich.console import Console
 
-from TTS.aws_polly import AWSPolly
-from TTS.elevenlabs import elevenlabs
-from TTS.engine_wrapper import TTSEngine
-from TTS.GTTS import GTTS
-from TTS.pyttsx import pyttsx
-from TTS.streamlabs_polly import StreamlabsPolly
-from TTS.TikTok import TikTok
+from TTS.engine_wrapper import DEFAULT_MAX_LENGTH, TTSEngine
 from utils import settings
 from utils.console import print_step, print_table
 
 console = Console()
 
+# module.Class of each provider, imported once chosen: their SDKs (boto3, elevenlabs, pyttsx3...)
+# take a while to import and only one of them is used
 TTSProviders = {
-    "GoogleTranslate": GTTS,
-    "AWSPolly": AWSPolly,
-    "StreamlabsPolly": StreamlabsPolly,
-    "TikTok": TikTok,
-    "pyttsx": pyttsx,
-    "ElevenLabs": elevenlabs,
+    "GoogleTranslate": "TTS.GTTS.GTTS",
+    "AWSPolly": "TTS.aws_polly.AWSPolly",
+    "StreamlabsPolly": "TTS.streamlabs_polly.StreamlabsPolly",
+    "TikTok": "TTS.TikTok.TikTok",
+    "pyttsx": "TTS.pyttsx.pyttsx",
+    "ElevenLabs": "TTS.elevenlabs.elevenlabs",
+    "Stub": "TTS.stub.StubTTS",  # offline, for benchmark.py
 }
 
 
-def save_text_to_mp3(reddit_obj) -> Tuple[int, int]:
+def save_text_to_mp3(reddit_obj, max_length: int = DEFAULT_MAX_LENGTH) -> Tuple[int, int]:
     """Saves text to MP3 files.
 
     Args:
         reddit_obj (): Reddit object received from reddit API in reddit/subreddit.py
+        max_length (int, optional): Stop adding comments once the audio is longer than this
 
     Returns:
         tuple[int,int]: (total length of the audio, the number of comments audio was generated for)
@@ -36,7 +35,7 @@ def save_text_to_mp3(reddit_obj) -> Tuple[int, int]:
 
     voice = settings.config["settings"]["tts"]["voice_choice"]
     if str(voice).casefold() in map(lambda _: _.casefold(), TTSProviders):
-        text_to_mp3 = TTSEngine(get_case_insensitive_key_value(TTSProviders, voice), reddit_obj)
+        provider = get_case_insensitive_key_value(TTSProviders, voice)
     else:
         while True:
             print_step("Please choose one of the following TTS providers: ")
@@ -45,8 +44,14 @@ def save_text_to_mp3(reddit_obj) -> Tuple[int, int]:
             if choice.casefold() in map(lambda _: _.casefold(), TTSProviders):
                 break
             print("Unknown Choice")
-        text_to_mp3 = TTSEngine(get_case_insensitive_key_value(TTSProviders, choice), reddit_obj)
-    return text_to_mp3.run()
+        provider = get_case_insensitive_key_value(TTSProviders, choice)
+    return TTSEngine(load_provider(provider), reddit_obj, max_length=max_length).run()
+
+
+def load_provider(path: str):
+    """Imports a provider class given as module.Class, see TTSProviders"""
+    module, _, name = path.rpartition(".")
+    return getattr(importlib.import_module(module), name)
 
 
 def get_case_insensitive_key_value(input_dict, key):